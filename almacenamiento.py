@@ -0,0 +1,480 @@
+"""
+Almacenamiento
+
+Capa de persistencia de la API. Define la interfaz de los repositorios
+de usuarios y tweets y un motor embebido en SQLite (modo WAL) en el que
+cada escritura toca solo el registro afectado, en lugar de reescribir
+el archivo completo.
+
+Todas las escrituras pasan por un solo hilo escritor que las agrupa en
+lotes: cada lote es una transacción con un solo fsync (group commit) y
+cada petición se confirma cuando su lote ya es durable.
+
+Con varios procesos sobre la misma base (uvicorn --workers N) o con
+instantáneas (ver instantaneas.py) cada escritura deja además una fila
+en la tabla `cambios`, dentro de la misma transacción, para que los
+demás procesos sepan qué registros releer y para reproducir al arrancar
+lo escrito después de la última instantánea.
+"""
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import json, queue, sqlite3, threading, time, warnings
+import metricas
+
+Registro = Dict[str, Any]
+
+
+class RegistroDuplicado(Exception):
+    """Ya existe un registro con la misma llave"""
+
+
+def serializar(registro: Registro) -> str:
+    # Las fechas se guardan como texto, igual que en los archivos JSON originales
+    return json.dumps(registro, default=str)
+
+
+# Interfaz
+
+class Repositorio(ABC):
+    """Colección de registros identificados por una llave primaria"""
+
+    llave: str
+
+    @abstractmethod
+    def obtener(self, id_registro: str) -> Optional[Registro]:
+        """Regresa el registro con la llave indicada o None"""
+
+    def obtener_varios(self, ids: Iterable[str]) -> Dict[str, Registro]:
+        """Regresa {id: registro} de los ids que existan"""
+        encontrados = ((id_registro, self.obtener(id_registro)) for id_registro in ids)
+        return {id_registro: registro for id_registro, registro in encontrados if registro is not None}
+
+    @abstractmethod
+    def listar(self) -> Iterator[Registro]:
+        """Recorre todos los registros en orden de inserción"""
+
+    @abstractmethod
+    def insertar(self, registro: Registro) -> None:
+        """Agrega un registro nuevo, RegistroDuplicado si la llave ya existe"""
+
+    @abstractmethod
+    def reemplazar(self, id_registro: str, registro: Registro) -> bool:
+        """Reemplaza un registro existente, False si no existe"""
+
+    @abstractmethod
+    def borrar(self, id_registro: str) -> Optional[Registro]:
+        """Borra un registro y lo regresa, None si no existe"""
+
+    @abstractmethod
+    def contar(self) -> int:
+        """Número de registros"""
+
+    # Las versiones encolar_* regresan un Future que se resuelve cuando la
+    # escritura es durable. Por defecto se ejecutan de forma síncrona.
+
+    def encolar_insertar(self, registro: Registro) -> Future:
+        return _completado(self.insertar, registro)
+
+    def encolar_reemplazar(self, id_registro: str, registro: Registro,
+                           adicional: Optional['Operacion'] = None) -> Future:
+        """
+        `adicional` es otra escritura que debe quedar en la misma
+        transacción (solo la aceptan los repositorios de AlmacenSQLite)
+        """
+        if adicional is not None:
+            raise NotImplementedError('Este repositorio no admite escrituras adicionales')
+        return _completado(self.reemplazar, id_registro, registro)
+
+    def encolar_borrar(self, id_registro: str) -> Future:
+        return _completado(self.borrar, id_registro)
+
+    def encolar_actualizar_si(self, id_registro: str, cambios: Registro, condicion: str,
+                              parametros: Tuple = ()) -> Future:
+        """
+        Cambia los campos de `cambios` solo si el registro cumple
+        `condicion`, una expresión SQL sobre la columna `datos` que se evalúa
+        en la misma sentencia (solo la aceptan los repositorios de
+        AlmacenSQLite). El Future regresa el registro nuevo, o None si no
+        existe o no cumple la condición.
+        """
+        raise NotImplementedError('Este repositorio no admite escrituras condicionales')
+
+    def encolar_insertar_varios(self, registros: List[Registro]) -> Future:
+        """
+        Inserta varios registros en una sola transacción. El Future regresa
+        una lista con None o el error (RegistroDuplicado) de cada registro.
+        """
+        def insertar_varios() -> List[Optional[Exception]]:
+            errores: List[Optional[Exception]] = []
+            for registro in registros:
+                try:
+                    self.insertar(registro)
+                    errores.append(None)
+                except RegistroDuplicado as error:
+                    errores.append(error)
+            return errores
+        return _completado(insertar_varios)
+
+
+def _completado(funcion, *argumentos) -> Future:
+    futuro = Future()
+    try:
+        futuro.set_result(funcion(*argumentos))
+    except Exception as error:
+        futuro.set_exception(error)
+    return futuro
+
+
+# Escritor con group commit
+
+Operacion = Callable[[sqlite3.Connection], Any]
+
+
+class EscritorEnGrupo:
+    """
+    Hilo único que aplica las escrituras pendientes en lotes.
+
+    Cada operación corre dentro de un SAVEPOINT, así que un error en una
+    (p. ej. una llave duplicada) no tira el resto del lote. El lote se
+    confirma con un solo COMMIT y después se resuelven los futures.
+    """
+
+    def __init__(self, ruta: str, max_lote: int = 512) -> None:
+        self.ruta = ruta
+        self.max_lote = max_lote
+        self._cola: 'queue.Queue[Optional[Tuple[Future, Operacion]]]' = queue.Queue()
+        self._hilo = threading.Thread(target=self._ciclo, name='escritor-sqlite', daemon=True)
+        self._hilo.start()
+
+    def encolar(self, operacion: Operacion) -> Future:
+        futuro = Future()
+        self._cola.put((futuro, operacion))
+        return futuro
+
+    def cerrar(self) -> None:
+        """Aplica lo pendiente y detiene el hilo"""
+        self._cola.put(None)
+        self._hilo.join()
+
+    def _ciclo(self) -> None:
+        conexion = sqlite3.connect(self.ruta, timeout=30, isolation_level=None)
+        conexion.execute('PRAGMA synchronous=FULL')
+        terminar = False
+        while not terminar:
+            lote: List[Tuple[Future, Operacion]] = []
+            pendiente = self._cola.get()
+            while pendiente is not None:
+                lote.append(pendiente)
+                if len(lote) >= self.max_lote:
+                    break
+                try:
+                    pendiente = self._cola.get_nowait()
+                except queue.Empty:
+                    break
+            terminar = pendiente is None
+            if lote:
+                self._aplicar(conexion, lote)
+        conexion.close()
+
+    def _aplicar(self, conexion: sqlite3.Connection, lote: List[Tuple[Future, Operacion]]) -> None:
+        metricas.tamano_lote.observar(len(lote))
+        with metricas.latencia_commit.medir():
+            self._transaccion(conexion, lote)
+
+    def _transaccion(self, conexion: sqlite3.Connection, lote: List[Tuple[Future, Operacion]]) -> None:
+        resultados = []
+        try:
+            conexion.execute('BEGIN IMMEDIATE')
+            for futuro, operacion in lote:
+                conexion.execute('SAVEPOINT operacion')
+                try:
+                    resultados.append((futuro, operacion(conexion), None))
+                except Exception as error:
+                    conexion.execute('ROLLBACK TO operacion')
+                    resultados.append((futuro, None, error))
+                conexion.execute('RELEASE operacion')
+            conexion.execute('COMMIT')
+        except Exception as error:
+            if conexion.in_transaction:
+                conexion.execute('ROLLBACK')
+            for futuro, _ in lote:
+                futuro.set_exception(error)
+            return
+
+        for futuro, resultado, error in resultados:
+            if error is None:
+                futuro.set_result(resultado)
+            else:
+                futuro.set_exception(error)
+
+
+# Motor SQLite
+
+class AlmacenSQLite:
+    """
+    Base de datos SQLite en modo WAL compartida por los repositorios.
+
+    Cada hilo usa su propia conexión para leer, de modo que las lecturas
+    no se bloquean con las escrituras, que van todas al EscritorEnGrupo.
+    """
+
+    def __init__(self, ruta: str, registrar_cambios: bool = False) -> None:
+        self.ruta = ruta
+        self.registrar_cambios = registrar_cambios
+        self._local = threading.local()
+        self.conexion().execute('PRAGMA journal_mode=WAL')
+        if registrar_cambios:
+            with self.conexion() as conexion:
+                conexion.execute('CREATE TABLE IF NOT EXISTS cambios (seq INTEGER PRIMARY KEY AUTOINCREMENT, '
+                                 'tabla TEXT NOT NULL, id TEXT NOT NULL, momento REAL NOT NULL)')
+        else:
+            # Lo que se escriba sin registro no se podría reproducir
+            with self.conexion() as conexion:
+                self.invalidar_cambios(conexion)
+        self.escritor = EscritorEnGrupo(ruta)
+
+    def cerrar(self) -> None:
+        self.escritor.cerrar()
+
+    def conexion(self) -> sqlite3.Connection:
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is None:
+            conexion = sqlite3.connect(self.ruta, timeout=30)
+            conexion.execute('PRAGMA synchronous=NORMAL')
+            self._local.conexion = conexion
+        return conexion
+
+    def repositorio(self, tabla: str, llave: str, unicos: Iterable[str] = ()) -> 'RepositorioSQLite':
+        """
+        `unicos` son campos del JSON sin repetidos (sin distinguir
+        mayúsculas). Los índices en memoria ya los validan dentro de un
+        proceso; el índice de SQLite los protege entre procesos.
+        """
+        with self.conexion() as conexion:
+            conexion.execute(f'CREATE TABLE IF NOT EXISTS {tabla} '
+                             '(id TEXT PRIMARY KEY, datos TEXT NOT NULL)')
+        for campo in unicos:
+            try:
+                with self.conexion() as conexion:
+                    conexion.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS {tabla}_{campo} '
+                                     f"ON {tabla} (lower(json_extract(datos, '$.{campo}')))")
+            except sqlite3.IntegrityError:
+                warnings.warn(f'{tabla}.{campo} tiene valores repetidos; no se creó el índice único')
+        return RepositorioSQLite(self, tabla, llave)
+
+    # Registro de cambios
+
+    def ultimo_cambio(self) -> int:
+        """Última secuencia asignada, aunque ya se haya podado"""
+        fila = self.conexion().execute("SELECT seq FROM sqlite_sequence WHERE name = 'cambios'").fetchone()
+        return fila[0] if fila else 0
+
+    def primer_cambio(self) -> Optional[int]:
+        """Secuencia del cambio más viejo que sigue en la tabla"""
+        return self.conexion().execute('SELECT MIN(seq) FROM cambios').fetchone()[0]
+
+    def ultimo_cambio_aplicado(self) -> int:
+        """
+        Como ultimo_cambio, pero pasando por el escritor: cuando regresa ya
+        se resolvieron los futures (y sus callbacks) de todas las escrituras
+        anteriores, así que los cambios hasta esa secuencia ya están en memoria
+        """
+        def operacion(conexion: sqlite3.Connection) -> int:
+            fila = conexion.execute("SELECT seq FROM sqlite_sequence WHERE name = 'cambios'").fetchone()
+            return fila[0] if fila else 0
+        return self.escritor.encolar(operacion).result()
+
+    def cambios_desde(self, seq: int, tabla: Optional[str] = None) -> List[Tuple[int, str, str, float]]:
+        """(seq, tabla, id, momento) de los cambios posteriores a `seq`, en orden"""
+        if tabla is None:
+            return self.conexion().execute(
+                'SELECT seq, tabla, id, momento FROM cambios WHERE seq > ? ORDER BY seq', (seq,)).fetchall()
+        return self.conexion().execute(
+            'SELECT seq, tabla, id, momento FROM cambios WHERE seq > ? AND tabla = ? ORDER BY seq',
+            (seq, tabla)).fetchall()
+
+    def podar_cambios(self, antiguedad: float, hasta: Optional[int] = None) -> Future:
+        """Borra los cambios de hace más de `antiguedad` segundos y, si se indica, con seq <= `hasta`"""
+        limite = time.time() - antiguedad
+        if hasta is None:
+            return self.escritor.encolar(
+                lambda conexion: conexion.execute('DELETE FROM cambios WHERE momento < ?', (limite,)).rowcount)
+        return self.escritor.encolar(lambda conexion: conexion.execute(
+            'DELETE FROM cambios WHERE momento < ? AND seq <= ?', (limite, hasta)).rowcount)
+
+    def anotar_cambios(self, conexion: sqlite3.Connection, tabla: str, ids: Iterable[str]) -> None:
+        """Registra, dentro de la transacción de `conexion`, que cambiaron estos registros"""
+        if self.registrar_cambios:
+            momento = time.time()
+            conexion.executemany('INSERT INTO cambios (tabla, id, momento) VALUES (?, ?, ?)',
+                                 ((tabla, id_registro, momento) for id_registro in ids))
+
+    @staticmethod
+    def invalidar_cambios(conexion: sqlite3.Connection) -> None:
+        """
+        Avanza la secuencia y vacía el registro, si existe. Se usa antes de
+        escribir sin registrar: las instantáneas anteriores dejan de poder
+        completarse con el registro y se descartan al arrancar.
+        """
+        if conexion.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'cambios'").fetchone():
+            conexion.execute("INSERT INTO cambios (tabla, id, momento) VALUES ('', '', 0)")
+            conexion.execute('DELETE FROM cambios')
+
+
+class RepositorioSQLite(Repositorio):
+    """Repositorio guardado en una tabla (id, datos) de AlmacenSQLite"""
+
+    def __init__(self, almacen: AlmacenSQLite, tabla: str, llave: str) -> None:
+        self.almacen = almacen
+        self.tabla = tabla
+        self.llave = llave
+
+    def _medir(self, operacion: str):
+        return metricas.latencia_almacenamiento.medir(tabla=self.tabla, operacion=operacion)
+
+    def _medir_futuro(self, futuro: Future, operacion: str) -> Future:
+        """Registra el tiempo desde que se encola la escritura hasta que es durable"""
+        inicio = time.perf_counter()
+        futuro.add_done_callback(lambda _: metricas.latencia_almacenamiento.observar(
+            time.perf_counter() - inicio, tabla=self.tabla, operacion=operacion))
+        return futuro
+
+    def _registrar_cambios(self, conexion: sqlite3.Connection, ids: Iterable[str]) -> None:
+        self.almacen.anotar_cambios(conexion, self.tabla, ids)
+
+    def obtener(self, id_registro: str) -> Optional[Registro]:
+        with self._medir('obtener'):
+            fila = self.almacen.conexion().execute(
+                f'SELECT datos FROM {self.tabla} WHERE id = ?', (id_registro,)).fetchone()
+            metricas.registros_leidos.incrementar(1 if fila else 0, tabla=self.tabla, operacion='obtener')
+            return json.loads(fila[0]) if fila else None
+
+    def obtener_varios(self, ids: Iterable[str]) -> Dict[str, Registro]:
+        ids, encontrados = list(ids), {}
+        with self._medir('obtener_varios'):
+            # SQLite limita el número de parámetros por sentencia
+            for inicio in range(0, len(ids), 500):
+                bloque = ids[inicio:inicio + 500]
+                marcas = ', '.join('?' * len(bloque))
+                for id_registro, datos in self.almacen.conexion().execute(
+                        f'SELECT id, datos FROM {self.tabla} WHERE id IN ({marcas})', bloque):
+                    encontrados[id_registro] = json.loads(datos)
+        metricas.registros_leidos.incrementar(len(encontrados), tabla=self.tabla, operacion='obtener_varios')
+        return encontrados
+
+    def listar(self) -> Iterator[Registro]:
+        # Se mide el recorrido completo: es el camino O(n) del arranque
+        leidos, inicio = 0, time.perf_counter()
+        try:
+            cursor = self.almacen.conexion().execute(
+                f'SELECT datos FROM {self.tabla} ORDER BY rowid')
+            for (datos,) in cursor:
+                leidos += 1
+                yield json.loads(datos)
+        finally:
+            metricas.latencia_almacenamiento.observar(time.perf_counter() - inicio,
+                                                      tabla=self.tabla, operacion='listar')
+            metricas.registros_leidos.incrementar(leidos, tabla=self.tabla, operacion='listar')
+
+    def insertar(self, registro: Registro) -> None:
+        self.encolar_insertar(registro).result()
+
+    def reemplazar(self, id_registro: str, registro: Registro) -> bool:
+        return self.encolar_reemplazar(id_registro, registro).result()
+
+    def borrar(self, id_registro: str) -> Optional[Registro]:
+        return self.encolar_borrar(id_registro).result()
+
+    def encolar_insertar(self, registro: Registro) -> Future:
+        return self._medir_futuro(self.almacen.escritor.encolar(self.operacion_insertar(registro)), 'insertar')
+
+    def operacion_insertar(self, registro: Registro) -> Operacion:
+        """La inserción como operación del escritor, p. ej. para el `adicional` de otro repositorio"""
+        id_registro, datos = str(registro[self.llave]), serializar(registro)
+
+        def operacion(conexion: sqlite3.Connection) -> None:
+            try:
+                conexion.execute(f'INSERT INTO {self.tabla} (id, datos) VALUES (?, ?)',
+                                 (id_registro, datos))
+            except sqlite3.IntegrityError:
+                raise RegistroDuplicado(id_registro)
+            self._registrar_cambios(conexion, [id_registro])
+        return operacion
+
+    def encolar_insertar_varios(self, registros: List[Registro]) -> Future:
+        filas = [(str(r[self.llave]), serializar(r)) for r in registros]
+
+        def operacion(conexion: sqlite3.Connection) -> List[Optional[Exception]]:
+            errores: List[Optional[Exception]] = []
+            for id_registro, datos in filas:
+                cursor = conexion.execute(f'INSERT OR IGNORE INTO {self.tabla} (id, datos) VALUES (?, ?)',
+                                          (id_registro, datos))
+                errores.append(None if cursor.rowcount else RegistroDuplicado(id_registro))
+            self._registrar_cambios(conexion, (id_registro for (id_registro, _), error in zip(filas, errores)
+                                               if error is None))
+            return errores
+        return self._medir_futuro(self.almacen.escritor.encolar(operacion), 'insertar_varios')
+
+    def encolar_reemplazar(self, id_registro: str, registro: Registro,
+                           adicional: Optional[Operacion] = None) -> Future:
+        datos = serializar(registro)
+
+        def operacion(conexion: sqlite3.Connection) -> bool:
+            try:
+                cursor = conexion.execute(f'UPDATE {self.tabla} SET datos = ? WHERE id = ?',
+                                          (datos, id_registro))
+            except sqlite3.IntegrityError:
+                raise RegistroDuplicado(id_registro)
+            if not cursor.rowcount:
+                return False
+            self._registrar_cambios(conexion, [id_registro])
+            # Si falla, el escritor deshace también el UPDATE
+            if adicional is not None:
+                adicional(conexion)
+            return True
+        return self._medir_futuro(self.almacen.escritor.encolar(operacion), 'reemplazar')
+
+    def encolar_actualizar_si(self, id_registro: str, cambios: Registro, condicion: str,
+                              parametros: Tuple = ()) -> Future:
+        asignaciones = ', '.join("'$.' || ?, json(?)" for _ in cambios)
+        valores = [valor for campo, dato in cambios.items() for valor in (campo, serializar(dato))]
+
+        def operacion(conexion: sqlite3.Connection) -> Optional[Registro]:
+            fila = conexion.execute(f'UPDATE {self.tabla} SET datos = json_set(datos, {asignaciones}) '
+                                    f'WHERE id = ? AND ({condicion}) RETURNING datos',
+                                    (*valores, id_registro, *parametros)).fetchone()
+            if fila is None:
+                return None
+            self._registrar_cambios(conexion, [id_registro])
+            return json.loads(fila[0])
+        return self._medir_futuro(self.almacen.escritor.encolar(operacion), 'actualizar_si')
+
+    def encolar_borrar(self, id_registro: str) -> Future:
+        def operacion(conexion: sqlite3.Connection) -> Optional[Registro]:
+            fila = conexion.execute(f'SELECT datos FROM {self.tabla} WHERE id = ?',
+                                    (id_registro,)).fetchone()
+            if fila is None:
+                return None
+            conexion.execute(f'DELETE FROM {self.tabla} WHERE id = ?', (id_registro,))
+            self._registrar_cambios(conexion, [id_registro])
+            return json.loads(fila[0])
+        return self._medir_futuro(self.almacen.escritor.encolar(operacion), 'borrar')
+
+    def contar(self) -> int:
+        with self._medir('contar'):
+            return self.almacen.conexion().execute(
+                f'SELECT COUNT(*) FROM {self.tabla}').fetchone()[0]
+
+    def importar(self, registros: Iterable[Registro]) -> int:
+        """
+        Inserta o sobrescribe registros en una sola transacción. No pasa
+        por el registro de cambios (lo invalida): es para cargas con la API
+        detenida.
+        """
+        filas = ((str(r[self.llave]), serializar(r)) for r in registros)
+        with self._medir('importar'), self.almacen.conexion() as conexion:
+            self.almacen.invalidar_cambios(conexion)
+            cursor = conexion.executemany(
+                f'INSERT OR REPLACE INTO {self.tabla} (id, datos) VALUES (?, ?)', filas)
+        return cursor.rowcount
@@ -0,0 +1,70 @@
+"""
+Autores
+
+Los tweets guardan solo el id de su autor (id_autor). Al leerlos se
+hidratan con los datos públicos del usuario mediante una consulta en
+lote por página y un cache LRU que se invalida cuando el usuario cambia.
+Lo leído mientras un usuario se invalidaba no se guarda en el cache.
+"""
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional
+from almacenamiento import Registro
+from cache import Generaciones
+import threading
+
+CAMPOS_PUBLICOS = ('id_usuario', 'email', 'nombre', 'apellido')
+
+
+def autor_publico(usuario: Registro) -> Registro:
+    return {campo: usuario.get(campo) for campo in CAMPOS_PUBLICOS}
+
+
+class CacheAutores:
+    """LRU id_usuario → datos públicos del autor"""
+
+    def __init__(self, obtener_varios: Callable[[Iterable[str]], Dict[str, Registro]],
+                 capacidad: int = 10000) -> None:
+        self.obtener_varios = obtener_varios
+        self.capacidad = capacidad
+        self._autores: 'OrderedDict[str, Registro]' = OrderedDict()
+        self._generaciones = Generaciones(capacidad)
+        self._bloqueo = threading.Lock()
+
+    def obtener(self, ids: Iterable[str]) -> Dict[str, Registro]:
+        """Una sola consulta al repositorio por todos los ids que no estén en cache"""
+        encontrados, faltantes = {}, []
+        with self._bloqueo:
+            marca = self._generaciones.marca()
+            for id_usuario in set(ids):
+                autor = self._autores.get(id_usuario)
+                if autor is None:
+                    faltantes.append(id_usuario)
+                else:
+                    self._autores.move_to_end(id_usuario)
+                    encontrados[id_usuario] = autor
+        if not faltantes:
+            return encontrados
+
+        nuevos = {id_usuario: autor_publico(u) for id_usuario, u in self.obtener_varios(faltantes).items()}
+        with self._bloqueo:
+            # Un cambio entre la lectura y este punto dejaría al autor viejo en cache
+            self._autores.update((id_usuario, autor) for id_usuario, autor in nuevos.items()
+                                 if self._generaciones.vigente(marca, (id_usuario,)))
+            while len(self._autores) > self.capacidad:
+                self._autores.popitem(last=False)
+        encontrados.update(nuevos)
+        return encontrados
+
+    def hidratar(self, tweets: List[Registro]) -> List[Registro]:
+        """Agrega 'autor' a cada tweet; omite los tweets cuyo autor ya no existe"""
+        autores = self.obtener(tweet['id_autor'] for tweet in tweets)
+        return [dict(tweet, autor=autores[tweet['id_autor']]) for tweet in tweets if tweet['id_autor'] in autores]
+
+    def invalidar(self, id_usuario: str) -> None:
+        with self._bloqueo:
+            self._generaciones.invalidar(id_usuario)
+            self._autores.pop(id_usuario, None)
+
+    def al_cambiar_usuario(self, anterior: Optional[Registro], nuevo: Optional[Registro]) -> None:
+        """Suscriptor del repositorio de usuarios"""
+        self.invalidar((anterior or nuevo)['id_usuario'])
@@ -0,0 +1,221 @@
+"""
+Benchmark de la API por endpoint
+
+Siembra usuarios y tweets sintéticos a la escala indicada y mide, para
+cada endpoint por separado, peticiones por segundo y latencia p50/p95/p99
+con N clientes concurrentes. La aplicación se ejecuta en el mismo proceso
+(httpx con transporte ASGI) o con uvicorn y varios workers. El resultado
+se guarda en JSON para comparar entre commits.
+
+    $ python3 -m benchmarks.api --escala 100k --modo asgi
+    $ python3 -m benchmarks.api --escala 1m --modo uvicorn --workers 4
+    $ python3 -m benchmarks.api --comparar resultados/antes.json resultados/despues.json
+"""
+from benchmarks.carga import SIN_LIMITES, levantar
+from benchmarks.comun import percentiles, sembrar
+from indices import codificar_cursor
+import argparse, asyncio, importlib, itertools, json, os, platform, random, subprocess
+import tempfile, time
+import httpx
+
+ESCALAS = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+CONTRASENA = 'contrasena-benchmark'
+TIMESTAMP = '2022-03-27 11:46:13.049343'
+
+
+class Escenarios:
+    """
+    Arma la petición de cada endpoint. Los tweets [0, mitad) se leen y
+    actualizan; los de [mitad, tweets) se borran, cada uno una sola vez.
+    """
+
+    def __init__(self, tweets: int, usuarios: int) -> None:
+        self.tweets = tweets
+        self.usuarios = usuarios
+        self.mitad = tweets // 2
+        self._borrables = itertools.count(self.mitad)
+
+    def _tweet(self) -> str:
+        return f'{random.randrange(self.mitad):032d}'
+
+    def _autor(self) -> str:
+        return f'{random.randrange(self.usuarios):032d}'
+
+    def peticiones(self):
+        return {
+            'POST /ingresar': lambda http: http.post('/ingresar', json={
+                'email': f'user{random.randrange(self.usuarios)}@example.com', 'contrasena': CONTRASENA}),
+            'GET /tweets': lambda http: http.get('/tweets', params={
+                'limit': 100, 'after': codificar_cursor((TIMESTAMP, self._tweet()))}),
+            'GET /tweets/{id}': lambda http: http.get(f'/tweets/{self._tweet()}'),
+            'GET /usuarios/{id}/tweets': lambda http: http.get(f'/usuarios/{self._autor()}/tweets',
+                                                               params={'limit': 20}),
+            'POST /post_tweet': lambda http: http.post('/post_tweet', json={
+                'contenido': 'Tweet nuevo #benchmark', 'id_autor': self._autor()}),
+            'PUT /tweets/{id}': lambda http: self._actualizar(http),
+            'DELETE /tweets/{id}': lambda http: self._borrar(http),
+        }
+
+    def _actualizar(self, http: httpx.AsyncClient):
+        id_tweet = self._tweet()
+        return http.put(f'/tweets/{id_tweet}', json={
+            'id_tweet': id_tweet, 'contenido': 'Tweet actualizado #benchmark',
+            'timestamp_pub': TIMESTAMP, 'id_autor': self._autor()})
+
+    def _borrar(self, http: httpx.AsyncClient):
+        siguiente = next(self._borrables)
+        if siguiente >= self.tweets:
+            return None
+        return http.delete(f'/tweets/{siguiente:032d}')
+
+
+async def medir_endpoint(http: httpx.AsyncClient, peticion, clientes: int, segundos: float) -> dict:
+    latencias, errores = [], 0
+
+    async def cliente(fin: float) -> None:
+        nonlocal errores
+        while time.perf_counter() < fin:
+            pendiente = peticion(http)
+            if pendiente is None:
+                return
+            inicio = time.perf_counter()
+            try:
+                respuesta = await pendiente
+                errores += respuesta.status_code >= 400
+            except httpx.HTTPError:
+                errores += 1
+            latencias.append(time.perf_counter() - inicio)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(cliente(inicio + segundos) for _ in range(clientes)))
+    duracion = time.perf_counter() - inicio
+    if len(latencias) < 2:
+        return {'peticiones': len(latencias), 'errores': errores}
+    return {'peticiones': len(latencias),
+            'peticiones_s': round(len(latencias) / duracion, 1),
+            **percentiles(latencias),
+            'errores': errores}
+
+
+async def medir_todos(http: httpx.AsyncClient, escenarios: Escenarios, endpoints, clientes: int,
+                      segundos: float) -> dict:
+    peticiones = escenarios.peticiones()
+    resultados = {}
+    for endpoint in endpoints:
+        resultados[endpoint] = await medir_endpoint(http, peticiones[endpoint], clientes, segundos)
+        imprimir(endpoint, resultados[endpoint])
+    return resultados
+
+
+def imprimir(endpoint: str, r: dict) -> None:
+    if 'p50_ms' not in r:
+        print(f'{endpoint:<26} sin suficientes peticiones')
+        return
+    print(f'{endpoint:<26} {r["peticiones_s"]:>10.1f} {r["p50_ms"]:>10.2f} {r["p95_ms"]:>10.2f} '
+          f'{r["p99_ms"]:>10.2f} {r["errores"]:>8}')
+
+
+def commit_actual() -> str:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+        sucio = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                               capture_output=True, text=True).stdout.strip()
+        return commit + ('-sucio' if sucio else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'desconocido'
+
+
+def comparar(anterior: str, actual: str) -> None:
+    with open(anterior) as f:
+        a = json.load(f)
+    with open(actual) as f:
+        b = json.load(f)
+    print(f'{a["commit"]} → {b["commit"]}')
+    print(f'{"endpoint":<26} {"req/s":>16} {"p50 (ms)":>16} {"p99 (ms)":>16}')
+    for endpoint, r in b['endpoints'].items():
+        antes = a['endpoints'].get(endpoint)
+        if not antes or 'p50_ms' not in antes or 'p50_ms' not in r:
+            continue
+        columnas = [f'{(r[c] - antes[c]) / antes[c] * 100:>+15.1f}%' if antes[c] else f'{"-":>16}'
+                    for c in ('peticiones_s', 'p50_ms', 'p99_ms')]
+        print(f'{endpoint:<26} ' + ' '.join(columnas))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark de la API por endpoint')
+    parser.add_argument('--escala', choices=list(ESCALAS), default='10k', help='número de tweets sembrados')
+    parser.add_argument('--usuarios', type=int, help='por defecto, un usuario por cada 10 tweets')
+    parser.add_argument('--modo', choices=['asgi', 'uvicorn'], default='asgi')
+    parser.add_argument('--app', default='main_tw:app')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--clientes', type=int, default=50)
+    parser.add_argument('--segundos', type=float, default=10, help='duración de cada endpoint')
+    parser.add_argument('--endpoints', nargs='+', default=None)
+    parser.add_argument('--puerto', type=int, default=8200)
+    parser.add_argument('--salida', help='archivo JSON de resultados')
+    parser.add_argument('--comparar', nargs=2, metavar=('ANTERIOR', 'ACTUAL'))
+    argumentos = parser.parse_args()
+
+    if argumentos.comparar:
+        comparar(*argumentos.comparar)
+        return
+
+    tweets = ESCALAS[argumentos.escala]
+    usuarios = argumentos.usuarios or max(1, tweets // 10)
+    escenarios = Escenarios(tweets, usuarios)
+    endpoints = argumentos.endpoints or list(escenarios.peticiones())
+    limites = httpx.Limits(max_connections=argumentos.clientes, max_keepalive_connections=argumentos.clientes)
+
+    with tempfile.TemporaryDirectory() as directorio:
+        base = os.path.join(directorio, 'bench.db')
+        inicio = time.perf_counter()
+        sembrar(base, tweets, usuarios, CONTRASENA)
+        print(f'Sembrados {usuarios} usuarios y {tweets} tweets en {time.perf_counter() - inicio:.1f} s')
+        print(f'{"endpoint":<26} {"req/s":>10} {"p50 (ms)":>10} {"p95 (ms)":>10} {"p99 (ms)":>10} {"errores":>8}')
+
+        if argumentos.modo == 'asgi':
+            os.environ['TWITTER_DB'] = base
+            for variable, valor in SIN_LIMITES.items():
+                os.environ.setdefault(variable, valor)
+            modulo, nombre = argumentos.app.split(':')
+            app = getattr(importlib.import_module(modulo), nombre)
+            transporte = httpx.ASGITransport(app=app)
+
+            async def correr():
+                async with httpx.AsyncClient(transport=transporte, base_url='http://bench', limits=limites) as http:
+                    return await medir_todos(http, escenarios, endpoints, argumentos.clientes, argumentos.segundos)
+            resultados = asyncio.run(correr())
+            importlib.import_module('main_tw').almacen.cerrar()
+        else:
+            proceso = levantar(argumentos.app, base, argumentos.puerto, argumentos.workers,
+                               espera=max(10, tweets / 10_000))
+            try:
+                async def correr():
+                    async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{argumentos.puerto}',
+                                                 limits=limites, timeout=60) as http:
+                        return await medir_todos(http, escenarios, endpoints, argumentos.clientes,
+                                                 argumentos.segundos)
+                resultados = asyncio.run(correr())
+            finally:
+                proceso.terminate()
+                proceso.wait()
+
+    commit = commit_actual()
+    informe = {'commit': commit, 'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'escala': argumentos.escala, 'tweets': tweets, 'usuarios': usuarios,
+               'modo': argumentos.modo, 'app': argumentos.app,
+               'workers': argumentos.workers if argumentos.modo == 'uvicorn' else 1,
+               'clientes': argumentos.clientes, 'segundos': argumentos.segundos,
+               'python': platform.python_version(), 'cpus': os.cpu_count(),
+               'endpoints': resultados}
+    salida = argumentos.salida or os.path.join(
+        'benchmarks', 'resultados', f'{commit}-{argumentos.escala}-{argumentos.modo}.json')
+    os.makedirs(os.path.dirname(salida) or '.', exist_ok=True)
+    with open(salida, 'w') as f:
+        json.dump(informe, f, indent=2)
+    print(f'Resultados en {salida}')
+
+
+if __name__ == '__main__':
+    main()
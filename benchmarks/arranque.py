@@ -0,0 +1,157 @@
+"""
+Arranque en frío y recuperación después de una caída
+
+Siembra una base con N tweets y mide, en un proceso nuevo cada vez,
+cuánto tarda en importarse main_tw (cargar todo en memoria):
+
+- sin instantáneas, recorriendo SQLite;
+- con una instantánea al día;
+- con una instantánea y --cola escrituras posteriores que hay que reproducir.
+
+Con --choque corre además un proceso que escribe sin parar (inserta,
+edita y borra tweets) guardando instantáneas cada poco, lo mata con
+SIGKILL y verifica que, al arrancar de nuevo, lo que queda en memoria
+sea igual a lo que hay en SQLite.
+
+    $ python3 -m benchmarks.arranque --tweets 200000 --cola 1000 --choque
+"""
+from benchmarks.comun import sembrar
+import argparse, json, os, signal, subprocess, sys, tempfile, time
+
+# Las dependencias se importan antes de medir. "datos" es lo que tarda leer
+# los registros (SQLite o instantánea) y reproducir los cambios; el resto
+# es reconstruir timelines e índices en memoria
+ARRANCAR = '''
+import json, time
+import fastapi, orjson, pydantic
+inicio = time.perf_counter()
+import main_tw
+segundos = time.perf_counter() - inicio
+import metricas
+datos = sum(float(linea.split()[-1]) for linea in metricas.exponer().splitlines()
+            if linea.startswith(("twitter_almacenamiento_segundos_sum", "twitter_instantanea_segundos_sum"))
+            and any(f'operacion="{o}"' in linea for o in ("listar", "cargar", "obtener_varios")))
+print(json.dumps({"segundos": segundos, "datos": datos, "tweets": main_tw.repo_tweets.contar()}))
+'''
+
+# Guarda las instantáneas y el índice de búsqueda, como al apagar el servidor
+CERRAR = '''
+import main_tw
+main_tw.cerrar_almacen()
+'''
+
+# Escribe sin guardar instantáneas ni cerrar: lo que quede se reproduce del registro de cambios
+ESCRIBIR = '''
+import os, sys
+import main_tw
+futuros = []
+for i in range(int(sys.argv[1])):
+    tweet = main_tw.repo_tweets.obtener(f"{i:032d}")
+    futuros.append(main_tw.repo_tweets.encolar_reemplazar(tweet["id_tweet"], dict(tweet, contenido=f"Editado {i}")))
+for futuro in futuros:
+    futuro.result()
+os._exit(0)
+'''
+
+ESCRIBIR_SIN_PARAR = '''
+import itertools, random, sys
+import main_tw
+repo = main_tw.repo_tweets
+for vuelta in itertools.count():
+    ids = [t["id_tweet"] for t in itertools.islice(repo.listar(), 200)]
+    futuros = []
+    for i in range(50):
+        opcion = random.random()
+        if opcion < 0.5:
+            futuros.append(repo.encolar_insertar({"id_tweet": f"choque{vuelta}-{i}", "contenido": "nuevo",
+                                                  "timestamp_pub": "2022-03-28 00:00:00", "timestamp_act": None,
+                                                  "id_autor": f"{i:032d}"}))
+        elif opcion < 0.8:
+            tweet = repo.obtener(random.choice(ids))
+            if tweet is not None:
+                futuros.append(repo.encolar_reemplazar(tweet["id_tweet"], dict(tweet, contenido=f"v{vuelta}")))
+        else:
+            futuros.append(repo.encolar_borrar(random.choice(ids)))
+    for futuro in futuros:
+        try:
+            futuro.result()
+        except Exception:
+            pass
+    print(vuelta, flush=True)
+'''
+
+VERIFICAR = '''
+import json
+import main_tw
+from instantaneas import leer
+leida = leer(main_tw.instantaneas.ruta("tweets"))
+en_sqlite = {t["id_tweet"]: t for t in main_tw.repo_tweets.base.listar()}
+en_memoria = {t["id_tweet"]: t for t in main_tw.repo_tweets.listar()}
+orden = [clave for clave, _ in main_tw.repo_tweets.recorrer("orden")]
+print(json.dumps({"iguales": en_sqlite == en_memoria,
+                  "orden": orden == sorted(main_tw.clave_tweet(t) for t in en_sqlite.values()),
+                  "tweets": len(en_sqlite),
+                  "reproducidos": main_tw.almacen.ultimo_cambio() - leida[0] if leida else None}))
+'''
+
+
+def correr(codigo: str, entorno: dict, *argumentos: str) -> dict:
+    salida = subprocess.run([sys.executable, '-c', codigo, *argumentos], env=entorno,
+                            check=True, capture_output=True, text=True).stdout
+    lineas = salida.strip().splitlines()
+    return json.loads(lineas[-1]) if lineas else {}
+
+
+def choque(entorno: dict, segundos: float) -> dict:
+    entorno = dict(entorno, TWITTER_INTERVALO_INSTANTANEAS='0.2')
+    proceso = subprocess.Popen([sys.executable, '-c', ESCRIBIR_SIN_PARAR], env=entorno,
+                               stdout=subprocess.PIPE, text=True)
+    # Se empieza a contar con el primer lote escrito, no mientras arranca
+    proceso.stdout.readline()
+    time.sleep(segundos)
+    proceso.send_signal(signal.SIGKILL)
+    vueltas = 1 + len(proceso.communicate()[0].splitlines())
+    return dict(correr(VERIFICAR, entorno), vueltas=vueltas)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--tweets', type=int, default=100000)
+    parser.add_argument('--cola', type=int, default=1000,
+                        help='escrituras posteriores a la instantánea')
+    parser.add_argument('--choque', action='store_true')
+    parser.add_argument('--segundos-choque', type=float, default=3)
+    argumentos = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directorio:
+        base = os.path.join(directorio, 'arranque.db')
+        sembrar(base, argumentos.tweets)
+        entorno = {**os.environ, 'TWITTER_DB': base}
+        sin_instantaneas = dict(entorno, TWITTER_INTERVALO_INSTANTANEAS='0')
+
+        # El primer arranque construye el índice de búsqueda; se guarda para no medirlo
+        correr(CERRAR, sin_instantaneas)
+        resultados = [('sin instantánea', correr(ARRANCAR, sin_instantaneas))]
+        correr(CERRAR, entorno)
+        resultados.append(('instantánea al día', correr(ARRANCAR, entorno)))
+        correr(ESCRIBIR, entorno, str(argumentos.cola))
+        resultados.append((f'instantánea + {argumentos.cola} cambios', correr(ARRANCAR, entorno)))
+
+        base_s = resultados[0][1]['segundos']
+        base_datos = resultados[0][1]['datos']
+        print(f'{"arranque":<32} {"tweets":>8} {"segundos":>9} {"mejora":>7} {"datos (s)":>10} {"mejora":>7}')
+        for nombre, r in resultados:
+            print(f'{nombre:<32} {r["tweets"]:>8} {r["segundos"]:>9.3f} {base_s / r["segundos"]:>6.1f}x '
+                  f'{r["datos"]:>10.3f} {base_datos / r["datos"]:>6.1f}x')
+
+        if argumentos.choque:
+            r = choque(entorno, argumentos.segundos_choque)
+            estado = 'OK' if r['iguales'] and r['orden'] else 'FALLA'
+            print(f'\nChoque tras {r["vueltas"]} lotes de escrituras: {r["tweets"]} tweets, '
+                  f'{r["reproducidos"]} cambios reproducidos, memoria igual a SQLite: {estado}')
+            if estado != 'OK':
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Prueba de carga: API síncrona contra asíncrona
+
+Levanta cada aplicación con uvicorn sobre una copia de la misma base
+sembrada y la golpea con N clientes concurrentes durante unos segundos.
+
+    $ python3 -m benchmarks.carga --apps main_tw:app main_tw_async:app --clientes 500
+"""
+from benchmarks.comun import percentiles, sembrar
+from benchmarks.indices import tweet_sintetico
+import argparse, asyncio, os, random, shutil, subprocess, sys, tempfile, time
+import httpx
+
+
+async def cliente(http: httpx.AsyncClient, tweets: int, fin: float, latencias: list, errores: list) -> None:
+    while time.perf_counter() < fin:
+        opcion = random.random()
+        if opcion < 0.6:
+            peticion = http.get(f'/tweets/{random.randrange(tweets):032d}')
+        elif opcion < 0.8:
+            peticion = http.get(f'/usuarios/{random.randrange(min(tweets, 1000)):032d}')
+        elif opcion < 0.9:
+            peticion = http.get('/tweets', params={'limit': 20})
+        else:
+            tweet = tweet_sintetico(0)
+            tweet['id_tweet'] = os.urandom(16).hex()
+            peticion = http.post('/post_tweet', json=tweet)
+
+        inicio = time.perf_counter()
+        try:
+            respuesta = await peticion
+            if respuesta.status_code >= 400:
+                errores.append(respuesta.status_code)
+        except httpx.HTTPError as error:
+            errores.append(type(error).__name__)
+        latencias.append(time.perf_counter() - inicio)
+
+
+async def cargar(url: str, clientes: int, duracion: float, tweets: int) -> dict:
+    limites = httpx.Limits(max_connections=clientes, max_keepalive_connections=clientes)
+    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=60) as http:
+        latencias, errores = [], []
+        fin = time.perf_counter() + duracion
+        await asyncio.gather(*(cliente(http, tweets, fin, latencias, errores) for _ in range(clientes)))
+
+    return {'peticiones_s': len(latencias) / duracion, **percentiles(latencias), 'errores': len(errores)}
+
+
+# Los clientes del benchmark salen todos de 127.0.0.1: sin límites de
+# admisión, salvo que se fijen en el entorno
+SIN_LIMITES = {'TWITTER_TASA_IP': '0', 'TWITTER_TASA_USUARIO': '0', 'TWITTER_MAX_CONCURRENTES': '0'}
+
+
+def levantar(aplicacion: str, base: str, puerto: int, workers: int = 1, espera: float = 10) -> subprocess.Popen:
+    entorno = {**SIN_LIMITES, **os.environ, 'TWITTER_DB': base}
+    if workers > 1:
+        entorno['TWITTER_MULTIPROCESO'] = '1'
+    proceso = subprocess.Popen([sys.executable, '-m', 'uvicorn', aplicacion, '--port', str(puerto),
+                                '--workers', str(workers), '--log-level', 'warning'], env=entorno)
+    for _ in range(int(espera * 10)):
+        try:
+            httpx.get(f'http://127.0.0.1:{puerto}/')
+            return proceso
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    proceso.kill()
+    raise RuntimeError(f'{aplicacion} no respondió en el puerto {puerto}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Prueba de carga de la API')
+    parser.add_argument('--apps', nargs='+', default=['main_tw:app', 'main_tw_async:app'])
+    parser.add_argument('--clientes', type=int, default=500)
+    parser.add_argument('--duracion', type=float, default=10)
+    parser.add_argument('--tweets', type=int, default=10000)
+    parser.add_argument('--puerto', type=int, default=8100)
+    argumentos = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directorio:
+        semilla = os.path.join(directorio, 'semilla.db')
+        sembrar(semilla, argumentos.tweets)
+
+        print(f'{"app":<20} {"req/s":>10} {"p50 (ms)":>10} {"p95 (ms)":>10} {"p99 (ms)":>10} {"errores":>8}')
+        for i, aplicacion in enumerate(argumentos.apps):
+            base = os.path.join(directorio, f'app{i}.db')
+            shutil.copy(semilla, base)
+            proceso = levantar(aplicacion, base, argumentos.puerto + i)
+            try:
+                r = asyncio.run(cargar(f'http://127.0.0.1:{argumentos.puerto + i}',
+                                       argumentos.clientes, argumentos.duracion, argumentos.tweets))
+            finally:
+                proceso.terminate()
+                proceso.wait()
+            print(f'{aplicacion:<20} {r["peticiones_s"]:>10.0f} {r["p50_ms"]:>10.1f} '
+                  f'{r["p95_ms"]:>10.1f} {r["p99_ms"]:>10.1f} {r["errores"]:>8}')
@@ -0,0 +1,32 @@
+"""
+Utilidades compartidas por los benchmarks de la API
+"""
+from benchmarks.indices import tweet_sintetico, usuario_sintetico
+from almacenamiento import AlmacenSQLite
+from typing import Dict, List, Optional
+import statistics
+import seguridad
+
+
+def sembrar(ruta: str, tweets: int, usuarios: Optional[int] = None, contrasena: str = '') -> None:
+    """
+    Siembra `tweets` tweets y `usuarios` usuarios sintéticos (por defecto
+    hasta 1000), con ids f'{i:032d}'. El tweet i es del usuario
+    i % usuarios. Con `contrasena` todos comparten un solo hash, para no
+    calcular millones de scrypt.
+    """
+    usuarios = usuarios or max(1, min(tweets, 1000))
+    hash_contrasena = seguridad.generar_hash(contrasena) if contrasena else ''
+    almacen = AlmacenSQLite(ruta)
+    almacen.repositorio('usuarios', 'id_usuario').importar(
+        dict(usuario_sintetico(i), contrasena=hash_contrasena) for i in range(usuarios))
+    almacen.repositorio('tweets', 'id_tweet').importar(
+        dict(tweet_sintetico(i), id_autor=f'{i % usuarios:032d}') for i in range(tweets))
+    almacen.conexion().execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    almacen.cerrar()
+
+
+def percentiles(latencias: List[float]) -> Dict[str, float]:
+    """p50, p95 y p99 de las latencias (en segundos), en milisegundos"""
+    cortes = statistics.quantiles(latencias, n=100)
+    return {f'p{p}_ms': round(cortes[p - 1] * 1000, 3) for p in (50, 95, 99)}
@@ -0,0 +1,137 @@
+"""
+Likes sobre un tweet viral
+
+Levanta la aplicación con uvicorn y mide la latencia de PUT /tweets/{id}
+sola y mientras --clientes-like clientes le dan --tasa likes por segundo
+al mismo tweet. Los likes van a ritmo fijo: sin ritmo, cualquier endpoint
+que sature la CPU retrasa a los demás y no se mide la contención. Al
+apagar el servidor verifica que el contador guardado en SQLite sea igual
+a los likes respondidos con 200.
+
+Con --directo compara además, en el mismo proceso, los contadores
+fragmentados contra escribir cada like en el escritor (una fila por like
+al grupo de commit), con varios hilos sobre el mismo tweet.
+
+    $ python3 -m benchmarks.contadores --tasa 2000 --clientes-put 20 --directo
+"""
+from benchmarks.carga import levantar
+from benchmarks.comun import percentiles, sembrar
+from almacenamiento import AlmacenSQLite
+from contadores import Contadores
+import argparse, asyncio, os, random, tempfile, threading, time
+import httpx
+
+VIRAL = f'{0:032d}'
+
+
+async def dar_likes(http: httpx.AsyncClient, fin: float, periodo: float, respondidos: list) -> None:
+    siguiente = time.perf_counter() + random.random() * periodo
+    while siguiente < fin:
+        await asyncio.sleep(max(0.0, siguiente - time.perf_counter()))
+        siguiente += periodo
+        respuesta = await http.post(f'/tweets/{VIRAL}/like')
+        if respuesta.status_code == 200:
+            respondidos.append(1)
+
+
+async def editar(http: httpx.AsyncClient, tweets: int, fin: float, latencias: list, errores: list) -> None:
+    while time.perf_counter() < fin:
+        id_tweet = f'{random.randrange(1, tweets):032d}'
+        inicio = time.perf_counter()
+        respuesta = await http.put(f'/tweets/{id_tweet}', json={
+            'id_tweet': id_tweet, 'contenido': f'Editado {random.random()}', 'id_autor': f'{0:032d}'})
+        latencias.append(time.perf_counter() - inicio)
+        if respuesta.status_code >= 400:
+            errores.append(respuesta.status_code)
+
+
+async def ronda(url: str, clientes_put: int, clientes_like: int, tasa: float, duracion: float,
+                tweets: int) -> dict:
+    clientes = clientes_put + clientes_like
+    limites = httpx.Limits(max_connections=clientes, max_keepalive_connections=clientes)
+    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=60) as http:
+        latencias, errores, likes = [], [], []
+        fin = time.perf_counter() + duracion
+        await asyncio.gather(*(editar(http, tweets, fin, latencias, errores) for _ in range(clientes_put)),
+                             *(dar_likes(http, fin, clientes_like / tasa, likes) for _ in range(clientes_like)))
+    return {'likes': len(likes), 'likes_s': len(likes) / duracion, 'puts_s': len(latencias) / duracion,
+            **percentiles(latencias), 'errores': len(errores)}
+
+
+def directo(base: str, hilos: int, likes: int) -> None:
+    almacen = AlmacenSQLite(base)
+    contadores = Contadores(almacen)
+    contadores.iniciar()
+
+    def fragmentados() -> None:
+        for _ in range(likes):
+            contadores.incrementar(VIRAL, 'likes')
+
+    def por_like() -> None:
+        # Lo que costaría guardar cada like en cuanto llega
+        futuros = [almacen.escritor.encolar(lambda conexion: conexion.execute(
+            "UPDATE contadores SET valor = valor + 1 WHERE id = ? AND tipo = 'likes'", (VIRAL,)))
+            for _ in range(likes)]
+        for futuro in futuros:
+            futuro.result()
+
+    print(f'\n{"en el proceso":<24} {"likes/s":>12}')
+    for nombre, funcion in (('fragmentados', fragmentados), ('escritor por like', por_like)):
+        trabajadores = [threading.Thread(target=funcion) for _ in range(hilos)]
+        inicio = time.perf_counter()
+        for hilo in trabajadores:
+            hilo.start()
+        for hilo in trabajadores:
+            hilo.join()
+        if funcion is fragmentados:
+            contadores.volcar()
+        segundos = time.perf_counter() - inicio
+        print(f'{nombre:<24} {hilos * likes / segundos:>12.0f}')
+    contadores.detener()
+    almacen.cerrar()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--app', default='main_tw_async:app')
+    parser.add_argument('--clientes-like', type=int, default=200)
+    parser.add_argument('--tasa', type=float, default=2000, help='likes por segundo')
+    parser.add_argument('--clientes-put', type=int, default=20)
+    parser.add_argument('--duracion', type=float, default=10)
+    parser.add_argument('--tweets', type=int, default=10000)
+    parser.add_argument('--puerto', type=int, default=8200)
+    parser.add_argument('--directo', action='store_true')
+    parser.add_argument('--hilos', type=int, default=8)
+    argumentos = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directorio:
+        base = os.path.join(directorio, 'contadores.db')
+        sembrar(base, argumentos.tweets)
+        url = f'http://127.0.0.1:{argumentos.puerto}'
+        proceso = levantar(argumentos.app, base, argumentos.puerto)
+        try:
+            sola = asyncio.run(ronda(url, argumentos.clientes_put, 0, 1, argumentos.duracion, argumentos.tweets))
+            con_likes = asyncio.run(ronda(url, argumentos.clientes_put, argumentos.clientes_like,
+                                          argumentos.tasa, argumentos.duracion, argumentos.tweets))
+        finally:
+            # Al apagar se vuelca lo pendiente
+            proceso.terminate()
+            proceso.wait()
+
+        print(f'{"PUT /tweets/{id}":<24} {"puts/s":>8} {"p50 (ms)":>9} {"p99 (ms)":>9} {"likes/s":>9} {"errores":>8}')
+        for nombre, r in (('solo', sola), ('con tormenta de likes', con_likes)):
+            print(f'{nombre:<24} {r["puts_s"]:>8.0f} {r["p50_ms"]:>9.1f} {r["p99_ms"]:>9.1f} '
+                  f'{r["likes_s"]:>9.0f} {r["errores"]:>8}')
+
+        guardados = AlmacenSQLite(base).conexion().execute(
+            "SELECT valor FROM contadores WHERE id = ? AND tipo = 'likes'", (VIRAL,)).fetchone()
+        guardados = guardados[0] if guardados else 0
+        estado = 'OK' if guardados == con_likes['likes'] else 'FALLA'
+        print(f'\nLikes respondidos: {con_likes["likes"]}, guardados en SQLite: {guardados} ({estado})')
+
+        if argumentos.directo:
+            directo(base, argumentos.hilos, 20000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Benchmark de índices primarios
+
+Mide la latencia de consulta y actualización por ID sobre
+RepositorioIndexado con distintos tamaños de colección.
+
+    $ python3 -m benchmarks.indices --tamanos 1000 10000 100000 1000000
+"""
+from indices import RepositorioIndexado
+from almacenamiento import AlmacenSQLite
+import argparse, os, random, tempfile, time
+
+
+def tweet_sintetico(i: int) -> dict:
+    return {'id_tweet': f'{i:032d}',
+            'contenido': f'Tweet sintético número {i}',
+            'timestamp_pub': '2022-03-27 11:46:13.049343',
+            'timestamp_act': None,
+            'id_autor': f'{i % 1000:032d}'}
+
+
+def usuario_sintetico(i: int) -> dict:
+    return {'id_usuario': f'{i:032d}',
+            'email': f'user{i}@example.com',
+            'nombre': 'string',
+            'apellido': 'string',
+            'contrasena': ''}
+
+
+def medir(funcion, argumentos) -> float:
+    """Latencia promedio en microsegundos"""
+    inicio = time.perf_counter()
+    for argumento in argumentos:
+        funcion(argumento)
+    return (time.perf_counter() - inicio) / len(argumentos) * 1e6
+
+
+def ejecutar(tamano: int, operaciones: int) -> None:
+    with tempfile.TemporaryDirectory() as directorio:
+        almacen = AlmacenSQLite(os.path.join(directorio, 'bench.db'))
+        base = almacen.repositorio('tweets', 'id_tweet')
+        base.importar(tweet_sintetico(i) for i in range(tamano))
+
+        inicio = time.perf_counter()
+        tweets = RepositorioIndexado(base)
+        carga = time.perf_counter() - inicio
+
+        ids = [f'{random.randrange(tamano):032d}' for _ in range(operaciones)]
+        lectura = medir(tweets.obtener, ids)
+        actualizacion = medir(lambda id_tweet: tweets.reemplazar(id_tweet, tweet_sintetico(int(id_tweet))),
+                              ids[:max(1, operaciones // 10)])
+
+        print(f'{tamano:>10} {carga:>10.2f} {lectura:>14.2f} {actualizacion:>16.2f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark de índices primarios')
+    parser.add_argument('--tamanos', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--operaciones', type=int, default=10000)
+    argumentos = parser.parse_args()
+
+    print(f'{"tweets":>10} {"carga (s)":>10} {"obtener (µs)":>14} {"reemplazar (µs)":>16}')
+    for tamano in argumentos.tamanos:
+        ejecutar(tamano, argumentos.operaciones)
@@ -0,0 +1,58 @@
+"""
+Benchmark de serialización
+
+Compara las peticiones por segundo de GET /tweets con la respuesta
+validada contra response_model y con TWITTER_RESPUESTA_RAPIDA (orjson,
+sin revalidar), para distintos tamaños de página. La aplicación corre en
+el mismo proceso, sin red de por medio.
+
+    $ python3 -m benchmarks.serializacion --tamanos 10 100 1000 --segundos 5
+"""
+from benchmarks.carga import SIN_LIMITES
+from benchmarks.indices import tweet_sintetico, usuario_sintetico
+from almacenamiento import AlmacenSQLite
+import argparse, asyncio, importlib, os, tempfile, time
+import httpx
+
+
+async def medir(app, limite: int, segundos: float) -> float:
+    """Peticiones por segundo de GET /tweets?limit=`limite` en un solo cliente"""
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://bench') as http:
+        await http.get('/tweets', params={'limit': limite})
+        peticiones, inicio = 0, time.perf_counter()
+        while time.perf_counter() - inicio < segundos:
+            respuesta = await http.get('/tweets', params={'limit': limite})
+            respuesta.raise_for_status()
+            peticiones += 1
+        return peticiones / (time.perf_counter() - inicio)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--tamanos', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--segundos', type=float, default=5)
+    argumentos = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, 'bench.db')
+        almacen = AlmacenSQLite(ruta)
+        almacen.repositorio('tweets', 'id_tweet').importar(tweet_sintetico(i) for i in range(max(argumentos.tamanos)))
+        almacen.repositorio('usuarios', 'id_usuario').importar(usuario_sintetico(i) for i in range(1000))
+        almacen.cerrar()
+
+        os.environ['TWITTER_DB'] = ruta
+        for variable, valor in SIN_LIMITES.items():
+            os.environ.setdefault(variable, valor)
+        main_tw = importlib.import_module('main_tw')
+        print(f'{"tamaño":>8} {"validada req/s":>15} {"orjson req/s":>13} {"mejora":>7}')
+        for tamano in argumentos.tamanos:
+            resultados = []
+            for rapida in (False, True):
+                main_tw.RESPUESTA_RAPIDA = rapida
+                resultados.append(asyncio.run(medir(main_tw.app, tamano, argumentos.segundos)))
+            print(f'{tamano:>8} {resultados[0]:>15.1f} {resultados[1]:>13.1f} {resultados[1] / resultados[0]:>6.1f}x')
+        main_tw.almacen.cerrar()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Benchmark de tendencias
+
+Cuenta N tweets sintéticos (hashtags con distribución de Zipf y
+menciones al azar, repartidos en las últimas 24 horas) y mide cuánto
+cuesta agregar un tweet y responder el top de cada ventana, recalculado
+y desde el ranking guardado. Verifica además que el top 10 de la ventana
+de 24 horas sea el real.
+
+    $ python3 -m benchmarks.tendencias --tamanos 10000 100000 1000000
+"""
+from benchmarks.indices import medir
+from collections import Counter
+from tendencias import VENTANAS, Tendencias, extraer
+import argparse, random, time
+
+
+def contenido_sintetico(generador: random.Random) -> str:
+    hashtags = {f'#tema{int(generador.paretovariate(1.1))}' for _ in range(generador.randrange(1, 4))}
+    return f'Tweet sintético {" ".join(hashtags)} @usuario{generador.randrange(100000)}'
+
+
+def ejecutar(tamano: int, operaciones: int) -> None:
+    generador = random.Random(tamano)
+    ahora = time.time()
+    tweets = [(contenido_sintetico(generador), ahora - generador.random() * VENTANAS['24h'])
+              for _ in range(tamano)]
+    tendencias = Tendencias()
+    inicio = time.perf_counter()
+    for contenido, instante in tweets:
+        tendencias.agregar(contenido, instante, ahora)
+    agregar = (time.perf_counter() - inicio) / tamano * 1e6
+
+    tendencias.refresco = 0
+    calcular = medir(lambda ventana: tendencias.top(ventana, 10), list(VENTANAS) * 10)
+    tendencias.refresco = 3600
+    guardado = medir(lambda ventana: tendencias.top(ventana, 10), list(VENTANAS) * (operaciones // 3))
+
+    reales = Counter(termino for contenido, _ in tweets for termino in extraer(contenido))
+    top = [t['termino'] for t in tendencias.top('24h', 10)]
+    exacto = set(top) == {termino for termino, _ in reales.most_common(10)}
+    print(f'{tamano:>10} {agregar:>14.1f} {calcular:>14.0f} {guardado:>14.2f} {"sí" if exacto else "no":>10}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark de tendencias')
+    parser.add_argument('--tamanos', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--operaciones', type=int, default=30000)
+    argumentos = parser.parse_args()
+
+    print(f'{"tweets":>10} {"agregar (µs)":>14} {"calcular (µs)":>14} {"guardado (µs)":>14} {"top exacto":>10}')
+    for tamano in argumentos.tamanos:
+        ejecutar(tamano, argumentos.operaciones)
@@ -0,0 +1,78 @@
+"""
+Benchmark de validación de órdenes (validation.py)
+
+Compara órdenes por segundo validando una por petición (POST /order)
+contra lotes (POST /orders/batch) de distintos tamaños, y el costo de
+validar una orden sin HTTP de por medio. La aplicación corre en el mismo
+proceso, sin red.
+
+    $ python3 -m benchmarks.validacion --tamanos 100 1000 --segundos 5
+"""
+from datetime import date
+import argparse, asyncio, time
+import httpx
+import validation
+
+DOMINIOS = [f'empresa{i}.example.com' for i in range(50)]
+TARJETAS = ['4242424242424242', '5555555555554444', '378282246310005']
+
+
+def orden_sintetica(i: int) -> dict:
+    return {'person': {'name': f'Cliente {i}', 'email': f'cliente{i}@{DOMINIOS[i % len(DOMINIOS)]}',
+                       'phone': f'+5411{i % 10**8:08d}'},
+            'product': {'name': 'Laptop'},
+            'address': {'street': f'Calle {i}', 'city': 'Buenos Aires', 'country': 'AR'},
+            'payment_method': {'card_number': TARJETAS[i % len(TARJETAS)], 'expiration_month': i % 12 + 1,
+                               'expiration_year': date.today().year + 1 + i % 5}}
+
+
+async def por_peticion(http: httpx.AsyncClient, segundos: float) -> float:
+    ordenes, inicio = 0, time.perf_counter()
+    while time.perf_counter() - inicio < segundos:
+        respuesta = await http.post('/order', json=orden_sintetica(ordenes))
+        respuesta.raise_for_status()
+        ordenes += 1
+    return ordenes / (time.perf_counter() - inicio)
+
+
+async def por_lote(http: httpx.AsyncClient, tamano: int, segundos: float) -> float:
+    lote = [orden_sintetica(i) for i in range(tamano)]
+    ordenes, inicio = 0, time.perf_counter()
+    while time.perf_counter() - inicio < segundos:
+        respuesta = await http.post('/orders/batch', json=lote)
+        respuesta.raise_for_status()
+        ordenes += len(respuesta.json()['accepted'])
+    return ordenes / (time.perf_counter() - inicio)
+
+
+def sin_http(cantidad: int) -> float:
+    """Microsegundos por orden con Order.parse_obj"""
+    ordenes = [orden_sintetica(i) for i in range(cantidad)]
+    inicio = time.perf_counter()
+    for orden in ordenes:
+        validation.Order.parse_obj(orden)
+    return (time.perf_counter() - inicio) / cantidad * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--tamanos', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--segundos', type=float, default=5)
+    argumentos = parser.parse_args()
+
+    print(f'Order.parse_obj: {sin_http(20000):.1f} µs por orden')
+
+    async def correr() -> None:
+        transporte = httpx.ASGITransport(app=validation.app)
+        async with httpx.AsyncClient(transport=transporte, base_url='http://bench') as http:
+            base = await por_peticion(http, argumentos.segundos)
+            print(f'{"modo":>16} {"órdenes/s":>12} {"mejora":>7}')
+            print(f'{"POST /order":>16} {base:>12.1f} {1:>6.1f}x')
+            for tamano in argumentos.tamanos:
+                resultado = await por_lote(http, tamano, argumentos.segundos)
+                print(f'{f"lote de {tamano}":>16} {resultado:>12.1f} {resultado / base:>6.1f}x')
+    asyncio.run(correr())
+
+
+if __name__ == '__main__':
+    main()
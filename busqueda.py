@@ -0,0 +1,191 @@
+"""
+Búsqueda
+
+Índice invertido incremental sobre el contenido de los tweets, con
+tokenización sin acentos ni mayúsculas y ranking BM25. El índice se
+guarda en un segmento comprimido para no reindexar todo al reiniciar;
+al cargarlo solo se reindexan los tweets que cambiaron desde entonces.
+"""
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+import heapq, math, os, re, threading, time, unicodedata, zlib
+import orjson
+
+_PALABRA = re.compile(r'\w+')
+_MAGIA = b'TWIDX1\n'
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas y sin acentos: 'Canción' → 'cancion'"""
+    texto = unicodedata.normalize('NFKD', texto.lower())
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+
+def tokenizar(texto: str) -> List[str]:
+    """Normalizado y separado en palabras"""
+    return _PALABRA.findall(normalizar(texto))
+
+
+def huella(texto: str) -> int:
+    return zlib.crc32(texto.encode('utf-8'))
+
+
+class IndiceInvertido:
+    """Término → {id_tweet: frecuencia}, con longitudes de documento para BM25"""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._longitudes: Dict[str, int] = {}
+        self._huellas: Dict[str, int] = {}
+        self._total_longitud = 0
+        self._cambios = 0
+        self._bloqueo = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._longitudes)
+
+    # Escritura
+
+    def agregar(self, id_tweet: str, texto: str) -> None:
+        terminos = tokenizar(texto)
+        with self._bloqueo:
+            if id_tweet in self._longitudes:
+                self.quitar(id_tweet)
+            for termino in terminos:
+                documentos = self._postings[termino]
+                documentos[id_tweet] = documentos.get(id_tweet, 0) + 1
+            self._longitudes[id_tweet] = len(terminos)
+            self._huellas[id_tweet] = huella(texto)
+            self._total_longitud += len(terminos)
+            self._cambios += 1
+
+    def quitar(self, id_tweet: str, texto: Optional[str] = None) -> None:
+        """Quita un tweet; sin el texto original se recorre todo el vocabulario"""
+        with self._bloqueo:
+            if id_tweet not in self._longitudes:
+                return
+            terminos = set(tokenizar(texto)) if texto is not None else list(self._postings)
+            for termino in terminos:
+                documentos = self._postings.get(termino)
+                if documentos is not None and documentos.pop(id_tweet, None) is not None and not documentos:
+                    del self._postings[termino]
+            self._total_longitud -= self._longitudes.pop(id_tweet)
+            del self._huellas[id_tweet]
+            self._cambios += 1
+
+    def quitar_varios(self, ids: Iterable[str]) -> None:
+        """Quita varios tweets sin su texto con una sola pasada por el vocabulario"""
+        with self._bloqueo:
+            ids = {id_tweet for id_tweet in ids if id_tweet in self._longitudes}
+            if not ids:
+                return
+            for termino in list(self._postings):
+                documentos = self._postings[termino]
+                for id_tweet in documentos.keys() & ids:
+                    del documentos[id_tweet]
+                if not documentos:
+                    del self._postings[termino]
+            for id_tweet in ids:
+                self._total_longitud -= self._longitudes.pop(id_tweet)
+                del self._huellas[id_tweet]
+            self._cambios += len(ids)
+
+    def al_cambiar_tweet(self, anterior: Optional[dict], nuevo: Optional[dict]) -> None:
+        """Suscriptor del repositorio de tweets"""
+        if anterior is not None and (nuevo is None or anterior['contenido'] != nuevo['contenido']):
+            self.quitar(anterior['id_tweet'], anterior['contenido'])
+        if nuevo is not None and (anterior is None or anterior['contenido'] != nuevo['contenido']):
+            self.agregar(nuevo['id_tweet'], nuevo['contenido'])
+
+    def sincronizar(self, tweets: Iterable[dict]) -> int:
+        """Reindexa solo los tweets nuevos o modificados y quita los que ya no existen"""
+        cambiados, vigentes = [], set()
+        for tweet in tweets:
+            vigentes.add(tweet['id_tweet'])
+            if self._huellas.get(tweet['id_tweet']) != huella(tweet['contenido']):
+                cambiados.append(tweet)
+        with self._bloqueo:
+            sobrantes = [id_tweet for id_tweet in self._longitudes if id_tweet not in vigentes]
+            # Sin el texto anterior, quitarlos uno por uno recorrería el vocabulario cada vez
+            self.quitar_varios(sobrantes + [tweet['id_tweet'] for tweet in cambiados])
+        for tweet in cambiados:
+            self.agregar(tweet['id_tweet'], tweet['contenido'])
+        return len(cambiados) + len(sobrantes)
+
+    # Consulta
+
+    def buscar(self, consulta: str, limite: int) -> List[Tuple[float, str]]:
+        """Regresa (puntaje, id_tweet) de los mejores `limite` resultados BM25"""
+        puntajes: Dict[str, float] = defaultdict(float)
+        with self._bloqueo:
+            total = len(self._longitudes)
+            if total == 0:
+                return []
+            promedio = self._total_longitud / total
+            for termino in set(tokenizar(consulta)):
+                documentos = self._postings.get(termino)
+                if not documentos:
+                    continue
+                idf = math.log(1 + (total - len(documentos) + 0.5) / (len(documentos) + 0.5))
+                for id_tweet, frecuencia in documentos.items():
+                    normalizacion = self.k1 * (1 - self.b + self.b * self._longitudes[id_tweet] / promedio)
+                    puntajes[id_tweet] += idf * frecuencia * (self.k1 + 1) / (frecuencia + normalizacion)
+        return heapq.nlargest(limite, ((p, i) for i, p in puntajes.items()))
+
+    # Segmento en disco
+
+    def guardar(self, ruta: str) -> None:
+        """
+        Escribe el segmento: tabla de documentos (id, longitud, huella) y
+        postings como pares [posición del documento, frecuencia], todo
+        comprimido con zlib. Se reemplaza el archivo de forma atómica.
+        """
+        with self._bloqueo:
+            ids = list(self._longitudes)
+            posiciones = {id_tweet: i for i, id_tweet in enumerate(ids)}
+            segmento = {
+                'documentos': [[i, self._longitudes[i], self._huellas[i]] for i in ids],
+                'postings': {termino: [x for id_tweet, f in documentos.items() for x in (posiciones[id_tweet], f)]
+                             for termino, documentos in self._postings.items()},
+            }
+            self._cambios = 0
+        datos = zlib.compress(orjson.dumps(segmento))
+        temporal = f'{ruta}.{os.getpid()}.tmp'
+        with open(temporal, 'wb') as f:
+            f.write(_MAGIA + datos)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, ruta)
+
+    @classmethod
+    def cargar(cls, ruta: str) -> 'IndiceInvertido':
+        """Lee un segmento; si no existe o está dañado regresa un índice vacío"""
+        indice = cls()
+        try:
+            with open(ruta, 'rb') as f:
+                datos = f.read()
+            if not datos.startswith(_MAGIA):
+                return indice
+            segmento = orjson.loads(zlib.decompress(datos[len(_MAGIA):]))
+        except (OSError, ValueError, zlib.error):
+            return indice
+
+        ids = [id_tweet for id_tweet, _, _ in segmento['documentos']]
+        for id_tweet, longitud, huella_documento in segmento['documentos']:
+            indice._longitudes[id_tweet] = longitud
+            indice._huellas[id_tweet] = huella_documento
+            indice._total_longitud += longitud
+        for termino, pares in segmento['postings'].items():
+            indice._postings[termino] = {ids[pares[i]]: pares[i + 1] for i in range(0, len(pares), 2)}
+        return indice
+
+    def guardar_periodicamente(self, ruta: str, intervalo: float) -> None:
+        """Guarda el segmento cada `intervalo` segundos si hubo cambios"""
+        def ciclo() -> None:
+            while True:
+                time.sleep(intervalo)
+                if self._cambios:
+                    self.guardar(ruta)
+        threading.Thread(target=ciclo, name='segmento-busqueda', daemon=True).start()
@@ -0,0 +1,134 @@
+"""
+Cache de respuestas
+
+Cuerpos JSON ya codificados de las lecturas por id (usuarios y tweets),
+con su ETag, en un LRU acotado con TTL. Cada entrada lleva etiquetas
+(p. ej. 'usuario:<id>' en los tweets de ese autor) y se invalida cuando
+cambia cualquiera de los registros etiquetados.
+"""
+from collections import OrderedDict, defaultdict
+from typing import Dict, Iterable, NamedTuple, Optional, Set
+import hashlib, threading, time
+
+
+class Entrada(NamedTuple):
+    cuerpo: bytes
+    etag: str
+    expira: float
+    etiquetas: frozenset
+
+
+def calcular_etag(cuerpo: bytes) -> str:
+    return '"' + hashlib.blake2b(cuerpo, digest_size=12).hexdigest() + '"'
+
+
+class Generaciones:
+    """
+    Invalidaciones recientes por llave, para no guardar en un cache algo
+    leído antes de que cambiara: se toma marca() antes de leer y se
+    consulta vigente() antes de guardar. Recuerda las últimas `capacidad`
+    llaves invalidadas; una marca anterior a la más nueva de las
+    olvidadas ya no es vigente. Quien la usa la protege con su bloqueo.
+    """
+
+    def __init__(self, capacidad: int = 10000) -> None:
+        self.capacidad = capacidad
+        self._actual = 0
+        self._ultimas: 'OrderedDict[str, int]' = OrderedDict()
+        self._olvidada = 0
+
+    def marca(self) -> int:
+        return self._actual
+
+    def invalidar(self, llave: str) -> None:
+        self._actual += 1
+        self._ultimas[llave] = self._actual
+        self._ultimas.move_to_end(llave)
+        if len(self._ultimas) > self.capacidad:
+            _, self._olvidada = self._ultimas.popitem(last=False)
+
+    def vigente(self, marca: int, llaves: Iterable[str]) -> bool:
+        """Si ninguna de las llaves se invalidó después de `marca`"""
+        if marca < self._olvidada:
+            return False
+        return all(self._ultimas.get(llave, 0) <= marca for llave in llaves)
+
+
+class CacheRespuestas:
+    """LRU llave → Entrada, con expiración e invalidación por etiqueta"""
+
+    def __init__(self, capacidad: int = 10000, ttl: float = 60) -> None:
+        self.capacidad = capacidad
+        self.ttl = ttl
+        self._entradas: 'OrderedDict[str, Entrada]' = OrderedDict()
+        self._por_etiqueta: Dict[str, Set[str]] = defaultdict(set)
+        self._generaciones = Generaciones(capacidad)
+        self._bloqueo = threading.Lock()
+        self.estadisticas = {'aciertos': 0, 'fallos': 0, 'desalojos': 0,
+                             'expiraciones': 0, 'invalidaciones': 0, 'no_modificados': 0}
+
+    def __len__(self) -> int:
+        return len(self._entradas)
+
+    def marca(self) -> int:
+        """Se toma antes de generar una respuesta y se pasa a guardar()"""
+        return self._generaciones.marca()
+
+    def obtener(self, llave: str) -> Optional[Entrada]:
+        with self._bloqueo:
+            entrada = self._entradas.get(llave)
+            if entrada is not None and entrada.expira < time.monotonic():
+                self._quitar(llave)
+                self.estadisticas['expiraciones'] += 1
+                entrada = None
+            if entrada is None:
+                self.estadisticas['fallos'] += 1
+                return None
+            self._entradas.move_to_end(llave)
+            self.estadisticas['aciertos'] += 1
+            return entrada
+
+    def guardar(self, llave: str, cuerpo: bytes, etiquetas: Iterable[str], marca: int) -> Entrada:
+        """
+        Guarda la respuesta y la regresa. Si alguna de sus etiquetas se
+        invalidó desde `marca` la respuesta podría ser vieja y no se guarda.
+        """
+        entrada = Entrada(cuerpo, calcular_etag(cuerpo), time.monotonic() + self.ttl,
+                          frozenset(etiquetas) | {llave})
+        with self._bloqueo:
+            if not self._generaciones.vigente(marca, entrada.etiquetas):
+                return entrada
+            self._quitar(llave)
+            self._entradas[llave] = entrada
+            for etiqueta in entrada.etiquetas:
+                self._por_etiqueta[etiqueta].add(llave)
+            while len(self._entradas) > self.capacidad:
+                self._quitar(next(iter(self._entradas)))
+                self.estadisticas['desalojos'] += 1
+        return entrada
+
+    def invalidar(self, etiqueta: str) -> None:
+        with self._bloqueo:
+            self._generaciones.invalidar(etiqueta)
+            for llave in list(self._por_etiqueta.get(etiqueta, ())):
+                self._quitar(llave)
+                self.estadisticas['invalidaciones'] += 1
+
+    def _quitar(self, llave: str) -> None:
+        entrada = self._entradas.pop(llave, None)
+        if entrada is None:
+            return
+        for etiqueta in entrada.etiquetas:
+            llaves = self._por_etiqueta.get(etiqueta)
+            if llaves is not None:
+                llaves.discard(llave)
+                if not llaves:
+                    del self._por_etiqueta[etiqueta]
+
+    # Suscriptores de los repositorios
+
+    def al_cambiar_usuario(self, anterior: Optional[dict], nuevo: Optional[dict]) -> None:
+        self.invalidar('usuario:' + (anterior or nuevo)['id_usuario'])
+
+    def al_cambiar_tweet(self, anterior: Optional[dict], nuevo: Optional[dict]) -> None:
+        self.invalidar('tweet:' + (anterior or nuevo)['id_tweet'])
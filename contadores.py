@@ -0,0 +1,205 @@
+"""
+Contadores de interacciones
+
+Likes, retweets y respuestas de cada tweet. No se guardan en el registro
+del tweet: un tweet viral recibiría miles de reescrituras por segundo,
+todas contra la misma fila y contra sus propias ediciones. Viven en una
+tabla aparte, `contadores (id, tipo, valor)`, y en memoria:
+
+- cada incremento solo suma en el fragmento (por id de tweet) que le
+  toca, con su propio bloqueo, así que los tweets no compiten entre sí;
+- un hilo vuelca cada `intervalo` segundos lo acumulado en una sola
+  transacción del escritor, una fila por (tweet, tipo) sin importar
+  cuántos incrementos hubo;
+- la lectura suma el valor durable y lo que está pendiente o en vuelo.
+
+El volcado suma en la base (UPSERT con valor = valor + delta), así que
+varios procesos pueden contar el mismo tweet sin coordinarse; con el
+registro de cambios activo, los demás releen los valores que cambiaron
+(ver sincronizacion.py). Lo pendiente se pierde si el proceso muere sin
+apagarse: a lo más `intervalo` segundos de interacciones.
+"""
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from almacenamiento import AlmacenSQLite, Registro
+import sqlite3, threading, warnings, zlib
+import metricas
+
+TIPOS = ('likes', 'retweets', 'respuestas')
+
+Llave = Tuple[str, str]
+
+
+class _Fragmento:
+    def __init__(self) -> None:
+        self.bloqueo = threading.Lock()
+        self.valores: Dict[Llave, int] = {}
+        self.pendientes: Dict[Llave, int] = defaultdict(int)
+        self.en_vuelo: Dict[Llave, int] = {}
+        # Tweets borrados mientras sus contadores estaban en vuelo
+        self.borrados: Set[str] = set()
+
+    def leer(self, llave: Llave) -> int:
+        return self.valores.get(llave, 0) + self.en_vuelo.get(llave, 0) + self.pendientes.get(llave, 0)
+
+
+class Contadores:
+    def __init__(self, almacen: AlmacenSQLite, fragmentos: int = 16, intervalo: float = 0.5) -> None:
+        self.almacen = almacen
+        self.intervalo = intervalo
+        self._fragmentos = [_Fragmento() for _ in range(max(1, fragmentos))]
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+        # Un solo volcado a la vez: el del hilo o el del apagado
+        self._volcando = threading.Lock()
+        with almacen.conexion() as conexion:
+            conexion.execute('CREATE TABLE IF NOT EXISTS contadores (id TEXT NOT NULL, tipo TEXT NOT NULL, '
+                             'valor INTEGER NOT NULL, PRIMARY KEY (id, tipo))')
+        for id_tweet, tipo, valor in almacen.conexion().execute('SELECT id, tipo, valor FROM contadores'):
+            self._fragmento(id_tweet).valores[(id_tweet, tipo)] = valor
+
+    def _indice(self, id_tweet: str) -> int:
+        # crc32 y no hash(): el mismo tweet cae en el mismo fragmento en todos los procesos
+        return zlib.crc32(id_tweet.encode('utf-8')) % len(self._fragmentos)
+
+    def _fragmento(self, id_tweet: str) -> _Fragmento:
+        return self._fragmentos[self._indice(id_tweet)]
+
+    def incrementar(self, id_tweet: str, tipo: str, delta: int = 1) -> Optional[Dict[str, int]]:
+        """
+        Suma `delta` y regresa los contadores del tweet ya con el cambio.
+        Un decremento que dejaría el contador en negativo no se aplica y
+        regresa None.
+        """
+        fragmento = self._fragmento(id_tweet)
+        with fragmento.bloqueo:
+            if fragmento.leer((id_tweet, tipo)) + delta < 0:
+                return None
+            fragmento.pendientes[(id_tweet, tipo)] += delta
+            contadores = {t: max(0, fragmento.leer((id_tweet, t))) for t in TIPOS}
+        metricas.incrementos_contadores.incrementar(tipo=tipo)
+        return contadores
+
+    def obtener(self, id_tweet: str) -> Dict[str, int]:
+        fragmento = self._fragmento(id_tweet)
+        with fragmento.bloqueo:
+            # Con varios procesos, dos pueden quitar a la vez el último like
+            # antes de ver el volcado del otro; la base no baja de 0
+            return {tipo: max(0, fragmento.leer((id_tweet, tipo))) for tipo in TIPOS}
+
+    def borrar(self, id_tweet: str) -> None:
+        """Descarta los contadores de un tweet borrado, también los pendientes"""
+        fragmento = self._fragmento(id_tweet)
+        with fragmento.bloqueo:
+            for tipo in TIPOS:
+                fragmento.valores.pop((id_tweet, tipo), None)
+                fragmento.pendientes.pop((id_tweet, tipo), None)
+                if (id_tweet, tipo) in fragmento.en_vuelo:
+                    fragmento.borrados.add(id_tweet)
+        self._borrar_filas([id_tweet])
+
+    def _borrar_filas(self, ids: List[str]) -> None:
+        def operacion(conexion: sqlite3.Connection) -> None:
+            conexion.executemany('DELETE FROM contadores WHERE id = ?', ((id_tweet,) for id_tweet in ids))
+        self.almacen.escritor.encolar(operacion)
+
+    def al_cambiar_tweet(self, anterior: Optional[Registro], nuevo: Optional[Registro]) -> None:
+        """Suscriptor del repositorio de tweets"""
+        if anterior is not None and nuevo is None:
+            self.borrar(anterior['id_tweet'])
+
+    # Volcado
+
+    def volcar(self) -> int:
+        """Escribe lo pendiente de todos los fragmentos en una transacción; regresa cuántas filas"""
+        with self._volcando:
+            volcados: List[_Fragmento] = []
+            for fragmento in self._fragmentos:
+                with fragmento.bloqueo:
+                    if fragmento.pendientes:
+                        fragmento.en_vuelo, fragmento.pendientes = dict(fragmento.pendientes), defaultdict(int)
+                        volcados.append(fragmento)
+            filas = [(id_tweet, tipo, delta) for fragmento in volcados
+                     for (id_tweet, tipo), delta in fragmento.en_vuelo.items() if delta]
+            if not filas:
+                for fragmento in volcados:
+                    with fragmento.bloqueo:
+                        fragmento.en_vuelo = {}
+                return 0
+            try:
+                valores = self.almacen.escritor.encolar(lambda conexion: self._sumar(conexion, filas)).result()
+            except Exception:
+                # Se devuelven a pendientes para el siguiente volcado
+                for fragmento in volcados:
+                    with fragmento.bloqueo:
+                        for llave, delta in fragmento.en_vuelo.items():
+                            fragmento.pendientes[llave] += delta
+                        fragmento.en_vuelo = {}
+                raise
+            borrados = []
+            for fragmento in volcados:
+                with fragmento.bloqueo:
+                    for llave in fragmento.en_vuelo:
+                        if llave in valores and llave[0] not in fragmento.borrados:
+                            fragmento.valores[llave] = valores[llave]
+                    fragmento.en_vuelo = {}
+                    borrados.extend(fragmento.borrados)
+                    fragmento.borrados = set()
+            if borrados:
+                # El volcado pudo haber vuelto a crear sus filas
+                self._borrar_filas(borrados)
+        metricas.filas_volcado_contadores.observar(len(filas))
+        return len(filas)
+
+    def _sumar(self, conexion: sqlite3.Connection, filas: List[Tuple[str, str, int]]) -> Dict[Llave, int]:
+        valores = {}
+        for id_tweet, tipo, delta in filas:
+            valores[(id_tweet, tipo)] = conexion.execute(
+                'INSERT INTO contadores (id, tipo, valor) VALUES (?, ?, MAX(0, ?)) '
+                'ON CONFLICT (id, tipo) DO UPDATE SET valor = MAX(0, valor + ?) RETURNING valor',
+                (id_tweet, tipo, delta, delta)).fetchone()[0]
+        self.almacen.anotar_cambios(conexion, 'contadores', dict.fromkeys(id_tweet for id_tweet, _, _ in filas))
+        return valores
+
+    def recargar(self, ids: Iterable[str]) -> int:
+        """
+        Relee de la base los contadores de estos tweets (p. ej. porque otro
+        proceso volcó los suyos). Los que tienen un volcado en vuelo se
+        saltan: al terminar, el volcado deja el valor actual de la base.
+        """
+        por_fragmento: Dict[int, List[str]] = defaultdict(list)
+        for id_tweet in dict.fromkeys(ids):
+            por_fragmento[self._indice(id_tweet)].append(id_tweet)
+        releidos = 0
+        for indice, ids_fragmento in por_fragmento.items():
+            fragmento = self._fragmentos[indice]
+            # Bajo el bloqueo para que un volcado no empiece entre la lectura y la asignación
+            with fragmento.bloqueo:
+                vigentes = [id_tweet for id_tweet in ids_fragmento
+                            if not any((id_tweet, tipo) in fragmento.en_vuelo for tipo in TIPOS)]
+                for inicio in range(0, len(vigentes), 500):
+                    bloque = vigentes[inicio:inicio + 500]
+                    marcas = ', '.join('?' * len(bloque))
+                    for id_tweet, tipo, valor in self.almacen.conexion().execute(
+                            f'SELECT id, tipo, valor FROM contadores WHERE id IN ({marcas})', bloque):
+                        fragmento.valores[(id_tweet, tipo)] = valor
+                releidos += len(vigentes)
+        return releidos
+
+    def iniciar(self) -> None:
+        self._hilo = threading.Thread(target=self._ciclo, name='contadores', daemon=True)
+        self._hilo.start()
+
+    def detener(self) -> None:
+        """Detiene el hilo y vuelca lo que quede pendiente"""
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join()
+        self.volcar()
+
+    def _ciclo(self) -> None:
+        while not self._detener.wait(self.intervalo):
+            try:
+                self.volcar()
+            except Exception as error:
+                warnings.warn(f'Error al volcar contadores: {error!r}')
@@ -1,19 +1,166 @@
-import pymysql as ps
+"""
+Productos
+
+Tabla `productos` en MySQL. Todas las operaciones toman una conexión de
+un pool acotado, que revisa que siga viva antes de prestarla, y usan
+sentencias parametrizadas. Las inserciones masivas van en lotes con
+executemany.
+
+El pool recibe cualquier función que abra conexiones DB-API, así que
+se puede usar con sqlite3 como sustituto local (marcador='?').
+"""
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import threading, time
+
+COLUMNAS = ('nombre', 'categoria', 'uid', 'color', 'precio')
+Producto = Tuple[str, str, str, str, float]
+
+
+def iniciar_conexion(host='localhost', user='bdsw320', password='password', database='productos'):
+    import pymysql as ps
+    return ps.connect(host=host, user=user, password=password, database=database)
+
+
+class PoolConexiones:
+    """A lo más `tamano` conexiones abiertas, reutilizadas entre llamadas"""
+
+    def __init__(self, conectar: Callable = iniciar_conexion, tamano: int = 5, espera: float = 30) -> None:
+        self.conectar = conectar
+        self.tamano = tamano
+        self.espera = espera
+        self._libres: List = []
+        self._abiertas = 0
+        # Avisa a quien espera cuando se devuelve una conexión o se libera un lugar
+        self._condicion = threading.Condition()
+
+    @contextmanager
+    def conexion(self) -> Iterator:
+        """Presta una conexión; se confirma al salir o se deshace si hubo error"""
+        conexion = self._tomar()
+        try:
+            yield conexion
+            conexion.commit()
+        except Exception:
+            try:
+                conexion.rollback()
+            except Exception:
+                self._descartar(conexion)
+                raise
+            self._devolver(conexion)
+            raise
+        else:
+            self._devolver(conexion)
+
+    def cerrar(self) -> None:
+        with self._condicion:
+            libres, self._libres = self._libres, []
+        for conexion in libres:
+            self._descartar(conexion)
+
+    def _tomar(self):
+        limite = time.monotonic() + self.espera
+        while True:
+            with self._condicion:
+                if not self._condicion.wait_for(lambda: self._libres or self._abiertas < self.tamano,
+                                                limite - time.monotonic()):
+                    raise TimeoutError('No hay conexiones libres en el pool')
+                conexion = self._libres.pop() if self._libres else None
+                if conexion is None:
+                    self._abiertas += 1
+            if conexion is None:
+                try:
+                    return self.conectar()
+                except Exception:
+                    self._liberar_lugar()
+                    raise
+            if self._sana(conexion):
+                return conexion
+            self._descartar(conexion)
+
+    def _devolver(self, conexion) -> None:
+        with self._condicion:
+            self._libres.append(conexion)
+            self._condicion.notify()
+
+    def _liberar_lugar(self) -> None:
+        with self._condicion:
+            self._abiertas -= 1
+            self._condicion.notify()
+
+    def _sana(self, conexion) -> bool:
+        try:
+            if hasattr(conexion, 'ping'):
+                conexion.ping(reconnect=False)
+            else:
+                conexion.cursor().execute('SELECT 1')
+            return True
+        except Exception:
+            return False
+
+    def _descartar(self, conexion) -> None:
+        self._liberar_lugar()
+        try:
+            conexion.close()
+        except Exception:
+            pass
+
 
 class Productos:
-    def iniciar_conexion(self):
-        self.conexion = ps.connect(host='localhost',
-                                   user='bdsw320',
-                                   password='password',
-                                   database='productos')
-        
-        return self.conexion
-    
-    def crear(self, nombre, categoria, uid, color, precio):
-        self.conexion = self.iniciar_conexion()
-        self.cursor = self.conexion.cursor()
-        
-        sentencia_sql = f'INSERT INTO productos VALUES ("{nombre}", "{categoria}", "{uid}", "{color}", {precio})'
-        
-        self.cursor.execute(sentencia_sql)
-        self.conexion.commit()
\ No newline at end of file
+    def __init__(self, pool: Optional[PoolConexiones] = None, tamano_lote: int = 500,
+                 marcador: str = '%s') -> None:
+        self.pool = pool or PoolConexiones()
+        self.tamano_lote = tamano_lote
+        self.marcador = marcador
+
+    def crear(self, nombre, categoria, uid, color, precio) -> None:
+        self.crear_varios([(nombre, categoria, uid, color, precio)])
+
+    def crear_varios(self, productos: Iterable[Producto]) -> int:
+        """Inserta en lotes de `tamano_lote` filas, todo en una transacción"""
+        marcas = ', '.join([self.marcador] * len(COLUMNAS))
+        sentencia_sql = f'INSERT INTO productos ({", ".join(COLUMNAS)}) VALUES ({marcas})'
+        insertados, lote = 0, []
+        with self.pool.conexion() as conexion:
+            cursor = conexion.cursor()
+            for producto in productos:
+                lote.append(tuple(producto))
+                if len(lote) == self.tamano_lote:
+                    cursor.executemany(sentencia_sql, lote)
+                    insertados, lote = insertados + len(lote), []
+            if lote:
+                cursor.executemany(sentencia_sql, lote)
+                insertados += len(lote)
+        return insertados
+
+    def obtener(self, uid) -> Optional[Dict]:
+        with self.pool.conexion() as conexion:
+            cursor = conexion.cursor()
+            cursor.execute(f'SELECT {", ".join(COLUMNAS)} FROM productos WHERE uid = {self.marcador}', (uid,))
+            fila = cursor.fetchone()
+        return dict(zip(COLUMNAS, fila)) if fila else None
+
+    def listar(self) -> List[Dict]:
+        with self.pool.conexion() as conexion:
+            cursor = conexion.cursor()
+            cursor.execute(f'SELECT {", ".join(COLUMNAS)} FROM productos')
+            return [dict(zip(COLUMNAS, fila)) for fila in cursor.fetchall()]
+
+    def actualizar(self, uid, **campos) -> bool:
+        invalidos = set(campos) - set(COLUMNAS)
+        if invalidos:
+            raise ValueError(f'Columnas inválidas: {", ".join(sorted(invalidos))}')
+        if not campos:
+            return False
+        asignaciones = ', '.join(f'{columna} = {self.marcador}' for columna in campos)
+        with self.pool.conexion() as conexion:
+            cursor = conexion.cursor()
+            cursor.execute(f'UPDATE productos SET {asignaciones} WHERE uid = {self.marcador}',
+                           (*campos.values(), uid))
+            return cursor.rowcount > 0
+
+    def borrar(self, uid) -> bool:
+        with self.pool.conexion() as conexion:
+            cursor = conexion.cursor()
+            cursor.execute(f'DELETE FROM productos WHERE uid = {self.marcador}', (uid,))
+            return cursor.rowcount > 0
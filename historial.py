@@ -0,0 +1,118 @@
+"""
+Historial de ediciones
+
+El tweet guarda siempre su versión actual completa, así que leerlo no
+cuesta más que antes. Cada edición guarda además, en la tabla
+`ediciones`, un delta inverso: cómo obtener el contenido anterior a
+partir del nuevo. El historial se reconstruye solo cuando se pide,
+aplicando los deltas de la versión más nueva a la más vieja.
+
+Un delta es una lista de operaciones sobre el texto nuevo: un entero
+positivo copia esa cantidad de caracteres, uno negativo los salta y un
+texto se inserta tal cual. p. ej. [6, -5, "mundo"] convierte
+"Hola, gente" en "Hola, mundo".
+"""
+from datetime import datetime
+from difflib import SequenceMatcher
+from typing import List, Optional, Tuple, Union
+from almacenamiento import Operacion, Registro, RepositorioSQLite
+import json
+
+Delta = List[Union[int, str]]
+
+
+def calcular_delta(nuevo: str, anterior: str) -> Delta:
+    """Operaciones que convierten `nuevo` en `anterior`"""
+    delta: Delta = []
+
+    def agregar(operacion: Union[int, str]) -> None:
+        # Junta operaciones seguidas del mismo tipo
+        if delta and type(delta[-1]) is type(operacion) and (
+                isinstance(operacion, str) or (delta[-1] > 0) == (operacion > 0)):
+            delta[-1] += operacion
+        else:
+            delta.append(operacion)
+
+    for etiqueta, i1, i2, j1, j2 in SequenceMatcher(None, nuevo, anterior, autojunk=False).get_opcodes():
+        if etiqueta == 'equal':
+            agregar(i2 - i1)
+            continue
+        if i2 > i1:
+            agregar(i1 - i2)
+        if j2 > j1:
+            agregar(anterior[j1:j2])
+    # Si el texto cambió casi por completo, guardarlo entero es más corto
+    if nuevo and len(json.dumps(delta)) > len(json.dumps([-len(nuevo), anterior])):
+        return [-len(nuevo), anterior] if anterior else [-len(nuevo)]
+    return delta
+
+
+def aplicar_delta(nuevo: str, delta: Delta) -> str:
+    partes, posicion = [], 0
+    for operacion in delta:
+        if isinstance(operacion, str):
+            partes.append(operacion)
+        elif operacion > 0:
+            partes.append(nuevo[posicion:posicion + operacion])
+            posicion += operacion
+        else:
+            posicion -= operacion
+    return ''.join(partes)
+
+
+def version(tweet: Registro) -> int:
+    # Los tweets de antes del historial no tienen versión
+    return tweet.get('version') or 1
+
+
+class Historial:
+    """Ediciones de los tweets, guardadas en un repositorio de SQLite que no se carga en memoria"""
+
+    def __init__(self, repositorio: RepositorioSQLite) -> None:
+        self.repositorio = repositorio
+
+    @staticmethod
+    def id_edicion(id_tweet: str, numero: int) -> str:
+        return f'{id_tweet}:{numero:08d}'
+
+    def nueva_version(self, actual: Registro, nuevo: Registro) -> Tuple[Registro, Operacion]:
+        """
+        Regresa el tweet editado (con la versión siguiente, el timestamp_pub
+        original y timestamp_act) y la operación que guarda el delta, que
+        se pasa como `adicional` al reemplazar el tweet. La llave de la
+        edición es (tweet, versión): si otra edición del mismo tweet se
+        confirma antes, la inserción choca y se deshace todo el reemplazo.
+        """
+        numero = version(actual)
+        nuevo = dict(nuevo, version=numero + 1, timestamp_pub=actual['timestamp_pub'],
+                     timestamp_act=datetime.now())
+        edicion = {'id_edicion': self.id_edicion(actual['id_tweet'], numero),
+                   'id_tweet': actual['id_tweet'],
+                   'version': numero,
+                   'timestamp': actual.get('timestamp_act') or actual['timestamp_pub'],
+                   'delta': calcular_delta(nuevo['contenido'], actual['contenido'])}
+        return nuevo, self.repositorio.operacion_insertar(edicion)
+
+    def versiones(self, tweet: Registro, limite: Optional[int] = None) -> List[Registro]:
+        """Versiones del tweet, de la actual a la primera: {version, contenido, timestamp}"""
+        actual = version(tweet)
+        resultado = [{'version': actual, 'contenido': tweet['contenido'],
+                      'timestamp': tweet.get('timestamp_act') or tweet['timestamp_pub']}]
+        numeros = range(actual - 1, 0 if limite is None else max(0, actual - limite), -1)
+        ediciones = self.repositorio.obtener_varios(self.id_edicion(tweet['id_tweet'], n) for n in numeros)
+        contenido = tweet['contenido']
+        for numero in numeros:
+            edicion = ediciones.get(self.id_edicion(tweet['id_tweet'], numero))
+            if edicion is None:
+                break
+            contenido = aplicar_delta(contenido, edicion['delta'])
+            resultado.append({'version': numero, 'contenido': contenido, 'timestamp': edicion['timestamp']})
+        return resultado
+
+    # Suscriptor del repositorio de tweets
+
+    def al_cambiar_tweet(self, anterior: Optional[Registro], nuevo: Optional[Registro]) -> None:
+        # Al borrar un tweet se borran sus ediciones, sin esperar a que sea durable
+        if anterior is not None and nuevo is None:
+            for numero in range(1, version(anterior)):
+                self.repositorio.encolar_borrar(self.id_edicion(anterior['id_tweet'], numero))
@@ -0,0 +1,52 @@
+"""
+IDs
+
+IDs de 128 bits ordenables por tiempo, al estilo ULID:
+
+    48 bits  milisegundos desde la época Unix
+    16 bits  nodo (TWITTER_NODO, o uno al azar por proceso)
+    64 bits  contador que empieza en un valor al azar en cada milisegundo
+
+Dentro de un proceso los IDs son estrictamente crecientes aunque se
+generen varios en el mismo milisegundo o el reloj retroceda, y el nodo
+evita colisiones entre workers. Se codifican en base32 de Crockford (26
+caracteres), cuyo orden alfabético coincide con el orden de creación.
+"""
+import base64, os, secrets, threading, time
+
+_BASE32 = b'ABCDEFGHIJKLMNOPQRSTUVWXYZ234567'
+_CROCKFORD = b'0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+_TRADUCCION = bytes.maketrans(_BASE32, _CROCKFORD)
+_MAX_CONTADOR = (1 << 64) - 1
+
+
+class GeneradorIds:
+    """Genera IDs crecientes para un nodo"""
+
+    def __init__(self, nodo: int) -> None:
+        if not 0 <= nodo < 1 << 16:
+            raise ValueError('El nodo debe estar entre 0 y 65535')
+        self.nodo = nodo
+        self._ultimo_ms = 0
+        self._contador = 0
+        self._bloqueo = threading.Lock()
+
+    def nuevo(self) -> str:
+        with self._bloqueo:
+            ms = time.time_ns() // 1_000_000
+            if ms > self._ultimo_ms:
+                # La mitad superior queda libre para no desbordar el contador
+                self._ultimo_ms, self._contador = ms, secrets.randbits(63)
+            elif self._contador < _MAX_CONTADOR:
+                self._contador += 1
+            else:
+                self._ultimo_ms, self._contador = self._ultimo_ms + 1, secrets.randbits(63)
+            valor = (self._ultimo_ms << 80) | (self.nodo << 64) | self._contador
+        return base64.b32encode(valor.to_bytes(16, 'big'))[:26].translate(_TRADUCCION).decode('ascii')
+
+
+_generador = GeneradorIds(int(os.environ.get('TWITTER_NODO', secrets.randbits(16))))
+
+
+def nuevo_id() -> str:
+    return _generador.nuevo()
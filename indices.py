@@ -0,0 +1,523 @@
+"""
+Índices
+
+Índices residentes en memoria sobre los repositorios de almacenamiento.
+Se cargan una sola vez al iniciar y se mantienen sincronizados con cada
+escritura, de modo que las consultas por llave no tocan el disco.
+"""
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from almacenamiento import Operacion, Registro, RegistroDuplicado, Repositorio, serializar
+import base64, bisect, json, threading, time
+
+
+def normalizar(registro: Registro) -> Registro:
+    # Mismo formato que regresa el almacenamiento (fechas como texto)
+    return json.loads(serializar(registro))
+
+
+# Cursores
+
+def codificar_cursor(clave: Tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(clave).encode('utf-8')).decode('ascii')
+
+
+def decodificar_cursor(cursor: str, longitud: int) -> Tuple:
+    """
+    Regresa la clave de un cursor; ValueError si no es válido. Las claves
+    son tuplas de `longitud` textos: cualquier otra cosa fallaría al
+    compararse con las del índice.
+    """
+    try:
+        clave = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (TypeError, ValueError, UnicodeError) as error:
+        raise ValueError('Cursor inválido') from error
+    if not isinstance(clave, list) or len(clave) != longitud or not all(isinstance(v, str) for v in clave):
+        raise ValueError('Cursor inválido')
+    return tuple(clave)
+
+
+# Índices secundarios
+
+class Indice:
+    """Interfaz de los índices que mantiene RepositorioIndexado"""
+
+    def cargar(self, registros: Iterable[Registro]) -> None:
+        for registro in registros:
+            self.agregar(registro)
+
+    def verificar(self, registro: Registro) -> None:
+        pass
+
+    def reservar(self, registro: Registro) -> None:
+        pass
+
+    def liberar(self, registro: Registro) -> None:
+        pass
+
+    def agregar(self, registro: Registro) -> None:
+        raise NotImplementedError
+
+    def agregar_varios(self, registros: List[Registro]) -> None:
+        for registro in registros:
+            self.agregar(registro)
+
+    def quitar(self, registro: Registro) -> None:
+        raise NotImplementedError
+
+
+class IndiceUnico(Indice):
+    """Índice secundario valor → llave primaria para un campo sin repetidos"""
+
+    def __init__(self, campo: str, llave: str) -> None:
+        self.campo = campo
+        self.llave = llave
+        self._ids: Dict[str, str] = {}
+        # Valores de escrituras encoladas que todavía no son durables
+        self._reservas: Dict[str, str] = {}
+
+    @staticmethod
+    def clave(valor) -> str:
+        return str(valor).lower()
+
+    def obtener(self, valor) -> Optional[str]:
+        return self._ids.get(self.clave(valor))
+
+    def verificar(self, registro: Registro) -> None:
+        clave, id_registro = self.clave(registro[self.campo]), str(registro[self.llave])
+        for ids in (self._ids, self._reservas):
+            id_existente = ids.get(clave)
+            if id_existente is not None and id_existente != id_registro:
+                raise RegistroDuplicado(registro[self.campo])
+
+    def reservar(self, registro: Registro) -> None:
+        self._reservas[self.clave(registro[self.campo])] = str(registro[self.llave])
+
+    def liberar(self, registro: Registro) -> None:
+        clave = self.clave(registro[self.campo])
+        if self._reservas.get(clave) == str(registro[self.llave]):
+            del self._reservas[clave]
+
+    def agregar(self, registro: Registro) -> None:
+        self._ids[self.clave(registro[self.campo])] = str(registro[self.llave])
+
+    def quitar(self, registro: Registro) -> None:
+        self._ids.pop(self.clave(registro[self.campo]), None)
+
+
+class IndiceOrdenado(Indice):
+    """
+    Claves ordenadas para paginar por cursor (keyset).
+
+    La clave de cada registro es una tupla cuyo último elemento es la
+    llave primaria, p. ej. (timestamp_pub, id_tweet).
+    """
+
+    def __init__(self, clave: Callable[[Registro], Tuple]) -> None:
+        self.clave = clave
+        self._claves: List[Tuple] = []
+
+    def cargar(self, registros: Iterable[Registro]) -> None:
+        self._claves.extend(self.clave(registro) for registro in registros)
+        self._claves.sort()
+
+    def agregar(self, registro: Registro) -> None:
+        bisect.insort(self._claves, self.clave(registro))
+
+    def agregar_varios(self, registros: List[Registro]) -> None:
+        # insort sería O(n) por registro; timsort aprovecha los tramos ya ordenados
+        self._claves.extend(self.clave(registro) for registro in registros)
+        self._claves.sort()
+
+    def quitar(self, registro: Registro) -> None:
+        clave = self.clave(registro)
+        posicion = bisect.bisect_left(self._claves, clave)
+        if posicion < len(self._claves) and self._claves[posicion] == clave:
+            del self._claves[posicion]
+
+    def pagina(self, despues: Optional[Tuple], limite: int) -> List[Tuple]:
+        """Hasta `limite` claves estrictamente posteriores a `despues`"""
+        inicio = bisect.bisect_right(self._claves, despues) if despues else 0
+        return self._claves[inicio:inicio + limite]
+
+
+class IndiceAgrupado(Indice):
+    """
+    Claves ordenadas por grupo, p. ej. id_autor → [(timestamp_pub, id_tweet)].
+
+    Como en IndiceOrdenado, el último elemento de la clave es la llave
+    primaria. Una página dentro de un grupo cuesta O(log n + límite),
+    sin importar cuántos registros haya en total.
+    """
+
+    def __init__(self, grupo: Callable[[Registro], str], clave: Callable[[Registro], Tuple]) -> None:
+        self.grupo = grupo
+        self.clave = clave
+        self._grupos: Dict[str, List[Tuple]] = {}
+
+    def cargar(self, registros: Iterable[Registro]) -> None:
+        for registro in registros:
+            self._grupos.setdefault(self.grupo(registro), []).append(self.clave(registro))
+        for claves in self._grupos.values():
+            claves.sort()
+
+    def agregar(self, registro: Registro) -> None:
+        bisect.insort(self._grupos.setdefault(self.grupo(registro), []), self.clave(registro))
+
+    def agregar_varios(self, registros: List[Registro]) -> None:
+        tocados = set()
+        for registro in registros:
+            grupo = self.grupo(registro)
+            self._grupos.setdefault(grupo, []).append(self.clave(registro))
+            tocados.add(grupo)
+        for grupo in tocados:
+            self._grupos[grupo].sort()
+
+    def quitar(self, registro: Registro) -> None:
+        grupo, clave = self.grupo(registro), self.clave(registro)
+        claves = self._grupos.get(grupo)
+        if claves is None:
+            return
+        posicion = bisect.bisect_left(claves, clave)
+        if posicion < len(claves) and claves[posicion] == clave:
+            del claves[posicion]
+        if not claves:
+            del self._grupos[grupo]
+
+    def contar(self, grupo: str) -> int:
+        return len(self._grupos.get(grupo, ()))
+
+    def anteriores(self, grupo: str, antes: Optional[Tuple], limite: int) -> List[Tuple]:
+        """Hasta `limite` claves del grupo estrictamente anteriores a `antes`, de la mayor a la menor"""
+        claves = self._grupos.get(grupo, [])
+        fin = bisect.bisect_left(claves, antes) if antes else len(claves)
+        return claves[max(0, fin - limite):fin][::-1]
+
+
+# Repositorio en memoria
+
+# Cuántos ids ausentes recuerda cada repositorio compartido
+MAXIMO_AUSENTES = 10000
+
+class RepositorioIndexado(Repositorio):
+    """
+    Repositorio con un índice primario (dict) sobre otro repositorio.
+
+    Las lecturas se resuelven en memoria en O(1). Las escrituras se
+    encolan en el repositorio base y se reflejan en memoria hasta que son
+    durables; mientras tanto, la llave y los valores únicos quedan
+    reservados para que dos escrituras concurrentes no choquen.
+
+    Con `compartido` otros procesos escriben en la misma base: después de
+    cada escritura el registro se vuelve a leer del repositorio base en
+    lugar de aplicar lo que se escribió, de modo que si dos procesos
+    escriben el mismo registro todos terminan con la última versión.
+    Un id que no está en memoria se busca en la base sin bloquear a los
+    demás, y si tampoco está ahí no se vuelve a buscar durante
+    `vigencia_ausentes` segundos.
+
+    `registros` es el contenido inicial si ya se tiene (p. ej. de una
+    instantánea); si no, se lee todo el repositorio base.
+    """
+
+    def __init__(self, base: Repositorio, indices: Optional[Dict[str, Indice]] = None,
+                 compartido: bool = False, registros: Optional[Iterable[Registro]] = None,
+                 vigencia_ausentes: float = 0.05) -> None:
+        self.base = base
+        self.llave = base.llave
+        self.indices = indices or {}
+        self.compartido = compartido
+        self.vigencia_ausentes = vigencia_ausentes
+        self._bloqueo = threading.RLock()
+        self._recargando = threading.Lock()
+        self._insertando: Set[str] = set()
+        # id → cuándo se buscó en la base sin encontrarlo (modo compartido)
+        self._ausentes: 'OrderedDict[str, float]' = OrderedDict()
+        self._suscriptores: List[Callable[[Optional[Registro], Optional[Registro]], None]] = []
+        if registros is None:
+            registros = base.listar()
+        self._registros: Dict[str, Registro] = {str(r[self.llave]): r for r in registros}
+        for indice in self.indices.values():
+            indice.cargar(self._registros.values())
+
+    def obtener(self, id_registro: str) -> Optional[Registro]:
+        registro = self._registros.get(id_registro)
+        if registro is None and self.compartido:
+            registro = self._releer(id_registro)
+        return registro
+
+    def obtener_varios(self, ids: Iterable[str]) -> Dict[str, Registro]:
+        obtener = self.obtener if self.compartido else self._registros.get
+        encontrados = ((id_registro, obtener(id_registro)) for id_registro in ids)
+        return {id_registro: registro for id_registro, registro in encontrados if registro is not None}
+
+    def buscar(self, indice: str, valor) -> Optional[Registro]:
+        """Busca un registro por un índice secundario"""
+        id_registro = self.indices[indice].obtener(valor)
+        return None if id_registro is None else self._registros.get(id_registro)
+
+    def listar(self) -> Iterator[Registro]:
+        return iter(list(self._registros.values()))
+
+    def recorrer(self, indice: str, despues: Optional[Tuple] = None,
+                 limite: Optional[int] = None, bloque: int = 1000) -> Iterator[Tuple[Tuple, Registro]]:
+        """
+        Recorre (clave, registro) en el orden de un IndiceOrdenado a partir
+        de `despues`. Cada bloque se vuelve a buscar por clave, así que las
+        escrituras concurrentes no invalidan el recorrido.
+        """
+        ordenado = self.indices[indice]
+        restantes = limite
+        while restantes is None or restantes > 0:
+            claves = ordenado.pagina(despues, bloque if restantes is None else min(bloque, restantes))
+            if not claves:
+                return
+            for clave in claves:
+                registro = self._registros.get(clave[-1])
+                if registro is not None:
+                    yield clave, registro
+            if restantes is not None:
+                restantes -= len(claves)
+            despues = claves[-1]
+
+    def insertar(self, registro: Registro) -> None:
+        self.encolar_insertar(registro).result()
+
+    def reemplazar(self, id_registro: str, registro: Registro, adicional: Optional[Operacion] = None) -> bool:
+        return self.encolar_reemplazar(id_registro, registro, adicional).result()
+
+    def borrar(self, id_registro: str) -> Optional[Registro]:
+        return self.encolar_borrar(id_registro).result()
+
+    def encolar_insertar(self, registro: Registro) -> Future:
+        registro = normalizar(registro)
+        id_registro = str(registro[self.llave])
+        with self._bloqueo:
+            if id_registro in self._registros or id_registro in self._insertando:
+                raise RegistroDuplicado(id_registro)
+            self._reservar(registro)
+            self._insertando.add(id_registro)
+
+        def liberar() -> None:
+            with self._bloqueo:
+                self._insertando.discard(id_registro)
+                self._liberar(registro)
+        return self._encadenar(self.base.encolar_insertar(registro),
+                               lambda _: self._aplicar_durable(id_registro, registro), liberar)
+
+    def encolar_insertar_varios(self, registros: List[Registro]) -> Future:
+        """
+        Inserta varios registros en una sola transacción del repositorio
+        base. Los que chocan con una llave o valor único, existente o del
+        mismo lote, se rechazan sin llegar al almacenamiento; el Future
+        regresa None o el error de cada registro, en el mismo orden.
+        """
+        registros = [normalizar(registro) for registro in registros]
+        errores: List[Optional[Exception]] = [None] * len(registros)
+        aceptados: List[int] = []
+        with self._bloqueo:
+            for posicion, registro in enumerate(registros):
+                id_registro = str(registro[self.llave])
+                try:
+                    if id_registro in self._registros or id_registro in self._insertando:
+                        raise RegistroDuplicado(id_registro)
+                    self._reservar(registro)
+                except RegistroDuplicado as error:
+                    errores[posicion] = error
+                    continue
+                self._insertando.add(id_registro)
+                aceptados.append(posicion)
+
+        def aplicar(errores_base: List[Optional[Exception]]) -> None:
+            insertados = []
+            for posicion, error in zip(aceptados, errores_base):
+                errores[posicion] = error
+                if error is None:
+                    insertados.append(registros[posicion])
+            if self.compartido:
+                self.recargar(str(registro[self.llave]) for registro in insertados)
+            else:
+                self._aplicar_insertados(insertados)
+
+        def liberar() -> None:
+            with self._bloqueo:
+                for posicion in aceptados:
+                    self._insertando.discard(str(registros[posicion][self.llave]))
+                    self._liberar(registros[posicion])
+
+        futuro = Future()
+
+        def al_terminar(terminado: Future) -> None:
+            if terminado.exception() is not None:
+                futuro.set_exception(terminado.exception())
+            else:
+                futuro.set_result(errores)
+
+        self._encadenar(self.base.encolar_insertar_varios([registros[p] for p in aceptados]),
+                        aplicar, liberar).add_done_callback(al_terminar)
+        return futuro
+
+    def encolar_reemplazar(self, id_registro: str, registro: Registro,
+                           adicional: Optional[Operacion] = None) -> Future:
+        registro = normalizar(registro)
+        if self.compartido:
+            self._releer(id_registro)
+        with self._bloqueo:
+            if id_registro not in self._registros:
+                return _resuelto(False)
+            self._reservar(registro)
+        return self._encadenar(self.base.encolar_reemplazar(id_registro, registro, adicional),
+                               lambda reemplazado: reemplazado and self._aplicar_durable(id_registro, registro),
+                               lambda: self._liberar(registro))
+
+    def encolar_borrar(self, id_registro: str) -> Future:
+        if self.compartido:
+            self._releer(id_registro)
+        if id_registro not in self._registros:
+            return _resuelto(None)
+        return self._encadenar(self.base.encolar_borrar(id_registro),
+                               lambda borrado: borrado is not None and self._aplicar_durable(id_registro, None))
+
+    def encolar_actualizar_si(self, id_registro: str, cambios: Registro, condicion: str,
+                              parametros: Tuple = ()) -> Future:
+        """
+        Ver Repositorio.encolar_actualizar_si. No reserva valores únicos:
+        `cambios` no debe tocar campos de un índice único.
+        """
+        return self._encadenar(self.base.encolar_actualizar_si(id_registro, cambios, condicion, parametros),
+                               lambda registro: registro is not None and self._aplicar_durable(id_registro, registro))
+
+    def _reservar(self, registro: Registro) -> None:
+        for indice in self.indices.values():
+            indice.verificar(registro)
+        for indice in self.indices.values():
+            indice.reservar(registro)
+
+    def _liberar(self, registro: Registro) -> None:
+        with self._bloqueo:
+            for indice in self.indices.values():
+                indice.liberar(registro)
+
+    def _aplicar(self, id_registro: str, registro: Optional[Registro]) -> None:
+        """Refleja en memoria el estado durable de un registro (None si se borró)"""
+        with self._bloqueo:
+            anterior = self._registros.get(id_registro)
+            if anterior is not None:
+                for indice in self.indices.values():
+                    indice.quitar(anterior)
+            if registro is None:
+                self._registros.pop(id_registro, None)
+            else:
+                self._registros[id_registro] = registro
+                for indice in self.indices.values():
+                    indice.agregar(registro)
+        for funcion in self._suscriptores:
+            funcion(anterior, registro)
+
+    def _aplicar_durable(self, id_registro: str, registro: Optional[Registro]) -> None:
+        if self.compartido:
+            self.recargar([id_registro])
+        else:
+            self._aplicar(id_registro, registro)
+
+    def _releer(self, id_registro: str) -> Optional[Registro]:
+        """
+        Si el registro no está en memoria lo busca en la base: otro proceso
+        pudo haberlo creado hace menos de un intervalo de sincronización
+        """
+        registro = self._registros.get(id_registro)
+        if registro is not None:
+            return registro
+        ahora = time.monotonic()
+        buscado = self._ausentes.get(id_registro)
+        if buscado is not None and ahora - buscado < self.vigencia_ausentes:
+            return None
+        # La consulta no toma _recargando: solo si el registro existe hay que aplicarlo
+        if self.base.obtener(id_registro) is not None:
+            self.recargar([id_registro])
+        registro = self._registros.get(id_registro)
+        if registro is None:
+            with self._bloqueo:
+                self._ausentes[id_registro] = ahora
+                self._ausentes.move_to_end(id_registro)
+                while len(self._ausentes) > MAXIMO_AUSENTES:
+                    self._ausentes.popitem(last=False)
+        return registro
+
+    def recargar(self, ids: Iterable[str]) -> int:
+        """
+        Vuelve a leer del repositorio base los registros indicados y aplica
+        los que cambiaron (p. ej. porque los escribió otro proceso).
+        Regresa cuántos se aplicaron.
+        """
+        ids = list(dict.fromkeys(ids))
+        with self._recargando:
+            actuales = self.base.obtener_varios(ids)
+            nuevos, aplicados = [], 0
+            for id_registro in ids:
+                registro = actuales.get(id_registro)
+                anterior = self._registros.get(id_registro)
+                if registro == anterior:
+                    continue
+                if anterior is None:
+                    nuevos.append(registro)
+                else:
+                    self._aplicar(id_registro, registro)
+                    aplicados += 1
+            if nuevos:
+                self._aplicar_insertados(nuevos)
+        return aplicados + len(nuevos)
+
+    def _aplicar_insertados(self, registros: List[Registro]) -> None:
+        """Como _aplicar para muchos registros nuevos, actualizando los índices en bloque"""
+        with self._bloqueo:
+            for registro in registros:
+                self._registros[str(registro[self.llave])] = registro
+            for indice in self.indices.values():
+                indice.agregar_varios(registros)
+        for registro in registros:
+            for funcion in self._suscriptores:
+                funcion(None, registro)
+
+    @staticmethod
+    def _encadenar(futuro_base: Future, aplicar: Callable[[Any], Any],
+                   liberar: Optional[Callable[[], None]] = None) -> Future:
+        """Future que se resuelve cuando el resultado durable ya está aplicado en memoria"""
+        futuro = Future()
+
+        def al_terminar(terminado: Future) -> None:
+            error = terminado.exception()
+            try:
+                if error is None:
+                    aplicar(terminado.result())
+            except Exception as error_aplicar:
+                error = error_aplicar
+            finally:
+                if liberar is not None:
+                    liberar()
+            if error is None:
+                futuro.set_result(terminado.result())
+            else:
+                futuro.set_exception(error)
+
+        futuro_base.add_done_callback(al_terminar)
+        return futuro
+
+    def contar(self) -> int:
+        return len(self._registros)
+
+    def suscribir(self, funcion: Callable[[Optional[Registro], Optional[Registro]], None]) -> None:
+        """
+        Registra funcion(anterior, nuevo), que se llama después de cada
+        escritura durable (anterior es None al insertar y nuevo es None al
+        borrar). Sirve para mantener estructuras derivadas fuera del repositorio.
+        """
+        self._suscriptores.append(funcion)
+
+
+def _resuelto(valor) -> Future:
+    futuro = Future()
+    futuro.set_result(valor)
+    return futuro
+
@@ -0,0 +1,172 @@
+"""
+Instantáneas
+
+Al arrancar, cada proceso carga en memoria todos los registros (ver
+indices.py). Recorrer cada tabla de SQLite y decodificar fila por fila
+cuesta lo mismo que todo el conjunto de datos. Una instantánea guarda el
+contenido en memoria de un repositorio en un solo archivo, junto con la
+secuencia del registro de cambios (ver almacenamiento.py) hasta la que
+está al día. Al arrancar se lee con mmap y se decodifica de una sola vez
+con orjson; de SQLite solo se releen los registros que cambiaron después
+de esa secuencia.
+
+Formato: _MAGIA, una cabecera binaria (seq, cantidad de registros, crc32
+del cuerpo) y el cuerpo, un arreglo JSON con los registros completos. No
+es un formato columnar: solo se ahorra la lectura de SQLite. Los
+registros se siguen decodificando uno por uno y los índices, timelines y
+la búsqueda se reconstruyen en O(n) como antes. Si el archivo no existe,
+está dañado o el registro de cambios ya no alcanza para completarlo, se
+carga todo desde SQLite.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+from almacenamiento import AlmacenSQLite, Registro, RepositorioSQLite
+from indices import RepositorioIndexado
+from sincronizacion import Sincronizador
+import mmap, os, struct, threading, warnings, zlib
+import orjson
+import metricas
+
+_MAGIA = b'TWINST1\n'
+_CABECERA = struct.Struct('<qQI')
+
+
+def escribir(ruta: str, seq: int, registros: List[Registro]) -> None:
+    """Escribe la instantánea reemplazando el archivo de forma atómica"""
+    cuerpo = orjson.dumps(registros)
+    temporal = f'{ruta}.{os.getpid()}.tmp'
+    with open(temporal, 'wb') as f:
+        f.write(_MAGIA + _CABECERA.pack(seq, len(registros), zlib.crc32(cuerpo)))
+        f.write(cuerpo)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, ruta)
+
+
+def leer(ruta: str) -> Optional[Tuple[int, List[Registro]]]:
+    """(seq, registros) de una instantánea; None si no existe o está dañada"""
+    inicio = len(_MAGIA) + _CABECERA.size
+    try:
+        with open(ruta, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as datos:
+            if len(datos) < inicio or datos[:len(_MAGIA)] != _MAGIA:
+                return None
+            seq, cantidad, crc = _CABECERA.unpack_from(datos, len(_MAGIA))
+            cuerpo = memoryview(datos)[inicio:]
+            try:
+                if zlib.crc32(cuerpo) != crc:
+                    return None
+                registros = orjson.loads(cuerpo)
+            finally:
+                cuerpo.release()
+    except (OSError, ValueError):
+        return None
+    if not isinstance(registros, list) or len(registros) != cantidad:
+        return None
+    return seq, registros
+
+
+class Instantaneas:
+    """
+    Instantáneas de los repositorios en memoria, en archivos `{prefijo}.{tabla}`.
+
+    Cada `intervalo` segundos, si hubo escrituras, se guardan todas de
+    nuevo y se poda el registro de cambios hasta la secuencia guardada,
+    sin borrar los de menos de `retencion` segundos (con varios procesos,
+    los que aún necesitan los demás para sincronizarse). Con intervalo 0
+    no se usan y se borran las que haya, porque dejarían de estar al día.
+    """
+
+    def __init__(self, almacen: AlmacenSQLite, prefijo: str, intervalo: float = 300,
+                 retencion: float = 0, sincronizador: Optional[Sincronizador] = None) -> None:
+        self.almacen = almacen
+        self.prefijo = prefijo
+        self.intervalo = intervalo
+        self.retencion = retencion
+        self.sincronizador = sincronizador
+        self.guardada: Optional[int] = None
+        self._cargadas: Dict[str, int] = {}
+        self._repositorios: Dict[str, RepositorioIndexado] = {}
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    @property
+    def activas(self) -> bool:
+        return self.intervalo > 0
+
+    def ruta(self, tabla: str) -> str:
+        return f'{self.prefijo}.{tabla}'
+
+    def cargar(self, base: RepositorioSQLite) -> Iterable[Registro]:
+        """Los registros de la instantánea de la tabla si sirve; si no, los de SQLite"""
+        ruta = self.ruta(base.tabla)
+        if not self.activas:
+            if os.path.exists(ruta):
+                os.remove(ruta)
+            return base.listar()
+        with metricas.latencia_instantanea.medir(tabla=base.tabla, operacion='cargar'):
+            leida = leer(ruta)
+        if leida is None or not self._completable(leida[0]):
+            return base.listar()
+        self._cargadas[base.tabla] = leida[0]
+        return leida[1]
+
+    def _completable(self, seq: int) -> bool:
+        # Sirve si no se ha podado ningún cambio posterior a la instantánea
+        ultimo = self.almacen.ultimo_cambio()
+        if seq == ultimo:
+            return True
+        primero = self.almacen.primer_cambio()
+        return seq < ultimo and primero is not None and primero <= seq + 1
+
+    def registrar(self, repositorio: RepositorioIndexado) -> int:
+        """
+        Incluye al repositorio en las instantáneas. Si se cargó de una,
+        relee los registros que cambiaron después; regresa cuántos aplicó.
+        Se llama antes de suscribir nada al repositorio.
+        """
+        tabla = repositorio.base.tabla
+        self._repositorios[tabla] = repositorio
+        seq = self._cargadas.pop(tabla, None)
+        if seq is None:
+            return 0
+        ids = [id_registro for _, _, id_registro, _ in self.almacen.cambios_desde(seq, tabla)]
+        metricas.registros_reproducidos.incrementar(len(ids), tabla=tabla)
+        return repositorio.recargar(ids) if ids else 0
+
+    def guardar(self) -> bool:
+        """Guarda todas las instantáneas si hubo cambios desde la última vez"""
+        seq = self.almacen.ultimo_cambio_aplicado()
+        if self.sincronizador is not None:
+            # Lo de otros procesos está en memoria solo hasta lo último sincronizado
+            seq = min(seq, self.sincronizador.ultimo)
+        if seq == self.guardada:
+            return False
+        for tabla, repositorio in self._repositorios.items():
+            # Lo que se aplique mientras se copia se vuelve a releer al cargar, sin efecto
+            registros = list(repositorio.listar())
+            with metricas.latencia_instantanea.medir(tabla=tabla, operacion='guardar'):
+                escribir(self.ruta(tabla), seq, registros)
+        self.guardada = seq
+        self.almacen.podar_cambios(self.retencion, hasta=seq)
+        return True
+
+    def iniciar(self) -> None:
+        if not self.activas:
+            return
+        self._hilo = threading.Thread(target=self._ciclo, name='instantaneas', daemon=True)
+        self._hilo.start()
+
+    def detener(self) -> None:
+        """Detiene el hilo y guarda por última vez, para que el siguiente arranque no tenga que reproducir nada"""
+        if not self.activas:
+            return
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join()
+        self.guardar()
+
+    def _ciclo(self) -> None:
+        while not self._detener.wait(self.intervalo):
+            try:
+                self.guardar()
+            except Exception as error:
+                warnings.warn(f'Error al guardar instantáneas: {error!r}')
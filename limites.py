@@ -0,0 +1,104 @@
+"""
+Límites de tasa y control de admisión
+
+Cubetas de tokens por llave (IP, usuario, email) guardadas en un LRU
+acotado, y un middleware ASGI que antes de llegar a los handlers:
+
+- rechaza con 503 las peticiones que excedan el máximo de peticiones en
+  curso del proceso, para no encolar trabajo en el threadpool cuando ya
+  está saturado;
+- rechaza con 429 a las IPs que se terminaron su cubeta.
+
+Ambas respuestas llevan Retry-After. Los límites por usuario se aplican
+en los handlers, que son los que conocen al usuario.
+"""
+from collections import OrderedDict
+from starlette.responses import JSONResponse
+from typing import Iterable, Optional, Tuple
+import math, threading, time
+import metricas
+
+
+class LimitadorTasa:
+    """
+    Una cubeta por llave que se rellena a `tasa` tokens por segundo hasta
+    `rafaga`. Se guardan a lo más `capacidad` cubetas; al desalojar una, la
+    llave vuelve a empezar con la cubeta llena. Con tasa 0 no limita.
+    """
+
+    def __init__(self, tasa: float, rafaga: float, capacidad: int = 100000) -> None:
+        self.tasa = tasa
+        self.rafaga = max(rafaga, 1)
+        self.capacidad = capacidad
+        self._cubetas: 'OrderedDict[str, Tuple[float, float]]' = OrderedDict()
+        self._bloqueo = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._cubetas)
+
+    def consumir(self, llave: str, costo: float = 1) -> float:
+        """Regresa 0 si se admite o los segundos que faltan para que haya tokens"""
+        if self.tasa <= 0:
+            return 0.0
+        ahora = time.monotonic()
+        with self._bloqueo:
+            tokens, ultimo = self._cubetas.pop(llave, (self.rafaga, ahora))
+            tokens = min(self.rafaga, tokens + (ahora - ultimo) * self.tasa)
+            espera = 0.0
+            if tokens >= costo:
+                tokens -= costo
+            else:
+                espera = (costo - tokens) / self.tasa
+            self._cubetas[llave] = (tokens, ahora)
+            while len(self._cubetas) > self.capacidad:
+                self._cubetas.popitem(last=False)
+        return espera
+
+
+def reintentar_en(espera: float) -> str:
+    return str(max(1, math.ceil(espera)))
+
+
+class MiddlewareAdmision:
+    """
+    `maximo` es el número de peticiones en curso por proceso (0 sin
+    límite). Las rutas en `exentas` (p. ej. /metrics) no cuentan ni se
+    rechazan, para poder observar al servidor cuando está saturado.
+    """
+
+    def __init__(self, app, limitador_ip: Optional[LimitadorTasa] = None, maximo: int = 0,
+                 exentas: Iterable[str] = ('/metrics',)) -> None:
+        self.app = app
+        self.limitador_ip = limitador_ip
+        self.maximo = maximo
+        self.exentas = frozenset(exentas)
+        self.en_curso = 0
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] != 'http' or scope['path'] in self.exentas:
+            await self.app(scope, receive, send)
+            return
+
+        if self.maximo and self.en_curso >= self.maximo:
+            metricas.rechazos_admision.incrementar(motivo='concurrencia')
+            await self._rechazar(scope, receive, send, 503, 'Servidor saturado, intenta más tarde', 1)
+            return
+
+        if self.limitador_ip is not None and scope.get('client'):
+            espera = self.limitador_ip.consumir(scope['client'][0])
+            if espera:
+                metricas.rechazos_admision.incrementar(motivo='ip')
+                await self._rechazar(scope, receive, send, 429, 'Demasiadas peticiones', espera)
+                return
+
+        self.en_curso += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.en_curso -= 1
+
+    @staticmethod
+    async def _rechazar(scope, receive, send, codigo: int, detalle: str, espera: float) -> None:
+        respuesta = JSONResponse({'detail': detalle}, status_code=codigo,
+                                 headers={'Retry-After': reintentar_en(espera)})
+        await respuesta(scope, receive, send)
@@ -1,16 +1,196 @@
-from datetime import date, datetime
-from fastapi import Body, FastAPI, HTTPException, Path, status
-from pydantic import BaseModel, EmailStr, Field
-from typing import Dict, Optional, List
-import string, random, json
+from datetime import date, datetime, timedelta
+from fastapi import Body, FastAPI, HTTPException, Path, Query, Request, Response, status
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, EmailStr, Field, ValidationError, root_validator
+from starlette.concurrency import run_in_threadpool
+from typing import Any, AsyncIterator, Dict, Generator, Iterable, Iterator, Optional, List, Tuple
+from almacenamiento import AlmacenSQLite, RegistroDuplicado, RepositorioSQLite, serializar
+from autores import CacheAutores
+from cache import CacheRespuestas
+from contadores import Contadores
+from busqueda import IndiceInvertido
+from historial import Historial
+from ids import nuevo_id
+from indices import IndiceAgrupado, IndiceOrdenado, IndiceUnico, RepositorioIndexado, codificar_cursor, decodificar_cursor
+from instantaneas import Instantaneas
+from limites import LimitadorTasa, MiddlewareAdmision, reintentar_en
+from sincronizacion import Sincronizador
+from tendencias import VENTANAS, Tendencias
+from tareas import Tareas
+from timeline import Timelines
+import asyncio, functools, itertools, orjson, os
+import metricas, seguridad
 
 app = FastAPI() # 🏁
 
+# Admisión: peticiones en curso por proceso y cubetas de tokens por IP y
+# por usuario (ver limites.py). Con 0 se desactiva cada límite.
+CUBETAS = int(os.environ.get('TWITTER_CUBETAS', 100000))
+MAX_CONCURRENTES = int(os.environ.get('TWITTER_MAX_CONCURRENTES', 200))
+limite_ip = LimitadorTasa(float(os.environ.get('TWITTER_TASA_IP', 100)),
+                          float(os.environ.get('TWITTER_RAFAGA_IP', 200)), CUBETAS)
+limite_usuarios = LimitadorTasa(float(os.environ.get('TWITTER_TASA_USUARIO', 5)),
+                                float(os.environ.get('TWITTER_RAFAGA_USUARIO', 20)), CUBETAS)
+app.add_middleware(MiddlewareAdmision, limitador_ip=limite_ip, maximo=MAX_CONCURRENTES)
+# El último middleware agregado es el más externo: las peticiones
+# rechazadas también se miden
+app.add_middleware(metricas.MiddlewareMetricas)
+
+# Almacenamiento
+
+RUTA_DB = os.environ.get('TWITTER_DB', './twitter.db')
+# Con TWITTER_MULTIPROCESO=1 varios workers comparten la base y se
+# avisan de los cambios entre sí (ver sincronizacion.py)
+MULTIPROCESO = os.environ.get('TWITTER_MULTIPROCESO') == '1'
+# Cada TWITTER_INTERVALO_INSTANTANEAS segundos se guarda lo que hay en
+# memoria para arrancar sin recorrer toda la base (ver instantaneas.py); 0 las desactiva
+INTERVALO_INSTANTANEAS = float(os.environ.get('TWITTER_INTERVALO_INSTANTANEAS', 300))
+almacen = AlmacenSQLite(RUTA_DB, registrar_cambios=MULTIPROCESO or INTERVALO_INSTANTANEAS > 0)
+sincronizador = (Sincronizador(almacen, float(os.environ.get('TWITTER_INTERVALO_SINCRONIZACION', 0.05)))
+                 if MULTIPROCESO else None)
+instantaneas = Instantaneas(almacen, os.environ.get('TWITTER_INSTANTANEAS', RUTA_DB + '.instantanea'),
+                            intervalo=INTERVALO_INSTANTANEAS,
+                            retencion=sincronizador.retencion if sincronizador is not None else 0,
+                            sincronizador=sincronizador)
+
+def cargar_repositorio(base: RepositorioSQLite, **opciones) -> RepositorioIndexado:
+    """Carga el repositorio desde su instantánea (o desde SQLite) y relee lo que cambió después"""
+    repositorio = RepositorioIndexado(base, compartido=MULTIPROCESO, registros=instantaneas.cargar(base),
+                                      vigencia_ausentes=sincronizador.intervalo if sincronizador is not None else 0,
+                                      **opciones)
+    instantaneas.registrar(repositorio)
+    return repositorio
+
+repo_usuarios = cargar_repositorio(almacen.repositorio('usuarios', 'id_usuario', unicos=('email',)),
+                                   indices={'email': IndiceUnico('email', 'id_usuario'),
+                                            'orden': IndiceOrdenado(lambda u: (u['id_usuario'],))})
+cache_autores = CacheAutores(repo_usuarios.obtener_varios,
+                             capacidad=int(os.environ.get('TWITTER_CACHE_AUTORES', 10000)))
+repo_usuarios.suscribir(cache_autores.al_cambiar_usuario)
+
+# Los IDs nuevos crecen con el tiempo (ver ids.py): los usuarios quedan
+# en orden de registro y los tweets con el mismo timestamp_pub en orden
+# de creación
+def clave_tweet(tweet: dict) -> tuple:
+    return (str(tweet['timestamp_pub']), tweet['id_tweet'])
+
+def autor_tweet(tweet: dict) -> str:
+    return tweet['id_autor']
+
+repo_tweets = cargar_repositorio(almacen.repositorio('tweets', 'id_tweet'),
+                                 indices={'orden': IndiceOrdenado(clave_tweet),
+                                          'autor': IndiceAgrupado(autor_tweet, clave_tweet)})
+repo_seguimientos = cargar_repositorio(almacen.repositorio('seguimientos', 'id_seguimiento'))
+
+timelines = Timelines(clave_tweet, autor_tweet,
+                      tamano=int(os.environ.get('TWITTER_TAMANO_TIMELINE', 800)),
+                      umbral_famoso=int(os.environ.get('TWITTER_UMBRAL_FAMOSO', 10000)))
+timelines.cargar(repo_seguimientos.listar(), (t for _, t in repo_tweets.recorrer('orden')))
+repo_seguimientos.suscribir(timelines.al_cambiar_seguimiento)
+repo_tweets.suscribir(timelines.al_cambiar_tweet)
+
+RUTA_INDICE_BUSQUEDA = os.environ.get('TWITTER_INDICE_BUSQUEDA', RUTA_DB + '.busqueda')
+indice_busqueda = IndiceInvertido.cargar(RUTA_INDICE_BUSQUEDA)
+indice_busqueda.sincronizar(repo_tweets.listar())
+indice_busqueda.guardar_periodicamente(RUTA_INDICE_BUSQUEDA,
+                                       float(os.environ.get('TWITTER_INTERVALO_INDICE', 60)))
+repo_tweets.suscribir(indice_busqueda.al_cambiar_tweet)
+
+# Hashtags y menciones en memoria fija; al arrancar se cuentan los tweets de la ventana más larga
+tendencias = Tendencias(capacidad=int(os.environ.get('TWITTER_CAPACIDAD_TENDENCIAS', 100)))
+tendencias.cargar(t for _, t in repo_tweets.recorrer(
+    'orden', (str(datetime.now() - timedelta(seconds=max(VENTANAS.values()))),)))
+repo_tweets.suscribir(tendencias.al_cambiar_tweet)
+
+cache_respuestas = CacheRespuestas(capacidad=int(os.environ.get('TWITTER_CACHE_RESPUESTAS', 10000)),
+                                   ttl=float(os.environ.get('TWITTER_CACHE_TTL', 60)))
+repo_usuarios.suscribir(cache_respuestas.al_cambiar_usuario)
+repo_tweets.suscribir(cache_respuestas.al_cambiar_tweet)
+
+# Las ediciones no se cargan en memoria: solo se leen al pedir el historial
+historial = Historial(almacen.repositorio('ediciones', 'id_edicion'))
+repo_tweets.suscribir(historial.al_cambiar_tweet)
+
+# Likes, retweets y respuestas se cuentan fuera de los tweets (ver contadores.py)
+contadores = Contadores(almacen,
+                        fragmentos=int(os.environ.get('TWITTER_FRAGMENTOS_CONTADORES', 16)),
+                        intervalo=float(os.environ.get('TWITTER_INTERVALO_CONTADORES', 0.5)))
+repo_tweets.suscribir(contadores.al_cambiar_tweet)
+
+# Tareas en segundo plano
+
+TAMANO_BLOQUE_BORRADO = int(os.environ.get('TWITTER_BLOQUE_BORRADO', 500))
+repo_tareas = cargar_repositorio(almacen.repositorio('tareas', 'id_tarea'))
+# Con varios workers, una tarea en curso que no avanza en TWITTER_PLAZO_TAREAS segundos la retoma otro
+tareas = Tareas(repo_tareas, pausa=float(os.environ.get('TWITTER_PAUSA_TAREAS', 0.01)),
+                plazo=float(os.environ.get('TWITTER_PLAZO_TAREAS', 60)) if MULTIPROCESO else 0)
+
+def borrar_varios(repositorio: RepositorioIndexado, ids: List[str]) -> List[dict]:
+    """Los registros que se borraron"""
+    # Se encolan todos antes de esperar para que el escritor los agrupe
+    futuros = [repositorio.encolar_borrar(id_registro) for id_registro in ids]
+    return [registro for registro in (futuro.result() for futuro in futuros) if registro is not None]
+
+def descontar_respuestas(tweets: Iterable[dict]) -> None:
+    """Resta las respuestas borradas de los tweets a los que respondían, si siguen existiendo"""
+    for tweet in tweets:
+        if tweet.get('en_respuesta_a') and repo_tweets.obtener(tweet['en_respuesta_a']) is not None:
+            contadores.incrementar(tweet['en_respuesta_a'], 'respuestas', -1)
+
+def borrar_usuario_en_cascada(id_usuario: str) -> Iterator[Dict[str, int]]:
+    """
+    Borra los tweets y seguimientos de un usuario ya borrado, de
+    TAMANO_BLOQUE_BORRADO en TAMANO_BLOQUE_BORRADO. Los tweets se toman del
+    índice por autor en cada vuelta, así que también se borran los que se
+    publicaron mientras tanto.
+    """
+    while True:
+        claves = repo_tweets.indices['autor'].anteriores(id_usuario, None, TAMANO_BLOQUE_BORRADO)
+        borrados = borrar_varios(repo_tweets, [clave[-1] for clave in claves])
+        if not borrados:
+            break
+        descontar_respuestas(borrados)
+        yield {'tweets': len(borrados)}
+    seguimientos = [f'{seguidor}:{seguido}' for seguidor, seguido in timelines.seguimientos_de(id_usuario)]
+    for inicio in range(0, len(seguimientos), TAMANO_BLOQUE_BORRADO):
+        borrados = borrar_varios(repo_seguimientos, seguimientos[inicio:inicio + TAMANO_BLOQUE_BORRADO])
+        yield {'seguimientos': len(borrados)}
+
+tareas.registrar('borrar_usuario', borrar_usuario_en_cascada)
+
+if sincronizador is not None:
+    sincronizador.registrar('usuarios', repo_usuarios)
+    sincronizador.registrar('tweets', repo_tweets)
+    sincronizador.registrar('seguimientos', repo_seguimientos)
+    sincronizador.registrar('tareas', repo_tareas)
+    sincronizador.registrar('contadores', contadores)
+    sincronizador.iniciar()
+instantaneas.iniciar()
+contadores.iniciar()
+tareas.iniciar()
+
+metricas.Medidor('twitter_registros', 'Registros en memoria por colección', ('coleccion',),
+                 funcion=lambda: {('usuarios',): repo_usuarios.contar(),
+                                  ('tweets',): repo_tweets.contar(),
+                                  ('seguimientos',): repo_seguimientos.contar(),
+                                  ('indice_busqueda',): len(indice_busqueda),
+                                  ('cache_respuestas',): len(cache_respuestas)})
+
+@app.on_event('shutdown')
+def cerrar_almacen() -> None:
+    # Aplica las escrituras que sigan en cola antes de salir
+    if sincronizador is not None:
+        sincronizador.detener()
+    contadores.detener()
+    instantaneas.detener()
+    almacen.cerrar()
+    indice_busqueda.guardar(RUTA_INDICE_BUSQUEDA)
+
 # Modelos
 
 class UsuarioBase(BaseModel):
     id_usuario: str = Field(title='ID Usuario',
-                             default=''.join([random.choice(string.ascii_letters + string.digits) for n in range(32)]))
+                             default_factory=nuevo_id)
     email: EmailStr = Field(...,
                             title='Email')
     
@@ -39,14 +219,492 @@ class UsuarioLoginOut(UsuarioBase):
                          default='Ingreso correcto')
     
 class Tweet(BaseModel):
-    id_tweet: str = Field(default=''.join([random.choice(string.ascii_letters + string.digits) for n in range(32)]))
+    id_tweet: str = Field(default_factory=nuevo_id)
     contenido: str = Field(...,
                           max_length=256,
                           min_length=1)
-    timestamp_pub: datetime = Field(default=datetime.now())
+    timestamp_pub: datetime = Field(default_factory=datetime.now)
     timestamp_act: Optional[datetime] = Field()
-    autor: Usuario = Field(..., exclude={'contrasena', 'fecha_nacimiento'})
+    id_autor: str = Field(...,
+                          title='ID del autor')
+
+    @root_validator(pre=True)
+    def autor_embebido(cls, valores):
+        # Compatibilidad con clientes que todavía mandan el autor completo
+        autor = valores.get('autor')
+        if 'id_autor' not in valores and isinstance(autor, dict) and 'id_usuario' in autor:
+            valores = dict(valores, id_autor=autor['id_usuario'])
+        return valores
+
+class AutorTweet(UsuarioBase):
+    nombre: str = Field(...,
+                        title='Nombre')
+    apellido: str = Field(...,
+                          title='Apellido')
+
+class TweetOut(Tweet):
+    autor: AutorTweet = Field(...,
+                              title='Autor del tweet')
+    version: int = Field(default=1,
+                         title='Versión del tweet',
+                         description='Empieza en 1 y aumenta con cada edición')
+    en_respuesta_a: Optional[str] = Field(default=None,
+                                          title='ID del tweet al que responde')
+
+class Interacciones(BaseModel):
+    id_tweet: str = Field(...)
+    likes: int = Field(...)
+    retweets: int = Field(...)
+    respuestas: int = Field(...)
+
+class Tendencia(BaseModel):
+    termino: str = Field(...,
+                         example='#python')
+    tipo: str = Field(...,
+                      title='hashtag o mencion')
+    tweets: int = Field(...,
+                        title='Tweets de la ventana que lo usan (estimación por arriba)')
+
+class VersionTweet(BaseModel):
+    version: int = Field(...)
+    contenido: str = Field(...)
+    timestamp: datetime = Field(...,
+                                title='Momento en que se publicó esta versión')
+
+class Seguimiento(BaseModel):
+    seguidor: str = Field(...,
+                          title='ID del usuario que sigue')
+    seguido: str = Field(...,
+                         title='ID del usuario seguido')
+
+class ErrorLote(BaseModel):
+    indice: int = Field(...,
+                        title='Posición del elemento en el lote')
+    detalle: Any = Field(...,
+                         title='Motivo por el que no se insertó')
+
+class ResultadoLote(BaseModel):
+    insertados: int = Field(...,
+                            title='Elementos insertados')
+    errores: List[ErrorLote] = Field(...,
+                                     title='Elementos rechazados')
+
+class Tarea(BaseModel):
+    id_tarea: str = Field(...,
+                          title='ID de la tarea')
+    tipo: str = Field(...,
+                      example='borrar_usuario')
+    parametros: Dict[str, Any] = Field(...)
+    estado: str = Field(...,
+                        title='pendiente, en_curso, terminada o fallida')
+    progreso: Dict[str, int] = Field(...,
+                                     title='Registros procesados por colección')
+    creada: datetime = Field(...)
+    actualizada: datetime = Field(...)
+    error: Optional[str] = Field(default=None)
     
+# Respuestas rápidas
+
+# Con TWITTER_RESPUESTA_RAPIDA=1 los listados se regresan como ORJSONResponse:
+# los registros ya se validaron al guardarse, así que solo se proyectan a
+# los campos del modelo en lugar de revalidarlos contra response_model
+RESPUESTA_RAPIDA = os.environ.get('TWITTER_RESPUESTA_RAPIDA') == '1'
+
+def fecha_iso(valor) -> str:
+    # Las fechas leídas de la base vienen como str(datetime) y las recién
+    # escritas como datetime; la respuesta validada las regresa en ISO 8601
+    return valor.replace(' ', 'T', 1) if isinstance(valor, str) else valor.isoformat()
+
+@functools.lru_cache(maxsize=None)
+def proyector(modelo):
+    """Función que deja en un registro solo los campos de `modelo`, como los regresaría la respuesta validada"""
+    conversiones = []
+    # Los registros anteriores a un campo nuevo no lo tienen
+    defaults = {nombre: campo.default for nombre, campo in modelo.__fields__.items()}
+    for nombre, campo in modelo.__fields__.items():
+        if isinstance(campo.type_, type) and issubclass(campo.type_, BaseModel):
+            conversiones.append((nombre, proyector(campo.type_)))
+        elif campo.type_ is datetime:
+            conversiones.append((nombre, fecha_iso))
+        else:
+            conversiones.append((nombre, None))
+
+    def proyectar(registro: dict) -> dict:
+        proyectado = {}
+        for nombre, conversion in conversiones:
+            valor = registro.get(nombre, defaults[nombre])
+            proyectado[nombre] = conversion(valor) if conversion is not None and valor is not None else valor
+        return proyectado
+    return proyectar
+
+def responder(modelo, registros: List[dict], response: Response):
+    """Regresa los registros tal cual (se validan con response_model) o, en modo rápido, ya proyectados y codificados con orjson"""
+    if not RESPUESTA_RAPIDA:
+        return registros
+    proyectar = proyector(modelo)
+    # Al regresar una Response se pierden los headers puestos en `response`
+    headers = {nombre: valor for nombre, valor in response.headers.items() if nombre.startswith('x-')}
+    with metricas.latencia_etapa.medir(etapa='codificar'):
+        return ORJSONResponse([proyectar(registro) for registro in registros], headers=headers)
+
+# Límite por usuario
+
+def limitar_usuario(llave: str) -> None:
+    """429 si `llave` (un usuario o un email) ya se terminó su cubeta"""
+    espera = limite_usuarios.consumir(llave)
+    if espera:
+        metricas.rechazos_admision.incrementar(motivo='usuario')
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail='Demasiadas peticiones',
+            headers={'Retry-After': reintentar_en(espera)})
+
+# Cache de respuestas
+
+def respuesta_cacheada(request: Request, llave: str, modelo, generar) -> Response:
+    """
+    Regresa el cuerpo guardado en cache_respuestas para `llave` o lo genera
+    con generar() → (registro, etiquetas). Si el ETag coincide con el
+    If-None-Match de la petición se responde 304 sin cuerpo.
+    """
+    entrada = cache_respuestas.obtener(llave)
+    if entrada is None:
+        marca = cache_respuestas.marca()
+        with metricas.latencia_etapa.medir(etapa='generar'):
+            registro, etiquetas = generar()
+        with metricas.latencia_etapa.medir(etapa='codificar'):
+            cuerpo = orjson.dumps(proyector(modelo)(registro))
+        entrada = cache_respuestas.guardar(llave, cuerpo, etiquetas, marca)
+
+    if entrada.etag in request.headers.get('if-none-match', '').replace(' ', '').split(','):
+        cache_respuestas.estadisticas['no_modificados'] += 1
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={'ETag': entrada.etag})
+    return Response(entrada.cuerpo, media_type='application/json', headers={'ETag': entrada.etag})
+
+# Handlers compartidos con main_tw_async
+#
+# El cuerpo de cada handler que escribe es un generador: cede un Future
+# (escritor, pool de hashes, tareas) o una función bloqueante, y recibe su
+# resultado (o su excepción) de vuelta. esperar() lo corre bloqueando el
+# hilo; main_tw_async.esperar() lo corre con await.
+
+Pasos = Generator[Any, Any, Any]
+
+def esperar(pasos: Pasos):
+    """Corre un handler compartido en el hilo actual y regresa su resultado"""
+    resultado, error = None, None
+    while True:
+        try:
+            paso = pasos.throw(error) if error is not None else pasos.send(resultado)
+        except StopIteration as fin:
+            return fin.value
+        resultado, error = None, None
+        try:
+            resultado = paso() if callable(paso) else paso.result()
+        except Exception as e:
+            error = e
+
+def usuario_existente(id_usuario: str) -> dict:
+    usuario = repo_usuarios.obtener(id_usuario)
+    if usuario is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='Usuario no encontrado')
+    return usuario
+
+def tweet_existente(id_tweet: str) -> dict:
+    tweet = repo_tweets.obtener(id_tweet)
+    if tweet is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='Tweet no encontrado')
+    return tweet
+
+def autor_existente(id_autor: str) -> dict:
+    autor = cache_autores.obtener([id_autor]).get(id_autor)
+    if autor is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='Autor no encontrado')
+    return autor
+
+def registro_usuario(usuario: UsuarioRegistro) -> Pasos:
+    diccionario_usuarios = usuario.dict()
+    diccionario_usuarios['id_usuario'] = str(diccionario_usuarios['id_usuario'])
+    if repo_usuarios.buscar('email', usuario.email) is not None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail='El email ya está registrado')
+
+    diccionario_usuarios['contrasena'] = yield seguridad.en_pool(seguridad.generar_hash, usuario.contrasena)
+    try:
+        yield repo_usuarios.encolar_insertar(diccionario_usuarios)
+    except RegistroDuplicado:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail='El ID o el email del usuario ya existe')
+    return usuario
+
+def ingreso(usuario: UsuarioIngresar) -> Pasos:
+    # Antes de calcular el hash: también frena los intentos contra una cuenta
+    limitar_usuario('email:' + usuario.email.lower())
+    u = repo_usuarios.buscar('email', usuario.email)
+    almacenada = u['contrasena'] if u is not None else seguridad.HASH_FICTICIO
+    correcta = yield seguridad.en_pool(seguridad.verificar, usuario.contrasena, almacenada)
+
+    if u is None or not correcta:
+        return UsuarioLoginOut(email=usuario.email, id_usuario=usuario.id_usuario, mensaje='Ingreso incorrecto')
+
+    if seguridad.necesita_rehash(almacenada):
+        u = dict(u, contrasena=(yield seguridad.en_pool(seguridad.generar_hash, usuario.contrasena)))
+        yield repo_usuarios.encolar_reemplazar(u['id_usuario'], u)
+    return UsuarioLoginOut(email=u['email'], id_usuario=u['id_usuario'])
+
+def respuesta_usuario(request: Request, id_usuario: str) -> Response:
+    return respuesta_cacheada(request, f'usuario:{id_usuario}', Usuario,
+                              lambda: (usuario_existente(id_usuario), ()))
+
+def edicion_usuario(id_usuario: str, usuario_act: UsuarioRegistro) -> Pasos:
+    diccionario_usuario = usuario_act.dict()
+    diccionario_usuario['id_usuario'] = id_usuario
+    diccionario_usuario['contrasena'] = yield seguridad.en_pool(seguridad.generar_hash, usuario_act.contrasena)
+
+    try:
+        actualizado = yield repo_usuarios.encolar_reemplazar(id_usuario, diccionario_usuario)
+    except RegistroDuplicado:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail='El email ya está registrado'
+        )
+    if not actualizado:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='Usuario no encontrado'
+        )
+    return diccionario_usuario
+
+def baja_usuario(response: Response, id_usuario: str) -> Pasos:
+    usuario = yield repo_usuarios.encolar_borrar(id_usuario)
+    if usuario is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='Usario no encontrado'
+        )
+    tarea = yield tareas.crear('borrar_usuario', id_usuario=id_usuario)
+    response.headers['Location'] = f'/tareas/{tarea["id_tarea"]}'
+    return usuario
+
+def alta_tweet(tweet: Tweet, en_respuesta_a: Optional[str] = None) -> Pasos:
+    """Postea `tweet`; si responde a otro, el original debe existir y suma una respuesta"""
+    if en_respuesta_a is not None:
+        tweet_existente(en_respuesta_a)
+    limitar_usuario('usuario:' + tweet.id_autor)
+    diccionario_tweet = tweet.dict()
+    if en_respuesta_a is not None:
+        diccionario_tweet['en_respuesta_a'] = en_respuesta_a
+    autor = autor_existente(tweet.id_autor)
+    try:
+        yield repo_tweets.encolar_insertar(diccionario_tweet)
+    except RegistroDuplicado:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail='El ID del tweet ya existe')
+    if en_respuesta_a is not None:
+        contadores.incrementar(en_respuesta_a, 'respuestas')
+    return dict(diccionario_tweet, autor=autor)
+
+def respuesta_tweet(request: Request, id_tweet: str) -> Response:
+    def generar():
+        tweet = repo_tweets.obtener(id_tweet)
+        tweets = cache_autores.hidratar([tweet]) if tweet is not None else []
+        if not tweets:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail='Tweet no encontrado')
+        # Si el autor cambia de nombre o se borra, la respuesta ya no vale
+        return tweets[0], (f'usuario:{tweets[0]["id_autor"]}',)
+    return respuesta_cacheada(request, f'tweet:{id_tweet}', TweetOut, generar)
+
+def edicion_tweet(id_tweet: str, tweet_act: Tweet) -> Pasos:
+    diccionario_tweet = tweet_act.dict()
+    diccionario_tweet['id_tweet'] = id_tweet
+    autor = autor_existente(tweet_act.id_autor)
+    actual = tweet_existente(id_tweet)
+    # Editar no cambia a qué tweet responde
+    if actual.get('en_respuesta_a'):
+        diccionario_tweet['en_respuesta_a'] = actual['en_respuesta_a']
+    diccionario_tweet, guardar_edicion = historial.nueva_version(actual, diccionario_tweet)
+    try:
+        reemplazado = yield repo_tweets.encolar_reemplazar(id_tweet, diccionario_tweet, guardar_edicion)
+    except RegistroDuplicado:
+        # Otra edición del mismo tweet ya ocupó esta versión
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail='El tweet se editó al mismo tiempo, intenta de nuevo')
+    if not reemplazado:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='Tweet no encontrado'
+        )
+    return dict(diccionario_tweet, autor=autor)
+
+def versiones_tweet(id_tweet: str, limite: Optional[int]) -> Pasos:
+    tweet = tweet_existente(id_tweet)
+    # Las ediciones se leen de SQLite: en main_tw_async, fuera del event loop
+    return (yield lambda: historial.versiones(tweet, limite))
+
+def interacciones(id_tweet: str) -> dict:
+    tweet_existente(id_tweet)
+    return dict(contadores.obtener(id_tweet), id_tweet=id_tweet)
+
+def baja_tweet(id_tweet: str) -> Pasos:
+    tweet = yield repo_tweets.encolar_borrar(id_tweet)
+    if tweet is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='Tweet no encontrado'
+        )
+    descontar_respuestas([tweet])
+    # Una respuesta 204 no puede llevar cuerpo
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+# Carga en lote
+
+TAMANO_BLOQUE_LOTE = 10000
+
+async def leer_lote(request: Request) -> AsyncIterator[List[Tuple[int, Any]]]:
+    """
+    Regresa bloques de (posición, elemento) del cuerpo de la petición.
+    Con Content-Type application/x-ndjson se lee un elemento por línea
+    conforme llega el cuerpo; si no, el cuerpo debe ser un arreglo JSON.
+    """
+    if 'ndjson' in request.headers.get('content-type', ''):
+        pendiente, posicion, bloque = b'', 0, []
+        async for trozo in request.stream():
+            lineas = (pendiente + trozo).split(b'\n')
+            pendiente = lineas.pop()
+            for linea in lineas:
+                if linea.strip():
+                    bloque.append((posicion, linea))
+                    posicion += 1
+            if len(bloque) >= TAMANO_BLOQUE_LOTE:
+                yield bloque
+                bloque = []
+        if pendiente.strip():
+            bloque.append((posicion, pendiente))
+        if bloque:
+            yield bloque
+        return
+
+    try:
+        elementos = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
+        elementos = None
+    if not isinstance(elementos, list):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Se esperaba un arreglo JSON o NDJSON')
+    for inicio in range(0, len(elementos), TAMANO_BLOQUE_LOTE):
+        yield list(enumerate(elementos[inicio:inicio + TAMANO_BLOQUE_LOTE], inicio))
+
+def validar_bloque(modelo, bloque: List[Tuple[int, Any]]) -> Tuple[List[Tuple[int, BaseModel]], List[dict]]:
+    validos, errores = [], []
+    for posicion, elemento in bloque:
+        try:
+            if isinstance(elemento, bytes):
+                elemento = orjson.loads(elemento)
+            validos.append((posicion, modelo.parse_obj(elemento)))
+        except orjson.JSONDecodeError:
+            errores.append({'indice': posicion, 'detalle': 'JSON inválido'})
+        except ValidationError as error:
+            errores.append({'indice': posicion, 'detalle': error.errors()})
+    return validos, errores
+
+async def insertar_lote(request: Request, modelo, preparar, repositorio: RepositorioIndexado,
+                        duplicado: str) -> dict:
+    """
+    Valida el lote por bloques en el threadpool, prepara los registros con
+    `await preparar(validos)` → (registros, errores) y los inserta todos en
+    una sola transacción. Cada elemento rechazado se reporta con su posición.
+    """
+    posiciones, registros, errores = [], [], []
+    async for bloque in leer_lote(request):
+        with metricas.latencia_etapa.medir(etapa='validar_lote'):
+            validos, errores_bloque = await run_in_threadpool(validar_bloque, modelo, bloque)
+        errores.extend(errores_bloque)
+        preparados, errores_bloque = await preparar(validos)
+        errores.extend(errores_bloque)
+        for posicion, registro in preparados:
+            posiciones.append(posicion)
+            registros.append(registro)
+
+    resultados = await asyncio.wrap_future(repositorio.encolar_insertar_varios(registros))
+    errores.extend({'indice': posicion, 'detalle': duplicado}
+                   for posicion, error in zip(posiciones, resultados) if error is not None)
+    errores.sort(key=lambda error: error['indice'])
+    return {'insertados': len(registros) - sum(error is not None for error in resultados), 'errores': errores}
+
+# Paginación
+
+LIMITE_PAGINA = 100
+LIMITE_MAXIMO = 1000
+
+def sin_cambios(registros: List[dict]) -> List[dict]:
+    return registros
+
+# Elementos de las claves de 'orden' (y de 'autor' y los timelines, que usan clave_tweet)
+LONGITUD_CURSOR = {'usuarios': 1, 'tweets': 2}
+
+def leer_cursor(after: Optional[str], longitud: int) -> Optional[Tuple]:
+    """Clave de un cursor X-Cursor-Siguiente; 400 si no es válido"""
+    if not after:
+        return None
+    try:
+        return decodificar_cursor(after, longitud)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Cursor inválido')
+
+def por_bloques(iterable: Iterable, tamano: int) -> Iterator[list]:
+    iterador = iter(iterable)
+    bloque = list(itertools.islice(iterador, tamano))
+    while bloque:
+        yield bloque
+        bloque = list(itertools.islice(iterador, tamano))
+
+def paginar(repositorio: RepositorioIndexado, modelo, response: Response,
+            limit: Optional[int], after: Optional[str], formato: str,
+            hidratar=sin_cambios):
+    """
+    Regresa una página de registros en el orden del índice 'orden'.
+
+    En formato json se regresan hasta `limit` registros y el cursor de la
+    siguiente página en el header X-Cursor-Siguiente. En formato ndjson
+    los registros se envían uno por línea conforme se recorren.
+
+    `hidratar` completa cada bloque de registros antes de responder (p. ej.
+    los autores de los tweets) con una sola consulta por bloque.
+    """
+    despues = leer_cursor(after, LONGITUD_CURSOR[repositorio.base.tabla])
+
+    if formato == 'ndjson':
+        proyectar = proyector(modelo)
+        bloques = por_bloques((registro for _, registro in repositorio.recorrer('orden', despues, limit)),
+                              LIMITE_PAGINA)
+        lineas = (serializar(proyectar(registro)) + '\n'
+                  for bloque in bloques for registro in hidratar(bloque))
+        return StreamingResponse(lineas, media_type='application/x-ndjson')
+
+    limite = limit or LIMITE_PAGINA
+    with metricas.latencia_etapa.medir(etapa='recorrer'):
+        pagina = list(repositorio.recorrer('orden', despues, limite))
+    if len(pagina) == limite:
+        response.headers['X-Cursor-Siguiente'] = codificar_cursor(pagina[-1][0])
+    with metricas.latencia_etapa.medir(etapa='hidratar'):
+        registros = hidratar([registro for _, registro in pagina])
+    return responder(modelo, registros, response)
+
 # Path Operations
 
 @app.get(
@@ -65,7 +723,27 @@ def home() -> Dict[str, str]:
     summary='Genera un ID para usuarios y tweets nuevos'
 )
 def generacion_id() -> str:
-    return ''.join([random.choice(string.ascii_letters + string.digits) for n in range(32)])
+    return nuevo_id()
+
+# Estadísticas del cache de respuestas
+@app.get(
+    path="/cache/estadisticas",
+    status_code=status.HTTP_200_OK,
+    tags=['🔵'],
+    summary='Aciertos, fallos y desalojos del cache de respuestas'
+)
+def estadisticas_cache() -> Dict[str, int]:
+    return dict(cache_respuestas.estadisticas, entradas=len(cache_respuestas))
+
+# Métricas en formato Prometheus
+@app.get(
+    path="/metrics",
+    status_code=status.HTTP_200_OK,
+    tags=['🔵'],
+    summary='Métricas de latencia, tamaño y almacenamiento para Prometheus'
+)
+def mostrar_metricas() -> Response:
+    return Response(metricas.exponer(), media_type='text/plain; version=0.0.4; charset=utf-8')
 
 ##### Usuarios #####
 
@@ -94,15 +772,38 @@ def registrar(usuario: UsuarioRegistro = Body(...)) -> Usuario:
         - apellido: str
         - fecha_nacimiento: date
     """
-    with open('./usuarios.json', 'r+', encoding='utf-8') as f:
-        contenido = json.loads(f.read())
-        diccionario_usuarios = usuario.dict()
-        diccionario_usuarios['id_usuario'] = str(diccionario_usuarios['id_usuario'])
-        diccionario_usuarios['fecha_nacimiento'] = str(diccionario_usuarios['fecha_nacimiento'])
-        contenido.append(diccionario_usuarios)
-        f.seek(0)
-        f.write(json.dumps(contenido))
-        return usuario
+    return esperar(registro_usuario(usuario))
+
+# Registro de usuarios en lote
+@app.post(
+    path='/usuarios/batch',
+    response_model=ResultadoLote,
+    status_code=status.HTTP_200_OK,
+    summary='Registrar muchos usuarios',
+    tags=['Usuarios']
+)
+async def registrar_lote(request: Request) -> ResultadoLote:
+    """
+    Registro en lote
+    
+    Registra muchos usuarios en una sola transacción. El cuerpo es un
+    arreglo JSON de UsuarioRegistro o, con Content-Type
+    application/x-ndjson, un UsuarioRegistro por línea
+    
+    Regresa un JSON con las siguientes llaves:
+        - insertados: int
+        - errores: lista de {indice, detalle} de los usuarios rechazados
+    """
+    async def preparar(validos):
+        hashes = [seguridad.en_pool(seguridad.generar_hash, usuario.contrasena) for _, usuario in validos]
+        preparados = []
+        for (posicion, usuario), futuro in zip(validos, hashes):
+            diccionario_usuario = usuario.dict()
+            diccionario_usuario['contrasena'] = await asyncio.wrap_future(futuro)
+            preparados.append((posicion, diccionario_usuario))
+        return preparados, []
+    return await insertar_lote(request, UsuarioRegistro, preparar, repo_usuarios,
+                               'El ID o el email del usuario ya existe')
 
 # Acceso a la app
 @app.post(
@@ -127,13 +828,7 @@ def ingresar(usuario: UsuarioIngresar) -> UsuarioLoginOut:
         - email: EmailStr
         - mensaje: str
     """
-    with open('./usuarios.json', 'r', encoding='utf-8') as f:
-        usuarios  = json.loads(f.read())
-        for u in usuarios:
-            if u['email'] == usuario.email and u['contrasena'] == usuario.contrasena:
-                return UsuarioLoginOut(email=usuario.email, id_usuario=usuario.id_usuario)
-            else:
-                return UsuarioLoginOut(email=usuario.email, id_usuario=usuario.id_usuario, mensaje='Ingreso incorrecto')
+    return esperar(ingreso(usuario))
 
 # Mostrar usuarios
 @app.get(
@@ -143,12 +838,18 @@ def ingresar(usuario: UsuarioIngresar) -> UsuarioLoginOut:
     summary='Muestra todos los usuarios',
     tags=['Usuarios']
 )
-def mostrar_usuarios() -> List[Usuario]:
+def mostrar_usuarios(response: Response,
+                     limit: Optional[int] = Query(None, ge=1, le=LIMITE_MAXIMO,
+                                                  description='Número máximo de registros'),
+                     after: Optional[str] = Query(None, description='Cursor X-Cursor-Siguiente de la página anterior'),
+                     formato: str = Query('json', regex='^(json|ndjson)$')) -> List[Usuario]:
     """
-    Muestra todos los usuarios de la aplicación
+    Muestra los usuarios de la aplicación, paginados por cursor
     
     Parameters:
-        - 
+        - limit: int (por defecto 100)
+        - after: str (cursor de la página anterior)
+        - formato: json | ndjson
         
     Regresa un JSON con todos los usuarios en la aplicación con las siguientes llaves:
         - id_usuario: str
@@ -157,9 +858,7 @@ def mostrar_usuarios() -> List[Usuario]:
         - apellido: str
         - fecha_nacimiento: date    
     """
-    with open('./usuarios.json', 'r', encoding='utf-8') as f:
-        contenido = json.loads(f.read())
-        return contenido
+    return paginar(repo_usuarios, Usuario, response, limit, after, formato)
 
 # Mostrar un usuario 
 @app.get(
@@ -169,9 +868,10 @@ def mostrar_usuarios() -> List[Usuario]:
     summary='Muestra un usuario',
     tags=['Usuarios']
 )
-def mostrar_usuario(id_usuario: str = Path(...,
-                                             title='ID Usuario',
-                                             description='ID del Usuario que deseas')
+def mostrar_usuario(request: Request,
+                    id_usuario: str = Path(...,
+                                           title='ID Usuario',
+                                           description='ID del Usuario que deseas')
     ) -> Usuario:
     """
     Muestra a un usuario de la aplicación
@@ -186,17 +886,8 @@ def mostrar_usuario(id_usuario: str = Path(...,
         - apellido: str
         - fecha_nacimiento: date    
     """
-    with open('./usuarios.json', 'r+', encoding='utf-8') as f:
-        usuarios = json.loads(f.read())
-        
-        for usuario in usuarios:
-            if str(usuario['id_usuario']) == str(id_usuario):
-                return usuario
-        
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, 
-            detail='Usuario no encontrado')
-    
+    return respuesta_usuario(request, id_usuario)
+
 # Actualizar información de un usuario    
 @app.put(
     path='/usuarios/{id_usuario}',
@@ -229,104 +920,364 @@ def actualizar_usuario(id_usuario: str = Path(...,
         - apellido: str
         - fecha_nacimiento: date        
     """
-    diccionario_usuario = usuario_act.dict()
-    diccionario_usuario['fecha_nacimiento'] = str(diccionario_usuario['fecha_nacimiento'])
-    
-    with open('./usuarios.json', 'r+', encoding='utf-8') as f:
-        usuarios = json.loads(f.read())
-        
-    for usuario in usuarios:
-        if str(usuario['id_usuario']) == id_usuario:
-            usuarios[usuarios.index(usuario)] = diccionario_usuario
-            with open('./usuarios.json', 'w', encoding='utf-8') as f:
-                f.seek(0)
-                f.write(json.dumps(usuarios))
-            return diccionario_usuario
-        
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail='Usuario no encontrado'
-        )
+    return esperar(edicion_usuario(id_usuario, usuario_act))
 
 # Borrar un usuario
 @app.delete(
     path='/usuarios/{id_usuario}',
+    response_model=Usuario,
     status_code=status.HTTP_200_OK,
     summary='Borra a un usuario',
     tags=['Usuarios']
 )
-def borrar_usuario(id_usuario: str = Path(...,
+def borrar_usuario(response: Response,
+                   id_usuario: str = Path(...,
                                              title='ID Usuario',
                                              description='ID del Usuario que deseas')
     ) -> Usuario:
     """
     Borrar
     
-    Borrar un usuario de la app
+    Borrar un usuario de la app. Sus tweets y seguimientos se borran
+    después en segundo plano; el header Location apunta a la tarea
+    (/tareas/{id_tarea}) para consultar su avance
     
     Parameters:
         - id_usuario: str
         
-    Retorna el usuario que se borró con todas sus llaves:
+    Retorna el usuario que se borró, sin la contraseña:
         - id_usuario: str
         - email: EmailStr
-        - contraseña: str
         - nombre: str
         - apellido: str
         - fecha_nacimiento: date      
     """
-    with open('./usuarios.json', 'r+', encoding='utf-8') as f: 
-        usuarios = json.loads(f.read())
-    for usuario in usuarios:
-        if usuario['id_usuario'] == id_usuario:
-            usuarios.remove(usuario)
-            with open('./usuarios.json', 'w', encoding='utf-8') as f:
-                f.seek(0)
-                f.write(json.dumps(usuarios))
-            return usuario
-    
-    raise HTTPException(
-        status_code=status.HTTP_404_NOT_FOUND,
-        detail='Usario no encontrado'
-    )
+    return esperar(baja_usuario(response, id_usuario))
+
+# Avance de una tarea en segundo plano
+@app.get(
+    path='/tareas/{id_tarea}',
+    response_model=Tarea,
+    status_code=status.HTTP_200_OK,
+    summary='Muestra el estado de una tarea en segundo plano',
+    tags=['Usuarios']
+)
+def mostrar_tarea(id_tarea: str = Path(...,
+                                       title='ID de la tarea',
+                                       description='ID del header Location al borrar un usuario')
+    ) -> Tarea:
+    """
+    Tarea
+    
+    Muestra el estado y el avance de una tarea en segundo plano, p. ej.
+    el borrado de los tweets y seguimientos de un usuario
+    
+    Parameters:
+        - id_tarea: str
+        
+    Regresa un JSON con la tarea:
+        - id_tarea: str
+        - tipo: str
+        - parametros: dict
+        - estado: str (pendiente, en_curso, terminada o fallida)
+        - progreso: dict (registros borrados por colección)
+        - creada: datetime
+        - actualizada: datetime
+        - error: str
+    """
+    tarea = tareas.obtener(id_tarea)
+    if tarea is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='Tarea no encontrada'
+        )
+    return tarea
+
+##### Seguidores #####
+
+# Seguir a un usuario
+@app.post(
+    path='/usuarios/{id_usuario}/seguir/{id_seguido}',
+    response_model=Seguimiento,
+    status_code=status.HTTP_201_CREATED,
+    summary='Sigue a un usuario',
+    tags=['Seguidores']
+)
+def seguir(id_usuario: str = Path(...,
+                                  title='ID Usuario',
+                                  description='ID del usuario que va a seguir'),
+           id_seguido: str = Path(...,
+                                  title='ID Seguido',
+                                  description='ID del usuario a seguir')
+    ) -> Seguimiento:
+    """
+    Seguir
+    
+    El usuario id_usuario empieza a seguir a id_seguido; los tweets de
+    id_seguido aparecerán en su timeline
+    
+    Parameters:
+        - id_usuario: str
+        - id_seguido: str
+        
+    Regresa un JSON con el seguimiento:
+        - seguidor: str
+        - seguido: str
+    """
+    if id_usuario == id_seguido:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Un usuario no puede seguirse a sí mismo')
+    if repo_usuarios.obtener(id_usuario) is None or repo_usuarios.obtener(id_seguido) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='Usuario no encontrado')
+
+    seguimiento = {'id_seguimiento': f'{id_usuario}:{id_seguido}',
+                   'seguidor': id_usuario,
+                   'seguido': id_seguido}
+    try:
+        repo_seguimientos.insertar(seguimiento)
+    except RegistroDuplicado:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail='El usuario ya sigue a este usuario')
+    return seguimiento
+
+# Dejar de seguir a un usuario
+@app.delete(
+    path='/usuarios/{id_usuario}/seguir/{id_seguido}',
+    response_model=Seguimiento,
+    status_code=status.HTTP_200_OK,
+    summary='Deja de seguir a un usuario',
+    tags=['Seguidores']
+)
+def dejar_de_seguir(id_usuario: str = Path(...,
+                                           title='ID Usuario',
+                                           description='ID del usuario que deja de seguir'),
+                    id_seguido: str = Path(...,
+                                           title='ID Seguido',
+                                           description='ID del usuario que se deja de seguir')
+    ) -> Seguimiento:
+    """
+    Dejar de seguir
+    
+    Parameters:
+        - id_usuario: str
+        - id_seguido: str
+        
+    Regresa un JSON con el seguimiento borrado:
+        - seguidor: str
+        - seguido: str
+    """
+    seguimiento = repo_seguimientos.borrar(f'{id_usuario}:{id_seguido}')
+    if seguimiento is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='El usuario no sigue a este usuario')
+    return seguimiento
+
+# Timeline de un usuario
+@app.get(
+    path='/usuarios/{id_usuario}/timeline',
+    response_model=List[TweetOut],
+    status_code=status.HTTP_200_OK,
+    summary='Muestra el timeline de un usuario',
+    tags=['Seguidores']
+)
+def mostrar_timeline(response: Response,
+                     id_usuario: str = Path(...,
+                                            title='ID Usuario',
+                                            description='ID del usuario dueño del timeline'),
+                     limit: int = Query(LIMITE_PAGINA, ge=1, le=LIMITE_MAXIMO,
+                                        description='Número máximo de tweets'),
+                     after: Optional[str] = Query(None, description='Cursor X-Cursor-Siguiente de la página anterior')
+    ) -> List[TweetOut]:
+    """
+    Timeline
+    
+    Muestra los tweets del usuario y de las cuentas que sigue, del más
+    nuevo al más antiguo
+    
+    Parameters:
+        - id_usuario: str
+        - limit: int (por defecto 100)
+        - after: str (cursor de la página anterior)
+        
+    Regresa un JSON con los tweets del timeline con las siguientes llaves:
+        - id_tweet: str
+        - contenido: str
+        - id_autor: str
+        - autor: AutorTweet
+        - fecha_pub: date
+        - fecha_act: date
+    """
+    if repo_usuarios.obtener(id_usuario) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='Usuario no encontrado')
+    antes = leer_cursor(after, LONGITUD_CURSOR['tweets'])
+
+    claves = timelines.timeline(id_usuario, limit, antes,
+                                existe=lambda id_tweet: repo_tweets.obtener(id_tweet) is not None)
+    if len(claves) == limit:
+        response.headers['X-Cursor-Siguiente'] = codificar_cursor(claves[-1])
+    tweets = (repo_tweets.obtener(clave[-1]) for clave in claves)
+    return responder(TweetOut, cache_autores.hidratar([tweet for tweet in tweets if tweet is not None]), response)
+
+# Tweets de un usuario
+@app.get(
+    path='/usuarios/{id_usuario}/tweets',
+    response_model=List[TweetOut],
+    status_code=status.HTTP_200_OK,
+    summary='Muestra los tweets de un usuario',
+    tags=['Tweets']
+)
+def mostrar_tweets_usuario(response: Response,
+                           id_usuario: str = Path(...,
+                                                  title='ID Usuario',
+                                                  description='ID del autor de los tweets'),
+                           limit: int = Query(LIMITE_PAGINA, ge=1, le=LIMITE_MAXIMO,
+                                              description='Número máximo de tweets'),
+                           after: Optional[str] = Query(None, description='Cursor X-Cursor-Siguiente de la página anterior')
+    ) -> List[TweetOut]:
+    """
+    Tweets de un usuario
+    
+    Muestra los tweets publicados por un usuario, del más nuevo al más
+    antiguo. Se leen del índice por autor, así que cada página cuesta lo
+    mismo sin importar cuántos tweets haya en total
+    
+    Parameters:
+        - id_usuario: str
+        - limit: int (por defecto 100)
+        - after: str (cursor de la página anterior)
+        
+    Regresa un JSON con los tweets del usuario con las siguientes llaves:
+        - id_tweet: str
+        - contenido: str
+        - id_autor: str
+        - autor: AutorTweet
+        - fecha_pub: date
+        - fecha_act: date
+    """
+    if repo_usuarios.obtener(id_usuario) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='Usuario no encontrado')
+    antes = leer_cursor(after, LONGITUD_CURSOR['tweets'])
+
+    claves = repo_tweets.indices['autor'].anteriores(id_usuario, antes, limit)
+    if len(claves) == limit:
+        response.headers['X-Cursor-Siguiente'] = codificar_cursor(claves[-1])
+    tweets = repo_tweets.obtener_varios(clave[-1] for clave in claves)
+    return responder(TweetOut, cache_autores.hidratar([tweets[clave[-1]] for clave in claves if clave[-1] in tweets]),
+                     response)
 
 ##### Tweets #####
 
 # Mostrar todos los tweets
 @app.get(
     path="/tweets",
-    response_model=List[Tweet],
+    response_model=List[TweetOut],
     status_code=status.HTTP_200_OK,
     summary="Muestra a todos los tweets",
     tags=["Tweets"]
 )
-def mostrar_tweets() -> List[Tweet]:
+def mostrar_tweets(response: Response,
+                   limit: Optional[int] = Query(None, ge=1, le=LIMITE_MAXIMO,
+                                                description='Número máximo de registros'),
+                   after: Optional[str] = Query(None, description='Cursor X-Cursor-Siguiente de la página anterior'),
+                   formato: str = Query('json', regex='^(json|ndjson)$')) -> List[TweetOut]:
     """
-    Muestra todos los tweets de la aplicación
+    Muestra los tweets de la aplicación en orden de publicación, paginados por cursor
     
     Parameters:
-        - 
+        - limit: int (por defecto 100)
+        - after: str (cursor de la página anterior)
+        - formato: json | ndjson
         
     Regresa un JSON con todos los tweets en la aplicación con las siguientes llaves:
         - id_tweet: str
         - contenido: str
-        - autor: Usuario
+        - id_autor: str
+        - autor: AutorTweet
         - fecha_pub: date
         - fecha_act: date    
     """
-    with open('./tweets.json', 'r', encoding='utf-8') as f:
-        contenido = json.loads(f.read())
-        return contenido
+    return paginar(repo_tweets, TweetOut, response, limit, after, formato, cache_autores.hidratar)
+
+# Buscar tweets
+@app.get(
+    path="/tweets/search",
+    response_model=List[TweetOut],
+    status_code=status.HTTP_200_OK,
+    summary="Busca tweets por su contenido",
+    tags=["Tweets"]
+)
+def buscar_tweets(response: Response,
+                  q: str = Query(...,
+                                 min_length=1,
+                                 title='Consulta',
+                                 description='Palabras a buscar; no distingue acentos ni mayúsculas'),
+                  limit: int = Query(20, ge=1, le=LIMITE_MAXIMO)) -> List[TweetOut]:
+    """
+    Busca tweets por su contenido, ordenados por relevancia (BM25)
+    
+    Parameters:
+        - q: str
+        - limit: int (por defecto 20)
+        
+    Regresa un JSON con los tweets encontrados con las siguientes llaves:
+        - id_tweet: str
+        - contenido: str
+        - id_autor: str
+        - autor: AutorTweet
+        - fecha_pub: date
+        - fecha_act: date    
+    """
+    resultados = (repo_tweets.obtener(id_tweet) for _, id_tweet in indice_busqueda.buscar(q, limit))
+    return responder(TweetOut, cache_autores.hidratar([tweet for tweet in resultados if tweet is not None]), response)
+
+# Tendencias
+@app.get(
+    path="/trends",
+    response_model=List[Tendencia],
+    status_code=status.HTTP_200_OK,
+    summary="Muestra los hashtags y menciones más usados",
+    tags=["Tweets"]
+)
+def mostrar_tendencias(window: str = Query('1h',
+                                           regex='^(' + '|'.join(VENTANAS) + ')$',
+                                           title='Ventana',
+                                           description='Periodo a considerar: ' + ', '.join(VENTANAS)),
+                       limit: int = Query(10, ge=1, le=tendencias.capacidad)) -> List[Tendencia]:
+    """
+    Muestra los hashtags (#) y menciones (@) más usados en los tweets
+    publicados dentro de la ventana, sin acentos ni mayúsculas. Los
+    conteos son aproximados y la respuesta tarda lo mismo sin importar
+    cuántos tweets haya.
+
+    Parameters:
+        - window: str (5m, 1h o 24h; por defecto 1h)
+        - limit: int (por defecto 10)
+
+    Regresa un JSON con las tendencias, de la más usada a la menos, con las siguientes llaves:
+        - termino: str
+        - tipo: str (hashtag o mencion)
+        - tweets: int
+    """
+    return tendencias.top(window, limit)
 
 # Postear un tweet
 @app.post(
     path="/post_tweet",
-    response_model=Tweet,
+    response_model=TweetOut,
     status_code=status.HTTP_201_CREATED,
     summary="Postea un tweet",
     tags=["Tweets"]
 )
-def post(tweet: Tweet = Body(...)) -> Tweet: 
+def post(tweet: Tweet = Body(...)) -> TweetOut: 
     """
     Postea un tweet en la aplicación
     
@@ -336,29 +1287,54 @@ def post(tweet: Tweet = Body(...)) -> Tweet:
     Regresa un JSON con el tweet posteado en la aplicación con las siguientes llaves:
         - id_tweet: str
         - contenido: str
-        - autor: Usuario
+        - id_autor: str
+        - autor: AutorTweet
         - fecha_pub: date
         - fecha_act: date    
     """
-    with open("./tweets.json", "r+", encoding="utf-8") as f:
-        tweets = json.load(f)
-        tweet_dict = tweet.dict()
-        tweets.append(tweet_dict)
-        f.seek(0)
-        json.dump(tweets, f, default=str, indent=4)
-        return tweet
+    return esperar(alta_tweet(tweet))
+
+# Postear tweets en lote
+@app.post(
+    path="/tweets/batch",
+    response_model=ResultadoLote,
+    status_code=status.HTTP_200_OK,
+    summary="Postea muchos tweets",
+    tags=["Tweets"]
+)
+async def post_lote(request: Request) -> ResultadoLote:
+    """
+    Postea muchos tweets en una sola transacción. El cuerpo es un arreglo
+    JSON de tweets o, con Content-Type application/x-ndjson, un tweet por
+    línea
+    
+    Regresa un JSON con las siguientes llaves:
+        - insertados: int
+        - errores: lista de {indice, detalle} de los tweets rechazados
+    """
+    async def preparar(validos):
+        autores = cache_autores.obtener({tweet.id_autor for _, tweet in validos})
+        preparados, errores = [], []
+        for posicion, tweet in validos:
+            if tweet.id_autor in autores:
+                preparados.append((posicion, tweet.dict()))
+            else:
+                errores.append({'indice': posicion, 'detalle': 'Autor no encontrado'})
+        return preparados, errores
+    return await insertar_lote(request, Tweet, preparar, repo_tweets, 'El ID del tweet ya existe')
 
 # Mostrar un tweet especifico
 @app.get(
     path='/tweets/{id_tweet}',
-    response_model=Tweet,
+    response_model=TweetOut,
     summary='Muestra un tweet',
     status_code=status.HTTP_200_OK,
     tags=['Tweets']
 )
-def mostrar_tweet(id_tweet: str = Path(...,
-                                        title='ID del tweet',
-                                        description='ID del tweet a mostrar')) -> Tweet:
+def mostrar_tweet(request: Request,
+                  id_tweet: str = Path(...,
+                                       title='ID del tweet',
+                                       description='ID del tweet a mostrar')) -> TweetOut:
     """
     Muestra un tweet de la aplicación
     
@@ -368,25 +1344,17 @@ def mostrar_tweet(id_tweet: str = Path(...,
     Regresa un JSON con el tweet especificado con las siguientes llaves:
         - id_tweet: str
         - contenido: str
-        - autor: Usuario
+        - id_autor: str
+        - autor: AutorTweet
         - fecha_pub: date
         - fecha_act: date 
     """
-    with open('./tweets.json', 'r+', encoding='utf-8') as f:
-        tweets = json.loads(f.read())
-        
-        for tweet in tweets:
-            if str(tweet['id_tweet']) == str(id_tweet):
-                return tweet
-        
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, 
-            detail='Tweet no encontrado')
+    return respuesta_tweet(request, id_tweet)
 
 # Actualizar un tweet
 @app.put(
     path='/tweets/{id_tweet}',
-    response_model=Tweet,
+    response_model=TweetOut,
     status_code=status.HTTP_200_OK,
     summary='Actualiza un tweet',
     tags=['Tweets']
@@ -396,7 +1364,7 @@ def actualizar_tweet(id_tweet: str = Path(...,
                                         description='ID del tweet a actualizar'),
                      tweet_act: Tweet = Body(...,
                                              title='Tweet actualizado',
-                                             description='Tweet con los valores actualizados')) -> Tweet:
+                                             description='Tweet con los valores actualizados')) -> TweetOut:
     """
     Actualizar un tweet
     
@@ -409,29 +1377,198 @@ def actualizar_tweet(id_tweet: str = Path(...,
     Regresa un JSON con el tweet actualizado y con las siguientes llaves:
         - id_tweet: str
         - contenido: str
-        - autor: Usuario
+        - id_autor: str
+        - autor: AutorTweet
         - fecha_pub: date
         - fecha_act: date        
+        - version: int
+
+    La versión anterior queda en el historial del tweet (ver
+    /tweets/{id_tweet}/history); timestamp_pub se conserva y
+    timestamp_act es el momento de la edición.
     """
-    diccionario_tweet = tweet_act.dict()
-    diccionario_tweet['timestamp_pub'] = str(diccionario_tweet['timestamp_pub'])
-    diccionario_tweet['timestamp_act'] = str(diccionario_tweet['timestamp_act'])
-    
-    with open('./tweets.json', 'r+', encoding='utf-8') as f:
-        tweets = json.loads(f.read())
-        
-    for tweet in tweets:
-        if str(tweet['id_tweet']) == id_tweet:
-            tweets[tweets.index(tweet)] = diccionario_tweet
-            with open('./tweets.json', 'w', encoding='utf-8') as f:
-                f.seek(0)
-                f.write(json.dumps(tweets))
-            return diccionario_tweet
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail='Tweet no encontrado'
-            )
+    return esperar(edicion_tweet(id_tweet, tweet_act))
+
+# Historial de un tweet
+@app.get(
+    path='/tweets/{id_tweet}/history',
+    response_model=List[VersionTweet],
+    status_code=status.HTTP_200_OK,
+    summary='Muestra el historial de ediciones de un tweet',
+    tags=['Tweets']
+)
+def mostrar_historial(id_tweet: str = Path(...,
+                                          title='ID del tweet',
+                                          description='ID del tweet cuyo historial se muestra'),
+                      limite: Optional[int] = Query(None,
+                                                    ge=1,
+                                                    title='Límite',
+                                                    description='Cuántas versiones regresar, empezando por la actual')) -> List[VersionTweet]:
+    """
+    Historial de un tweet
+
+    Muestra las versiones de un tweet, de la actual a la primera. Las
+    versiones anteriores se reconstruyen a partir de la actual con los
+    deltas guardados en cada edición.
+
+    Parameters:
+        - id_tweet: str
+        - limite: int
+
+    Regresa una lista de JSONs con las siguientes llaves:
+        - version: int
+        - contenido: str
+        - timestamp: datetime
+    """
+    return esperar(versiones_tweet(id_tweet, limite))
+
+def interactuar(id_tweet: str, tipo: str, delta: int) -> dict:
+    tweet_existente(id_tweet)
+    contadores_tweet = contadores.incrementar(id_tweet, tipo, delta)
+    if contadores_tweet is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail='El tweet no tiene likes que quitar')
+    return dict(contadores_tweet, id_tweet=id_tweet)
+
+# Dar like a un tweet
+@app.post(
+    path='/tweets/{id_tweet}/like',
+    response_model=Interacciones,
+    status_code=status.HTTP_200_OK,
+    summary='Da like a un tweet',
+    tags=['Tweets']
+)
+def dar_like(id_tweet: str = Path(...,
+                                  title='ID del tweet',
+                                  description='ID del tweet al que se da like')) -> Interacciones:
+    """
+    Dar like
+
+    Suma un like al tweet. El contador se acumula en memoria y se guarda
+    cada TWITTER_INTERVALO_CONTADORES segundos, sin reescribir el tweet.
+
+    Parameters:
+        - id_tweet: str
+
+    Regresa un JSON con los contadores del tweet, ya con el like:
+        - id_tweet: str
+        - likes: int
+        - retweets: int
+        - respuestas: int
+    """
+    return interactuar(id_tweet, 'likes', 1)
+
+# Quitar un like
+@app.delete(
+    path='/tweets/{id_tweet}/like',
+    response_model=Interacciones,
+    status_code=status.HTTP_200_OK,
+    summary='Quita un like de un tweet',
+    tags=['Tweets']
+)
+def quitar_like(id_tweet: str = Path(...,
+                                     title='ID del tweet',
+                                     description='ID del tweet al que se quita el like')) -> Interacciones:
+    """
+    Quitar like
+
+    Resta un like al tweet. Si el tweet no tiene likes regresa 409 y no
+    cambia nada
+
+    Parameters:
+        - id_tweet: str
+
+    Regresa un JSON con los contadores del tweet:
+        - id_tweet: str
+        - likes: int
+        - retweets: int
+        - respuestas: int
+    """
+    return interactuar(id_tweet, 'likes', -1)
+
+# Retweetear
+@app.post(
+    path='/tweets/{id_tweet}/retweet',
+    response_model=Interacciones,
+    status_code=status.HTTP_200_OK,
+    summary='Retweetea un tweet',
+    tags=['Tweets']
+)
+def retweetear(id_tweet: str = Path(...,
+                                    title='ID del tweet',
+                                    description='ID del tweet a retweetear')) -> Interacciones:
+    """
+    Retweetear
+
+    Suma un retweet al tweet
+
+    Parameters:
+        - id_tweet: str
+
+    Regresa un JSON con los contadores del tweet, ya con el retweet:
+        - id_tweet: str
+        - likes: int
+        - retweets: int
+        - respuestas: int
+    """
+    return interactuar(id_tweet, 'retweets', 1)
+
+# Responder un tweet
+@app.post(
+    path='/tweets/{id_tweet}/reply',
+    response_model=TweetOut,
+    status_code=status.HTTP_201_CREATED,
+    summary='Responde un tweet',
+    tags=['Tweets']
+)
+def responder_tweet(id_tweet: str = Path(...,
+                                         title='ID del tweet',
+                                         description='ID del tweet al que se responde'),
+                    tweet: Tweet = Body(...,
+                                        title='Respuesta')) -> TweetOut:
+    """
+    Responder un tweet
+
+    Postea un tweet como respuesta a otro y suma una respuesta a sus
+    contadores. Al borrar la respuesta se resta.
+
+    Parameters:
+        - id_tweet: str = Path
+        - tweet: Tweet = Body
+
+    Regresa un JSON con la respuesta posteada, con las mismas llaves que
+    /post_tweet más en_respuesta_a
+    """
+    return esperar(alta_tweet(tweet, en_respuesta_a=id_tweet))
+
+# Interacciones de un tweet
+@app.get(
+    path='/tweets/{id_tweet}/interacciones',
+    response_model=Interacciones,
+    status_code=status.HTTP_200_OK,
+    summary='Muestra los likes, retweets y respuestas de un tweet',
+    tags=['Tweets']
+)
+def mostrar_interacciones(id_tweet: str = Path(...,
+                                               title='ID del tweet',
+                                               description='ID del tweet cuyas interacciones se muestran')) -> Interacciones:
+    """
+    Interacciones de un tweet
+
+    Muestra los contadores del tweet, incluidos los incrementos que aún
+    no se guardan
+
+    Parameters:
+        - id_tweet: str
+
+    Regresa un JSON con las siguientes llaves:
+        - id_tweet: str
+        - likes: int
+        - retweets: int
+        - respuestas: int
+    """
+    return interacciones(id_tweet)
 
 # Borrar un tweet
 @app.delete(
@@ -442,7 +1579,7 @@ def actualizar_tweet(id_tweet: str = Path(...,
 )
 def borrar_tweet(id_tweet: str = Path(...,
                                         title='ID del tweet',
-                                        description='ID del tweet a borrar')) -> Tweet:
+                                        description='ID del tweet a borrar')) -> Response:
     """
     Borrar
     
@@ -451,24 +1588,6 @@ def borrar_tweet(id_tweet: str = Path(...,
     Parameters:
         - id_tweet: str
         
-    Regresa un JSON con el tweet borrado y con las siguientes llaves:
-        - id_tweet: str
-        - contenido: str
-        - autor: Usuario
-        - fecha_pub: date
-        - fecha_act: date        
+    Regresa 204 sin contenido
     """
-    with open('./tweets.json', 'r+', encoding='utf-8') as f: 
-        tweets = json.loads(f.read())
-    for tweet in tweets:
-        if str(tweet['id_tweet']) == id_tweet:
-            tweets.remove(tweet)
-            with open('./tweets.json', 'w', encoding='utf-8') as f:
-                f.seek(0)
-                f.write(json.dumps(tweets))
-            return tweet
-    
-    raise HTTPException(
-        status_code=status.HTTP_404_NOT_FOUND,
-        detail='Tweet no encontrado'
-    )
\ No newline at end of file
+    return esperar(baja_tweet(id_tweet))
\ No newline at end of file
@@ -0,0 +1,157 @@
+"""
+Variante asíncrona de la API
+
+Mismas rutas, modelos y documentación que main_tw, pero los handlers que
+tocan el almacenamiento son `async def`: las lecturas se resuelven en
+los índices en memoria y las escrituras se esperan con await, sin pasar
+por el threadpool de anyio. Los cuerpos de los handlers son los de
+main_tw (ver "Handlers compartidos" ahí); aquí solo se corren con await.
+
+    $ uvicorn main_tw_async:app
+"""
+from fastapi import Body, FastAPI, Path, Query, Request, Response
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
+from limites import MiddlewareAdmision
+from main_tw import (LIMITE_MAXIMO, Tweet, TweetOut, UsuarioIngresar, UsuarioRegistro,
+                     cache_autores, paginar)
+import asyncio
+import main_tw, metricas
+
+app = FastAPI() # 🏁
+# Cada aplicación lleva su propio middleware; solo se sirve una a la vez,
+# así que ninguna petición se cuenta dos veces. Las cubetas sí son las de main_tw.
+app.add_middleware(MiddlewareAdmision, limitador_ip=main_tw.limite_ip, maximo=main_tw.MAX_CONCURRENTES)
+app.add_middleware(metricas.MiddlewareMetricas)
+
+# Handlers compartidos
+
+async def esperar(pasos: main_tw.Pasos):
+    """
+    Corre un handler compartido de main_tw (ver main_tw.esperar) sin
+    bloquear el event loop: los Future se esperan con await y las funciones
+    bloqueantes van al threadpool
+    """
+    resultado, error = None, None
+    while True:
+        try:
+            paso = pasos.throw(error) if error is not None else pasos.send(resultado)
+        except StopIteration as fin:
+            return fin.value
+        resultado, error = None, None
+        try:
+            resultado = await (run_in_threadpool(paso) if callable(paso) else asyncio.wrap_future(paso))
+        except Exception as e:
+            error = e
+
+# Rutas
+
+_reemplazos = {}
+
+def asincrona(sincrona):
+    """Registra un handler async en la misma ruta y con la misma documentación que `sincrona`"""
+    ruta = next(r for r in main_tw.app.routes if isinstance(r, APIRoute) and r.endpoint is sincrona)
+
+    def registrar(funcion):
+        app.add_api_route(ruta.path, funcion,
+                          methods=list(ruta.methods),
+                          response_model=ruta.response_model,
+                          status_code=ruta.status_code,
+                          summary=ruta.summary,
+                          description=ruta.description,
+                          tags=ruta.tags)
+        _reemplazos[id(ruta)] = app.router.routes[-1]
+        return funcion
+    return registrar
+
+##### Usuarios #####
+
+@asincrona(main_tw.registrar)
+async def registrar(usuario: UsuarioRegistro = Body(...)):
+    return await esperar(main_tw.registro_usuario(usuario))
+
+@asincrona(main_tw.ingresar)
+async def ingresar(usuario: UsuarioIngresar):
+    return await esperar(main_tw.ingreso(usuario))
+
+@asincrona(main_tw.mostrar_usuarios)
+async def mostrar_usuarios(response: Response,
+                           limit: Optional[int] = Query(None, ge=1, le=LIMITE_MAXIMO),
+                           after: Optional[str] = Query(None),
+                           formato: str = Query('json', regex='^(json|ndjson)$')):
+    return paginar(main_tw.repo_usuarios, main_tw.Usuario, response, limit, after, formato)
+
+@asincrona(main_tw.mostrar_usuario)
+async def mostrar_usuario(request: Request, id_usuario: str = Path(..., title='ID Usuario')):
+    return main_tw.respuesta_usuario(request, id_usuario)
+
+@asincrona(main_tw.actualizar_usuario)
+async def actualizar_usuario(id_usuario: str = Path(..., title='ID Usuario'),
+                             usuario_act: UsuarioRegistro = Body(..., title='Usuario Actualizado')):
+    return await esperar(main_tw.edicion_usuario(id_usuario, usuario_act))
+
+@asincrona(main_tw.borrar_usuario)
+async def borrar_usuario(response: Response, id_usuario: str = Path(..., title='ID Usuario')):
+    return await esperar(main_tw.baja_usuario(response, id_usuario))
+
+##### Tweets #####
+
+@asincrona(main_tw.mostrar_tweets)
+async def mostrar_tweets(response: Response,
+                         limit: Optional[int] = Query(None, ge=1, le=LIMITE_MAXIMO),
+                         after: Optional[str] = Query(None),
+                         formato: str = Query('json', regex='^(json|ndjson)$')):
+    return paginar(main_tw.repo_tweets, TweetOut, response, limit, after, formato, cache_autores.hidratar)
+
+@asincrona(main_tw.post)
+async def post(tweet: Tweet = Body(...)):
+    return await esperar(main_tw.alta_tweet(tweet))
+
+@asincrona(main_tw.mostrar_tweet)
+async def mostrar_tweet(request: Request, id_tweet: str = Path(..., title='ID del tweet')):
+    return main_tw.respuesta_tweet(request, id_tweet)
+
+@asincrona(main_tw.actualizar_tweet)
+async def actualizar_tweet(id_tweet: str = Path(..., title='ID del tweet'),
+                           tweet_act: Tweet = Body(..., title='Tweet actualizado')):
+    return await esperar(main_tw.edicion_tweet(id_tweet, tweet_act))
+
+@asincrona(main_tw.mostrar_historial)
+async def mostrar_historial(id_tweet: str = Path(..., title='ID del tweet'),
+                            limite: Optional[int] = Query(None, ge=1, title='Límite')):
+    return await esperar(main_tw.versiones_tweet(id_tweet, limite))
+
+# Los contadores solo suman en memoria: no hace falta el threadpool
+
+@asincrona(main_tw.dar_like)
+async def dar_like(id_tweet: str = Path(..., title='ID del tweet')):
+    return main_tw.interactuar(id_tweet, 'likes', 1)
+
+@asincrona(main_tw.quitar_like)
+async def quitar_like(id_tweet: str = Path(..., title='ID del tweet')):
+    return main_tw.interactuar(id_tweet, 'likes', -1)
+
+@asincrona(main_tw.retweetear)
+async def retweetear(id_tweet: str = Path(..., title='ID del tweet')):
+    return main_tw.interactuar(id_tweet, 'retweets', 1)
+
+@asincrona(main_tw.responder_tweet)
+async def responder_tweet(id_tweet: str = Path(..., title='ID del tweet'),
+                          tweet: Tweet = Body(...)):
+    return await esperar(main_tw.alta_tweet(tweet, en_respuesta_a=id_tweet))
+
+@asincrona(main_tw.mostrar_interacciones)
+async def mostrar_interacciones(id_tweet: str = Path(..., title='ID del tweet')):
+    return main_tw.interacciones(id_tweet)
+
+@asincrona(main_tw.borrar_tweet)
+async def borrar_tweet(id_tweet: str = Path(..., title='ID del tweet')):
+    return await esperar(main_tw.baja_tweet(id_tweet))
+
+# Las rutas quedan en el mismo orden que en main_tw; las que no tienen
+# versión asíncrona se sirven con el handler original
+app.router.routes = ([r for r in app.router.routes if not isinstance(r, APIRoute)] +
+                     [_reemplazos.get(id(r), r) for r in main_tw.app.routes if isinstance(r, APIRoute)])
+app.router.on_startup.extend(main_tw.app.router.on_startup)
+app.router.on_shutdown.extend(main_tw.app.router.on_shutdown)
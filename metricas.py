@@ -0,0 +1,256 @@
+"""
+Métricas
+
+Contadores, medidores e histogramas en memoria que se exponen en el
+formato de texto de Prometheus, más un middleware ASGI que mide cada
+petición por ruta: latencia, peticiones en curso y tamaño del cuerpo.
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from starlette.routing import Match
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+import threading, time
+
+BUCKETS_SEGUNDOS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_BYTES = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+_registro: List['Metrica'] = []
+
+
+def _formato(valor: float) -> str:
+    return str(int(valor)) if float(valor).is_integer() else repr(float(valor))
+
+
+def _etiquetas(nombres: Sequence[str], valores: Sequence[str], extra: str = '') -> str:
+    pares = [f'{n}="' + str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+             for n, v in zip(nombres, valores)]
+    if extra:
+        pares.append(extra)
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+
+class Metrica:
+    tipo = ''
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()) -> None:
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._bloqueo = threading.Lock()
+        _registro.append(self)
+
+    def _clave(self, etiquetas: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(etiquetas[nombre]) for nombre in self.etiquetas)
+
+    def muestras(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def exponer(self) -> str:
+        lineas = [f'# HELP {self.nombre} {self.ayuda}', f'# TYPE {self.nombre} {self.tipo}']
+        lineas.extend(self.muestras())
+        return '\n'.join(lineas)
+
+
+class Contador(Metrica):
+    tipo = 'counter'
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()) -> None:
+        super().__init__(nombre, ayuda, etiquetas)
+        self._valores: Dict[Tuple[str, ...], float] = {}
+
+    def incrementar(self, valor: float = 1, **etiquetas: str) -> None:
+        clave = self._clave(etiquetas)
+        with self._bloqueo:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+    def muestras(self) -> Iterator[str]:
+        with self._bloqueo:
+            valores = list(self._valores.items())
+        for clave, valor in valores:
+            yield f'{self.nombre}{_etiquetas(self.etiquetas, clave)} {_formato(valor)}'
+
+
+class Medidor(Metrica):
+    """Gauge; con `funcion` el valor se calcula al exponer, una muestra por etiqueta que regrese"""
+    tipo = 'gauge'
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = (),
+                 funcion: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None) -> None:
+        super().__init__(nombre, ayuda, etiquetas)
+        self.funcion = funcion
+        self._valores: Dict[Tuple[str, ...], float] = {}
+
+    def sumar(self, valor: float, **etiquetas: str) -> None:
+        clave = self._clave(etiquetas)
+        with self._bloqueo:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+    def muestras(self) -> Iterator[str]:
+        if self.funcion is not None:
+            valores = list(self.funcion().items())
+        else:
+            with self._bloqueo:
+                valores = list(self._valores.items())
+        for clave, valor in valores:
+            yield f'{self.nombre}{_etiquetas(self.etiquetas, clave)} {_formato(valor)}'
+
+
+class Histograma(Metrica):
+    tipo = 'histogram'
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = (),
+                 buckets: Sequence[float] = BUCKETS_SEGUNDOS) -> None:
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(buckets)
+        # Por etiqueta: conteo por bucket (el último es +Inf), suma y total
+        self._valores: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observar(self, valor: float, **etiquetas: str) -> None:
+        clave = self._clave(etiquetas)
+        posicion = bisect_left(self.buckets, valor)
+        with self._bloqueo:
+            if clave not in self._valores:
+                self._valores[clave] = ([0] * (len(self.buckets) + 1), [0.0])
+            conteos, suma = self._valores[clave]
+            conteos[posicion] += 1
+            suma[0] += valor
+
+    @contextmanager
+    def medir(self, **etiquetas: str) -> Iterator[None]:
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, **etiquetas)
+
+    def muestras(self) -> Iterator[str]:
+        with self._bloqueo:
+            valores = [(clave, list(conteos), suma[0]) for clave, (conteos, suma) in self._valores.items()]
+        for clave, conteos, suma in valores:
+            acumulado = 0
+            for limite, conteo in zip(self.buckets + (float('inf'),), conteos):
+                acumulado += conteo
+                le = 'le="+Inf"' if limite == float('inf') else f'le="{_formato(limite)}"'
+                yield f'{self.nombre}_bucket{_etiquetas(self.etiquetas, clave, le)} {acumulado}'
+            yield f'{self.nombre}_sum{_etiquetas(self.etiquetas, clave)} {_formato(suma)}'
+            yield f'{self.nombre}_count{_etiquetas(self.etiquetas, clave)} {acumulado}'
+
+
+def exponer() -> str:
+    return '\n'.join(metrica.exponer() for metrica in _registro) + '\n'
+
+
+# Almacenamiento
+
+latencia_almacenamiento = Histograma('twitter_almacenamiento_segundos',
+                                     'Duración de las operaciones sobre SQLite',
+                                     ('tabla', 'operacion'))
+registros_leidos = Contador('twitter_almacenamiento_registros_leidos_total',
+                            'Registros leídos de SQLite', ('tabla', 'operacion'))
+tamano_lote = Histograma('twitter_escritor_lote_operaciones',
+                         'Operaciones por transacción del escritor',
+                         buckets=(1, 2, 5, 10, 25, 50, 100, 250, 512))
+latencia_commit = Histograma('twitter_escritor_commit_segundos',
+                             'Duración de cada transacción del escritor, incluido el fsync')
+
+# Sincronización entre procesos
+
+cambios_sincronizados = Contador('twitter_sincronizacion_registros_total',
+                                 'Registros escritos por otros procesos y aplicados en memoria', ('tabla',))
+retraso_sincronizacion = Histograma('twitter_sincronizacion_retraso_segundos',
+                                    'Tiempo desde que se confirma un cambio hasta que este proceso lo lee')
+
+# Instantáneas
+
+latencia_instantanea = Histograma('twitter_instantanea_segundos',
+                                  'Duración de guardar y cargar las instantáneas', ('tabla', 'operacion'))
+registros_reproducidos = Contador('twitter_instantanea_reproducidos_total',
+                                  'Registros releídos al arrancar por cambios posteriores a la instantánea',
+                                  ('tabla',))
+
+# Contadores de interacciones
+
+incrementos_contadores = Contador('twitter_contadores_incrementos_total',
+                                  'Likes, retweets y respuestas contados en memoria', ('tipo',))
+filas_volcado_contadores = Histograma('twitter_contadores_volcado_filas',
+                                      'Filas (tweet, tipo) escritas por cada volcado de contadores',
+                                      buckets=(1, 10, 100, 1000, 10000))
+
+# Admisión
+
+rechazos_admision = Contador('twitter_admision_rechazos_total',
+                             'Peticiones rechazadas por límite de tasa (ip, usuario) o de concurrencia',
+                             ('motivo',))
+
+# Etapas dentro de un handler (hidratar autores, codificar JSON, validar lotes)
+
+latencia_etapa = Histograma('twitter_etapa_segundos',
+                            'Duración de las etapas internas de las peticiones', ('etapa',))
+
+# HTTP
+
+latencia_http = Histograma('twitter_http_peticion_segundos',
+                           'Latencia de las peticiones por ruta',
+                           ('metodo', 'ruta', 'codigo'))
+en_curso_http = Medidor('twitter_http_peticiones_en_curso',
+                        'Peticiones en curso por ruta', ('metodo', 'ruta'))
+tamano_peticion = Histograma('twitter_http_peticion_bytes',
+                             'Tamaño del cuerpo de las peticiones', ('metodo', 'ruta'),
+                             buckets=BUCKETS_BYTES)
+tamano_respuesta = Histograma('twitter_http_respuesta_bytes',
+                              'Tamaño del cuerpo de las respuestas', ('metodo', 'ruta'),
+                              buckets=BUCKETS_BYTES)
+
+
+class MiddlewareMetricas:
+    """
+    Middleware ASGI. La ruta se reporta con su plantilla
+    (/tweets/{id_tweet}) para no crear una serie por cada id; las
+    peticiones que no corresponden a ninguna ruta se agrupan en
+    'sin_ruta'. El cuerpo de la respuesta se cuenta conforme se envía,
+    así que también funciona con StreamingResponse.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    @staticmethod
+    def _ruta(scope) -> str:
+        parcial = None
+        for ruta in scope['app'].router.routes:
+            coincidencia, _ = ruta.matches(scope)
+            if coincidencia == Match.FULL:
+                return getattr(ruta, 'path', 'sin_ruta')
+            if coincidencia == Match.PARTIAL and parcial is None:
+                parcial = getattr(ruta, 'path', None)
+        return parcial or 'sin_ruta'
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        metodo, ruta = scope['method'], self._ruta(scope)
+        codigo, recibidos, enviados = [500], [0], [0]
+
+        async def recibir():
+            mensaje = await receive()
+            recibidos[0] += len(mensaje.get('body', b''))
+            return mensaje
+
+        async def enviar(mensaje) -> None:
+            if mensaje['type'] == 'http.response.start':
+                codigo[0] = mensaje['status']
+            elif mensaje['type'] == 'http.response.body':
+                enviados[0] += len(mensaje.get('body', b''))
+            await send(mensaje)
+
+        en_curso_http.sumar(1, metodo=metodo, ruta=ruta)
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, recibir, enviar)
+        finally:
+            en_curso_http.sumar(-1, metodo=metodo, ruta=ruta)
+            latencia_http.observar(time.perf_counter() - inicio, metodo=metodo, ruta=ruta, codigo=str(codigo[0]))
+            tamano_peticion.observar(recibidos[0], metodo=metodo, ruta=ruta)
+            tamano_respuesta.observar(enviados[0], metodo=metodo, ruta=ruta)
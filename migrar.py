@@ -0,0 +1,88 @@
+"""
+Migración
+
+Importa los archivos usuarios.json y tweets.json al almacenamiento de la API.
+
+Los tweets con el autor embebido se convierten a una referencia
+`id_autor`. Con --normalizar se convierten también los tweets que ya
+estaban en la base.
+
+    $ python3 migrar.py --db twitter.db --usuarios usuarios.json --tweets tweets.json
+    $ python3 migrar.py --db twitter.db --normalizar
+"""
+from almacenamiento import AlmacenSQLite, Registro
+from autores import CAMPOS_PUBLICOS
+from typing import Dict, List, Tuple
+import argparse, json, os
+import seguridad
+
+
+def normalizar_tweets(tweets: List[Registro], usuarios: List[Registro]) -> Tuple[List[Registro], List[Registro]]:
+    """
+    Cambia el autor embebido de cada tweet por su id_autor.
+
+    El autor se busca por id y después por email entre los usuarios; si
+    no existe se crea a partir de la copia embebida, sin contraseña.
+    Regresa los tweets normalizados y los usuarios que hubo que crear.
+    """
+    por_id: Dict[str, Registro] = {u['id_usuario']: u for u in usuarios}
+    por_email: Dict[str, Registro] = {u['email'].lower(): u for u in usuarios}
+    creados: List[Registro] = []
+    normalizados = []
+    for tweet in tweets:
+        autor = tweet.pop('autor', None)
+        if 'id_autor' not in tweet and autor is not None:
+            usuario = por_id.get(autor['id_usuario']) or por_email.get(autor['email'].lower())
+            if usuario is None:
+                usuario = {campo: autor.get(campo) for campo in CAMPOS_PUBLICOS}
+                usuario.update(fecha_nacimiento=autor.get('fecha_nacimiento'), contrasena='')
+                por_id[usuario['id_usuario']] = por_email[usuario['email'].lower()] = usuario
+                creados.append(usuario)
+            tweet['id_autor'] = usuario['id_usuario']
+        normalizados.append(tweet)
+    return normalizados, creados
+
+
+def importar_json(almacen: AlmacenSQLite, ruta_usuarios: str, ruta_tweets: str) -> None:
+    with open(ruta_usuarios, 'r', encoding='utf-8') as f:
+        usuarios = json.loads(f.read())
+    for usuario in usuarios:
+        if not usuario['contrasena'].startswith('scrypt$'):
+            usuario['contrasena'] = seguridad.generar_hash(usuario['contrasena'])
+    with open(ruta_tweets, 'r', encoding='utf-8') as f:
+        tweets = json.loads(f.read())
+
+    repo_usuarios = almacen.repositorio('usuarios', 'id_usuario')
+    tweets, creados = normalizar_tweets(tweets, usuarios + list(repo_usuarios.listar()))
+    importados = repo_usuarios.importar(usuarios + creados)
+    print(f'Usuarios importados: {importados} ({len(creados)} autores creados desde los tweets)')
+    importados = almacen.repositorio('tweets', 'id_tweet').importar(tweets)
+    print(f'Tweets importados: {importados}')
+
+
+def normalizar_almacen(almacen: AlmacenSQLite) -> None:
+    """Convierte los tweets guardados con el autor embebido"""
+    repo_usuarios = almacen.repositorio('usuarios', 'id_usuario')
+    repo_tweets = almacen.repositorio('tweets', 'id_tweet')
+    pendientes = [t for t in repo_tweets.listar() if 'id_autor' not in t]
+    tweets, creados = normalizar_tweets(pendientes, list(repo_usuarios.listar()))
+    repo_usuarios.importar(creados)
+    importados = repo_tweets.importar(tweets)
+    print(f'Tweets normalizados: {importados} ({len(creados)} autores creados)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Importa los archivos JSON al almacenamiento')
+    parser.add_argument('--db', default=os.environ.get('TWITTER_DB', './twitter.db'))
+    parser.add_argument('--usuarios', default='./usuarios.json')
+    parser.add_argument('--tweets', default='./tweets.json')
+    parser.add_argument('--normalizar', action='store_true',
+                        help='solo convierte los tweets ya guardados con el autor embebido')
+    argumentos = parser.parse_args()
+
+    almacen = AlmacenSQLite(argumentos.db)
+    if argumentos.normalizar:
+        normalizar_almacen(almacen)
+    else:
+        importar_json(almacen, argumentos.usuarios, argumentos.tweets)
+    almacen.cerrar()
@@ -0,0 +1,53 @@
+"""
+Seguridad
+
+Hash de contraseñas con scrypt. El costo se ajusta con variables de
+entorno y el cálculo corre en un pool de hilos de tamaño fijo, de modo
+que los ingresos simultáneos no pueden acaparar todo el CPU.
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+import base64, hashlib, hmac, os
+
+SCRYPT_N = int(os.environ.get('TWITTER_SCRYPT_N', 2 ** 14))
+SCRYPT_R = int(os.environ.get('TWITTER_SCRYPT_R', 8))
+SCRYPT_P = int(os.environ.get('TWITTER_SCRYPT_P', 1))
+HILOS_HASH = int(os.environ.get('TWITTER_HILOS_HASH', os.cpu_count() or 2))
+
+_pool = ThreadPoolExecutor(max_workers=HILOS_HASH, thread_name_prefix='hash')
+
+
+def _scrypt(contrasena: str, sal: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(contrasena.encode('utf-8'), salt=sal, n=n, r=r, p=p,
+                          maxmem=256 * n * r, dklen=32)
+
+
+def generar_hash(contrasena: str) -> str:
+    """Regresa 'scrypt$n$r$p$sal$hash' con sal aleatoria"""
+    sal = os.urandom(16)
+    derivada = _scrypt(contrasena, sal, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return '$'.join(['scrypt', str(SCRYPT_N), str(SCRYPT_R), str(SCRYPT_P),
+                     base64.b64encode(sal).decode(), base64.b64encode(derivada).decode()])
+
+
+def verificar(contrasena: str, almacenada: str) -> bool:
+    """Compara una contraseña con su hash (o con texto plano de datos anteriores)"""
+    if not almacenada.startswith('scrypt$'):
+        return hmac.compare_digest(contrasena.encode('utf-8'), almacenada.encode('utf-8'))
+
+    _, n, r, p, sal, derivada = almacenada.split('$')
+    calculada = _scrypt(contrasena, base64.b64decode(sal), int(n), int(r), int(p))
+    return hmac.compare_digest(calculada, base64.b64decode(derivada))
+
+
+def necesita_rehash(almacenada: str) -> bool:
+    """True si el hash es texto plano o usa parámetros distintos a los actuales"""
+    return not almacenada.startswith(f'scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$')
+
+
+# Se usa para que un email inexistente cueste lo mismo que una contraseña incorrecta
+HASH_FICTICIO = generar_hash('')
+
+
+def en_pool(funcion, *argumentos) -> Future:
+    """Ejecuta una función de hash en el pool acotado"""
+    return _pool.submit(funcion, *argumentos)
@@ -0,0 +1,85 @@
+"""
+Sincronización entre procesos
+
+Con uvicorn --workers N cada proceso tiene sus propios índices, timelines
+y caches en memoria sobre la misma base SQLite. Las escrituras quedan en
+la tabla `cambios` (ver almacenamiento.py); un hilo de cada proceso
+revisa `PRAGMA data_version`, que cambia cuando otra conexión confirma
+una transacción, y vuelve a leer los registros que cambiaron. Al
+aplicarse en el RepositorioIndexado se avisa a sus suscriptores, así que
+los timelines, el índice de búsqueda y los caches se invalidan igual que
+con una escritura local.
+"""
+from collections import defaultdict
+from typing import Dict, List, Optional
+from almacenamiento import AlmacenSQLite
+from indices import RepositorioIndexado
+import sqlite3, threading, time, warnings
+import metricas
+
+
+class Sincronizador:
+    """
+    Se crea antes de cargar los repositorios: los cambios que lleguen
+    mientras cargan se vuelven a leer al iniciar, y releer un registro que
+    no cambió no tiene efecto.
+    """
+
+    def __init__(self, almacen: AlmacenSQLite, intervalo: float = 0.05, retencion: float = 3600) -> None:
+        self.almacen = almacen
+        self.intervalo = intervalo
+        self.retencion = retencion
+        self.ultimo = almacen.ultimo_cambio()
+        self._repositorios: Dict[str, RepositorioIndexado] = {}
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    def registrar(self, tabla: str, repositorio: RepositorioIndexado) -> None:
+        """`repositorio` puede ser cualquier objeto con recargar(ids), como los contadores"""
+        self._repositorios[tabla] = repositorio
+
+    def iniciar(self) -> None:
+        self._hilo = threading.Thread(target=self._ciclo, name='sincronizador', daemon=True)
+        self._hilo.start()
+
+    def detener(self) -> None:
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join()
+
+    def sincronizar(self) -> int:
+        """Aplica los cambios posteriores al último visto; regresa cuántos registros cambiaron"""
+        cambios = self.almacen.cambios_desde(self.ultimo)
+        if not cambios:
+            return 0
+        por_tabla: Dict[str, List[str]] = defaultdict(list)
+        ahora = time.time()
+        for _, tabla, id_registro, momento in cambios:
+            por_tabla[tabla].append(id_registro)
+            metricas.retraso_sincronizacion.observar(max(0.0, ahora - momento))
+        aplicados = 0
+        for tabla, ids in por_tabla.items():
+            repositorio = self._repositorios.get(tabla)
+            if repositorio is not None:
+                recargados = repositorio.recargar(ids)
+                metricas.cambios_sincronizados.incrementar(recargados, tabla=tabla)
+                aplicados += recargados
+        self.ultimo = cambios[-1][0]
+        return aplicados
+
+    def _ciclo(self) -> None:
+        # Conexión propia: data_version solo cuenta las confirmaciones de otras conexiones
+        conexion = sqlite3.connect(self.almacen.ruta, timeout=30)
+        version, ultima_poda = None, time.monotonic()
+        while not self._detener.wait(self.intervalo):
+            try:
+                actual = conexion.execute('PRAGMA data_version').fetchone()[0]
+                if actual != version:
+                    version = actual
+                    self.sincronizar()
+                if time.monotonic() - ultima_poda > 60:
+                    ultima_poda = time.monotonic()
+                    self.almacen.podar_cambios(self.retencion)
+            except Exception as error:
+                warnings.warn(f'Error al sincronizar cambios: {error!r}')
+        conexion.close()
@@ -0,0 +1,123 @@
+"""
+Tareas en segundo plano
+
+Trabajos largos (p. ej. borrar todo lo de un usuario) que corren en un
+hilo aparte, por bloques acotados y con una pausa entre bloques para no
+acaparar al escritor. Cada tarea se guarda en un repositorio con su
+estado y su avance, que se actualiza después de cada bloque; al
+reiniciar, las tareas que no terminaron se retoman, por lo que cada
+bloque debe poder repetirse sin efectos (idempotente).
+
+Antes de correr una tarea se reclama con un UPDATE condicional en la
+base, así que con varios workers sobre la misma base cada tarea corre en
+uno solo. Si la tarea en curso de un worker no avanza en `plazo`
+segundos (p. ej. porque el worker murió), otro la retoma; con plazo 0
+(un solo proceso) se retoman solo al arrancar.
+"""
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, Optional
+from almacenamiento import Registro, Repositorio
+from ids import nuevo_id
+import queue, threading, time
+
+# La función de un tipo de tarea recibe sus parámetros y produce, por
+# cada bloque terminado, cuánto avanzó: {'tweets': 500}
+Ejecutar = Callable[..., Iterator[Dict[str, int]]]
+
+PENDIENTE, EN_CURSO, TERMINADA, FALLIDA = 'pendiente', 'en_curso', 'terminada', 'fallida'
+
+# Pendiente, o en curso sin avanzar desde antes del parámetro
+RECLAMABLE = ("json_extract(datos, '$.estado') = ? OR "
+              "(json_extract(datos, '$.estado') = ? AND json_extract(datos, '$.actualizada') <= ?)")
+
+
+class Tareas:
+    def __init__(self, repositorio: Repositorio, pausa: float = 0.01,
+                 retencion: timedelta = timedelta(days=7), plazo: float = 0) -> None:
+        self.repositorio = repositorio
+        self.pausa = pausa
+        self.retencion = retencion
+        self.plazo = plazo
+        # Identifica a este proceso en las tareas que reclama
+        self.trabajador = nuevo_id()
+        self._tipos: Dict[str, Ejecutar] = {}
+        self._cola: 'queue.Queue[str]' = queue.Queue()
+        self._hilo: Optional[threading.Thread] = None
+
+    def registrar(self, tipo: str, ejecutar: Ejecutar) -> None:
+        self._tipos[tipo] = ejecutar
+
+    def crear(self, tipo: str, **parametros) -> Future:
+        """Future que regresa la tarea cuando ya es durable y está en la cola"""
+        ahora = datetime.now()
+        tarea = {'id_tarea': nuevo_id(), 'tipo': tipo, 'parametros': parametros, 'estado': PENDIENTE,
+                 'progreso': {}, 'creada': ahora, 'actualizada': ahora, 'error': None}
+        futuro = Future()
+
+        def al_guardar(guardado: Future) -> None:
+            if guardado.exception() is not None:
+                futuro.set_exception(guardado.exception())
+                return
+            self._cola.put(tarea['id_tarea'])
+            futuro.set_result(self.repositorio.obtener(tarea['id_tarea']))
+
+        self.repositorio.encolar_insertar(tarea).add_done_callback(al_guardar)
+        return futuro
+
+    def obtener(self, id_tarea: str) -> Optional[Registro]:
+        return self.repositorio.obtener(id_tarea)
+
+    def iniciar(self) -> None:
+        """Retoma las tareas sin terminar, borra las viejas y arranca el hilo"""
+        self._retomar()
+        self._hilo = threading.Thread(target=self._ciclo, name='tareas', daemon=True)
+        self._hilo.start()
+
+    def _retomar(self) -> None:
+        """Encola las tareas que se podrían reclamar; _ejecutar decide con la base"""
+        limite = str(datetime.now() - self.retencion)
+        vencida = str(datetime.now() - timedelta(seconds=self.plazo))
+        for tarea in self.repositorio.listar():
+            if tarea['estado'] == PENDIENTE or (tarea['estado'] == EN_CURSO and tarea['actualizada'] <= vencida):
+                self._cola.put(tarea['id_tarea'])
+            elif tarea['estado'] not in (PENDIENTE, EN_CURSO) and tarea['actualizada'] < limite:
+                self.repositorio.borrar(tarea['id_tarea'])
+
+    def _ciclo(self) -> None:
+        while True:
+            try:
+                id_tarea = self._cola.get(timeout=self.plazo or None)
+            except queue.Empty:
+                # Sin trabajo propio: busca tareas de workers que dejaron de avanzar
+                self._retomar()
+                continue
+            self._ejecutar(id_tarea)
+
+    def _reclamar(self, id_tarea: str) -> Optional[Registro]:
+        """La tarea si este proceso la ganó; None si ya terminó o la corre otro worker"""
+        ahora = datetime.now()
+        return self.repositorio.encolar_actualizar_si(
+            id_tarea, {'estado': EN_CURSO, 'trabajador': self.trabajador, 'actualizada': ahora},
+            RECLAMABLE, (PENDIENTE, EN_CURSO, str(ahora - timedelta(seconds=self.plazo)))).result()
+
+    def _guardar(self, tarea: Registro, **cambios) -> Registro:
+        tarea = dict(tarea, actualizada=datetime.now(), **cambios)
+        self.repositorio.reemplazar(tarea['id_tarea'], tarea)
+        return tarea
+
+    def _ejecutar(self, id_tarea: str) -> None:
+        tarea = self._reclamar(id_tarea)
+        if tarea is None:
+            return
+        try:
+            for avance in self._tipos[tarea['tipo']](**tarea['parametros']):
+                progreso = dict(tarea['progreso'])
+                for llave, cantidad in avance.items():
+                    progreso[llave] = progreso.get(llave, 0) + cantidad
+                tarea = self._guardar(tarea, progreso=progreso)
+                time.sleep(self.pausa)
+        except Exception as error:
+            self._guardar(tarea, estado=FALLIDA, error=repr(error))
+        else:
+            self._guardar(tarea, estado=TERMINADA)
@@ -0,0 +1,215 @@
+"""
+Tendencias
+
+Los hashtags y menciones más usados en los tweets de una ventana de
+tiempo (5 minutos, 1 hora o 24 horas), con memoria fija sin importar
+cuántos tweets se publiquen:
+
+- cada ventana se divide en `cubetas` cubetas que avanzan con el reloj
+  (la de 1 hora avanza de 5 en 5 minutos);
+- cada cubeta tiene un resumen Space-Saving con sus `capacidad` términos
+  más frecuentes, que son los candidatos, y un Count-Min Sketch;
+- la ventana suma los Count-Min de sus cubetas vivas y resta el de cada
+  cubeta que expira, así que contar un término en toda la ventana cuesta
+  `profundidad` lecturas.
+
+El ranking se arma con los candidatos de las cubetas vivas y se guarda
+`refresco` segundos, así que responder no depende del número de tweets.
+Los conteos son estimaciones por arriba (Count-Min nunca cuenta de
+menos). Cada tweet cuenta en el momento de su timestamp_pub; al arrancar
+se cuentan los de la ventana más larga. Borrar o editar un tweet no lo
+descuenta: sale de la ventana al expirar su cubeta.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from almacenamiento import Registro
+from busqueda import normalizar
+from operator import itemgetter
+import heapq, re, threading, time, zlib
+
+VENTANAS = {'5m': 300, '1h': 3600, '24h': 86400}
+
+_TERMINO = re.compile(r'(?<!\w)([#@])(\w+)')
+
+
+def extraer(contenido: str) -> List[str]:
+    """Hashtags y menciones del texto, normalizados y sin repetir: '#Canción' → '#cancion'"""
+    return list(dict.fromkeys(signo + palabra for signo, palabra in _TERMINO.findall(normalizar(contenido))))
+
+
+def momento(tweet: Registro, ahora: float) -> float:
+    """timestamp_pub en segundos; los del futuro cuentan ahora"""
+    try:
+        return min(datetime.fromisoformat(str(tweet['timestamp_pub'])).timestamp(), ahora)
+    except (KeyError, ValueError):
+        return ahora
+
+
+class CountMin:
+    """Conteo aproximado de cualquier término en `profundidad` filas de `ancho` celdas"""
+
+    def __init__(self, ancho: int, profundidad: int) -> None:
+        self.ancho = ancho
+        self.profundidad = profundidad
+        self.celdas = [0] * (ancho * profundidad)
+
+    def posiciones(self, termino: str) -> List[int]:
+        # Dos hashes combinados (h1 + i·h2) en lugar de uno por fila
+        datos = termino.encode('utf-8')
+        h1 = zlib.crc32(datos)
+        h2 = zlib.crc32(datos, h1) | 1
+        return [fila * self.ancho + (h1 + fila * h2) % self.ancho for fila in range(self.profundidad)]
+
+    def sumar(self, posiciones: List[int], cantidad: int = 1) -> None:
+        for posicion in posiciones:
+            self.celdas[posicion] += cantidad
+
+    def estimar(self, posiciones: List[int]) -> int:
+        return min(self.celdas[posicion] for posicion in posiciones)
+
+    def restar(self, otro: 'CountMin') -> None:
+        self.celdas = [a - b for a, b in zip(self.celdas, otro.celdas)]
+
+
+class SpaceSaving:
+    """Los `capacidad` términos más frecuentes de un flujo, con conteos por arriba"""
+
+    def __init__(self, capacidad: int) -> None:
+        self.capacidad = capacidad
+        self.conteos: Dict[str, int] = {}
+        # Conteo → términos con ese conteo, para encontrar al menor sin recorrer todo
+        self._grupos: Dict[int, Dict[str, None]] = {}
+        self._minimo = 0
+
+    def agregar(self, termino: str) -> None:
+        conteo = self.conteos.get(termino)
+        if conteo is None and len(self.conteos) < self.capacidad:
+            conteo = 0
+        elif conteo is None:
+            # El nuevo reemplaza a uno de los menores y hereda su conteo
+            menor = next(iter(self._grupos[self._minimo]))
+            conteo = self.conteos.pop(menor)
+            self._quitar(menor, conteo)
+        else:
+            self._quitar(termino, conteo)
+        self.conteos[termino] = conteo + 1
+        self._grupos.setdefault(conteo + 1, {})[termino] = None
+        if conteo == 0:
+            self._minimo = 1
+        elif conteo == self._minimo and conteo not in self._grupos:
+            self._minimo = conteo + 1
+
+    def _quitar(self, termino: str, conteo: int) -> None:
+        grupo = self._grupos[conteo]
+        del grupo[termino]
+        if not grupo:
+            del self._grupos[conteo]
+
+
+class _Cubeta:
+    def __init__(self, numero: int, capacidad: int, ancho: int, profundidad: int) -> None:
+        self.numero = numero
+        self.resumen = SpaceSaving(capacidad)
+        self.sketch = CountMin(ancho, profundidad)
+
+
+class _Ventana:
+    def __init__(self, duracion: float, cubetas: int, capacidad: int, ancho: int, profundidad: int) -> None:
+        self.duracion_cubeta = duracion / cubetas
+        self.capacidad = capacidad
+        self.ancho = ancho
+        self.profundidad = profundidad
+        self.cubetas: List[Optional[_Cubeta]] = [None] * cubetas
+        self.total = CountMin(ancho, profundidad)
+        self.ranking: List[Registro] = []
+        self.calculado: Optional[float] = None
+
+    def _numero(self, instante: float) -> int:
+        return int(instante // self.duracion_cubeta)
+
+    def avanzar(self, ahora: float) -> None:
+        """Expira las cubetas que ya salieron de la ventana"""
+        primera = self._numero(ahora) - len(self.cubetas) + 1
+        for i, cubeta in enumerate(self.cubetas):
+            if cubeta is not None and cubeta.numero < primera:
+                self.total.restar(cubeta.sketch)
+                self.cubetas[i] = None
+
+    def agregar(self, terminos: Dict[str, List[int]], instante: float, ahora: float) -> None:
+        numero = self._numero(instante)
+        if numero <= self._numero(ahora) - len(self.cubetas):
+            return
+        i = numero % len(self.cubetas)
+        cubeta = self.cubetas[i]
+        if cubeta is None or cubeta.numero != numero:
+            if cubeta is not None:
+                self.total.restar(cubeta.sketch)
+            cubeta = self.cubetas[i] = _Cubeta(numero, self.capacidad, self.ancho, self.profundidad)
+        for termino, posiciones in terminos.items():
+            cubeta.resumen.agregar(termino)
+            cubeta.sketch.sumar(posiciones)
+            self.total.sumar(posiciones)
+
+    def calcular(self) -> None:
+        candidatos = set()
+        for cubeta in self.cubetas:
+            if cubeta is not None:
+                candidatos.update(cubeta.resumen.conteos)
+        mejores = heapq.nlargest(self.capacidad, ((self.total.estimar(self.total.posiciones(termino)), termino)
+                                                  for termino in candidatos), key=itemgetter(0))
+        # Los empates, en orden alfabético
+        mejores.sort(key=lambda par: (-par[0], par[1]))
+        self.ranking = [{'termino': termino,
+                         'tipo': 'hashtag' if termino[0] == '#' else 'mencion',
+                         'tweets': tweets}
+                        for tweets, termino in mejores if tweets > 0]
+
+
+class Tendencias:
+    """
+    Top de hashtags y menciones por ventana (ver VENTANAS). La memoria es
+    fija: por ventana, `cubetas` resúmenes de `capacidad` términos y
+    `cubetas` + 1 Count-Min de `ancho` × `profundidad` celdas.
+    """
+
+    def __init__(self, cubetas: int = 12, capacidad: int = 100, ancho: int = 2048,
+                 profundidad: int = 4, refresco: float = 1.0) -> None:
+        self.capacidad = capacidad
+        self.refresco = refresco
+        self._ventanas = {nombre: _Ventana(duracion, cubetas, capacidad, ancho, profundidad)
+                          for nombre, duracion in VENTANAS.items()}
+        self._sketch = CountMin(ancho, profundidad)
+        self._bloqueo = threading.Lock()
+
+    def agregar(self, contenido: str, instante: float, ahora: Optional[float] = None) -> None:
+        terminos = {termino: self._sketch.posiciones(termino) for termino in extraer(contenido)}
+        if not terminos:
+            return
+        ahora = time.time() if ahora is None else ahora
+        with self._bloqueo:
+            for ventana in self._ventanas.values():
+                ventana.agregar(terminos, instante, ahora)
+
+    def cargar(self, tweets: Iterable[Registro]) -> None:
+        """Cuenta tweets ya publicados, p. ej. los de las últimas 24 horas al arrancar"""
+        ahora = time.time()
+        for tweet in tweets:
+            self.agregar(tweet['contenido'], momento(tweet, ahora), ahora)
+
+    def top(self, ventana: str, limite: int) -> List[Registro]:
+        """Hasta `limite` términos de la ventana: {termino, tipo, tweets}, del más usado al menos"""
+        ahora = time.time()
+        with self._bloqueo:
+            seleccionada = self._ventanas[ventana]
+            if seleccionada.calculado is None or ahora - seleccionada.calculado >= self.refresco:
+                seleccionada.avanzar(ahora)
+                seleccionada.calcular()
+                seleccionada.calculado = ahora
+            return seleccionada.ranking[:limite]
+
+    # Suscriptor del repositorio de tweets
+
+    def al_cambiar_tweet(self, anterior: Optional[Registro], nuevo: Optional[Registro]) -> None:
+        if anterior is None and nuevo is not None:
+            ahora = time.time()
+            self.agregar(nuevo['contenido'], momento(nuevo, ahora), ahora)
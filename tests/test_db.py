@@ -0,0 +1,107 @@
+"""
+Pool de conexiones y CRUD de productos
+
+Corre sobre sqlite3 (marcador='?') en una base temporal, como sustituto
+local de MySQL.
+"""
+from db import PoolConexiones, Productos
+import sqlite3, threading, time
+import pytest
+
+
+@pytest.fixture
+def conectar(tmp_path):
+    ruta = str(tmp_path / 'productos.db')
+    conexion = sqlite3.connect(ruta)
+    conexion.execute('CREATE TABLE productos (nombre TEXT, categoria TEXT, uid TEXT PRIMARY KEY, '
+                     'color TEXT, precio REAL)')
+    conexion.close()
+    abiertas = []
+
+    def conectar():
+        conexion = sqlite3.connect(ruta, check_same_thread=False)
+        abiertas.append(conexion)
+        return conexion
+    conectar.abiertas = abiertas
+    return conectar
+
+
+@pytest.fixture
+def productos(conectar):
+    productos = Productos(PoolConexiones(conectar, tamano=2), tamano_lote=3, marcador='?')
+    yield productos
+    productos.pool.cerrar()
+
+
+def test_crud(productos):
+    productos.crear('Lápiz', 'papelería', 'u0', 'rojo', 5.5)
+    assert productos.crear_varios((f'P{i}', 'varios', f'u{i}', 'azul', i) for i in range(1, 8)) == 7
+    assert productos.obtener('u0') == {'nombre': 'Lápiz', 'categoria': 'papelería', 'uid': 'u0',
+                                       'color': 'rojo', 'precio': 5.5}
+    assert len(productos.listar()) == 8
+
+    assert productos.actualizar('u3', color='verde', precio=10)
+    assert productos.obtener('u3')['color'] == 'verde'
+    assert not productos.actualizar('nadie', color='verde')
+    with pytest.raises(ValueError):
+        productos.actualizar('u3', **{'precio = 0; --': 1})
+
+    assert productos.borrar('u3')
+    assert not productos.borrar('u3')
+    assert productos.obtener('u3') is None
+
+
+def test_lote_con_error_se_deshace(productos):
+    # El uid repetido está en el segundo lote: el primero tampoco queda
+    with pytest.raises(sqlite3.IntegrityError):
+        productos.crear_varios([('A', 'c', 'u1', 'x', 1)] * 5)
+    assert productos.listar() == []
+
+
+def test_reutiliza_hasta_tamano(conectar, productos):
+    def trabajar():
+        for i in range(20):
+            productos.obtener(f'u{i}')
+    hilos = [threading.Thread(target=trabajar) for _ in range(8)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert len(conectar.abiertas) <= 2
+
+
+def test_sin_conexiones_libres(conectar):
+    pool = PoolConexiones(conectar, tamano=1, espera=0.1)
+    with pool.conexion():
+        with pytest.raises(TimeoutError):
+            with pool.conexion():
+                pass
+
+
+def test_descartar_despierta_a_quien_espera(conectar):
+    pool = PoolConexiones(conectar, tamano=1, espera=5)
+    tomada = threading.Event()
+    errores = []
+
+    def ocupar():
+        try:
+            with pool.conexion() as conexion:
+                tomada.set()
+                time.sleep(0.2)
+                # Cerrada, el rollback falla y el pool la descarta
+                conexion.close()
+                raise RuntimeError
+        except Exception as error:
+            errores.append(error)
+
+    hilo = threading.Thread(target=ocupar)
+    hilo.start()
+    tomada.wait()
+    inicio = time.monotonic()
+    with pool.conexion() as conexion:
+        conexion.execute('SELECT 1')
+        espera = time.monotonic() - inicio
+    hilo.join()
+    assert espera < 2
+    assert len(conectar.abiertas) == 2
+    assert len(errores) == 1
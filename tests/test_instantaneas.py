@@ -0,0 +1,157 @@
+"""
+Recuperación tras una caída con instantáneas
+
+Cada escenario corre main_tw en procesos nuevos sobre una base temporal:
+uno escribe y muere con SIGKILL (durante las escrituras o a mitad de una
+instantánea) y otro arranca de nuevo y compara lo que cargó en memoria
+con lo que hay en SQLite.
+"""
+from almacenamiento import AlmacenSQLite
+import json, os, signal, subprocess, sys
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TABLAS = ('usuarios', 'tweets', 'seguimientos')
+
+# Ediciones, altas, borrados y seguimientos sin esperar a que se guarde una instantánea
+ESCRIBIR = '''
+import main_tw
+repo = main_tw.repo_tweets
+futuros = []
+for i in range(100):
+    tweet = repo.obtener(f"{i:032d}")
+    futuros.append(repo.encolar_reemplazar(tweet["id_tweet"], dict(tweet, contenido=f"Editado {i}")))
+    futuros.append(repo.encolar_insertar({"id_tweet": f"nuevo{i}", "contenido": "nuevo",
+                                          "timestamp_pub": "2022-03-28 00:00:00", "timestamp_act": None,
+                                          "id_autor": f"{i % 10:032d}"}))
+    futuros.append(repo.encolar_borrar(f"{100 + i:032d}"))
+futuros.append(main_tw.repo_seguimientos.encolar_insertar(
+    {"id_seguimiento": f"{1:032d}:{2:032d}", "seguidor": f"{1:032d}", "seguido": f"{2:032d}"}))
+for futuro in futuros:
+    futuro.result()
+'''
+
+# Muere en la llamada número MORIR a escribir(), con la mitad del archivo temporal escrito
+MORIR_A_MITAD = '''
+import os, signal, sys
+import orjson
+import instantaneas
+llamadas = []
+
+def escribir(ruta, seq, registros):
+    llamadas.append(ruta)
+    if len(llamadas) < int(sys.argv[1]):
+        return original(ruta, seq, registros)
+    cuerpo = orjson.dumps(registros)
+    with open(f"{ruta}.{os.getpid()}.tmp", "wb") as f:
+        f.write(cuerpo[:len(cuerpo) // 2])
+        f.flush()
+    os.kill(os.getpid(), signal.SIGKILL)
+
+original, instantaneas.escribir = instantaneas.escribir, escribir
+''' + ESCRIBIR + '''
+main_tw.instantaneas.guardar()
+'''
+
+MATAR = ESCRIBIR + '''
+import os, signal
+os.kill(os.getpid(), signal.SIGKILL)
+'''
+
+CERRAR = '''
+import main_tw
+main_tw.cerrar_almacen()
+'''
+
+VERIFICAR = '''
+import json
+import main_tw
+repositorios = {"usuarios": main_tw.repo_usuarios, "tweets": main_tw.repo_tweets,
+                "seguimientos": main_tw.repo_seguimientos}
+resultado = {}
+for tabla, repo in repositorios.items():
+    en_sqlite = {r[repo.llave]: r for r in repo.base.listar()}
+    en_memoria = {r[repo.llave]: r for r in repo.listar()}
+    resultado[tabla] = {"iguales": en_sqlite == en_memoria, "registros": len(en_sqlite)}
+orden = [clave for clave, _ in main_tw.repo_tweets.recorrer("orden")]
+resultado["orden"] = orden == sorted(main_tw.clave_tweet(t) for t in main_tw.repo_tweets.base.listar())
+print(json.dumps(resultado))
+'''
+
+
+def sembrar(ruta: str, tweets: int = 500, usuarios: int = 10) -> None:
+    almacen = AlmacenSQLite(ruta)
+    almacen.repositorio('usuarios', 'id_usuario').importar(
+        {'id_usuario': f'{i:032d}', 'email': f'user{i}@example.com', 'nombre': 'string',
+         'apellido': 'string', 'contrasena': ''} for i in range(usuarios))
+    almacen.repositorio('tweets', 'id_tweet').importar(
+        {'id_tweet': f'{i:032d}', 'contenido': f'Tweet sintético número {i}',
+         'timestamp_pub': '2022-03-27 11:46:13.049343', 'timestamp_act': None,
+         'id_autor': f'{i % usuarios:032d}'} for i in range(tweets))
+    almacen.cerrar()
+
+
+def correr(codigo: str, entorno: dict, *argumentos: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, '-c', codigo, *argumentos], env=entorno, cwd=RAIZ,
+                          capture_output=True, text=True, timeout=120)
+
+
+def verificar(entorno: dict) -> dict:
+    proceso = correr(VERIFICAR, entorno)
+    assert proceso.returncode == 0, proceso.stderr
+    return json.loads(proceso.stdout.strip().splitlines()[-1])
+
+
+@pytest.fixture
+def entorno(tmp_path):
+    base = str(tmp_path / 'twitter.db')
+    sembrar(base)
+    entorno = {**os.environ, 'PYTHONPATH': RAIZ, 'TWITTER_DB': base,
+               # Solo se guardan instantáneas cuando el escenario lo pide
+               'TWITTER_INTERVALO_INSTANTANEAS': '3600'}
+    # Instantáneas al día de todas las tablas, como tras apagar el servidor
+    assert correr(CERRAR, entorno).returncode == 0
+    for tabla in TABLAS:
+        assert os.path.exists(f'{base}.instantanea.{tabla}')
+    return entorno
+
+
+def assert_igual_a_sqlite(resultado: dict) -> None:
+    for tabla in TABLAS:
+        assert resultado[tabla]['iguales'], tabla
+    assert resultado['orden']
+
+
+def test_choque_durante_escrituras(entorno):
+    proceso = correr(MATAR, entorno)
+    assert proceso.returncode == -signal.SIGKILL
+    resultado = verificar(entorno)
+    assert_igual_a_sqlite(resultado)
+    assert resultado['tweets']['registros'] == 500
+    assert resultado['seguimientos']['registros'] == 1
+
+
+@pytest.mark.parametrize('morir', [1, 2, 3])
+def test_choque_a_mitad_de_instantanea(entorno, morir):
+    # 1: ningún archivo reemplazado; 2 y 3: unas tablas con la instantánea nueva y otras con la vieja
+    proceso = correr(MORIR_A_MITAD, entorno, str(morir))
+    assert proceso.returncode == -signal.SIGKILL, proceso.stderr
+    assert_igual_a_sqlite(verificar(entorno))
+
+
+def test_instantanea_danada(entorno):
+    assert correr(MATAR, entorno).returncode == -signal.SIGKILL
+    ruta = f'{entorno["TWITTER_DB"]}.instantanea.tweets'
+    with open(ruta, 'r+b') as f:
+        f.seek(-10, os.SEEK_END)
+        f.write(b'\0' * 10)
+    assert_igual_a_sqlite(verificar(entorno))
+
+
+def test_registro_de_cambios_podado(entorno):
+    # Sin el registro de cambios posterior la instantánea no se puede completar: se carga de SQLite
+    assert correr(MATAR, entorno).returncode == -signal.SIGKILL
+    almacen = AlmacenSQLite(entorno['TWITTER_DB'])
+    almacen.podar_cambios(0)
+    almacen.cerrar()
+    assert_igual_a_sqlite(verificar(entorno))
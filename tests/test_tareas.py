@@ -0,0 +1,72 @@
+"""
+Tareas en segundo plano con varios workers
+
+Cada "worker" es un AlmacenSQLite con su propio repositorio compartido
+sobre la misma base, como los procesos de uvicorn --workers.
+"""
+from datetime import datetime, timedelta
+from almacenamiento import AlmacenSQLite
+from indices import RepositorioIndexado
+from tareas import EN_CURSO, PENDIENTE, TERMINADA, Tareas
+import collections, threading, time
+import pytest
+
+
+@pytest.fixture
+def base(tmp_path):
+    return str(tmp_path / 'tareas.db')
+
+
+def trabajador(base: str, corridas: collections.Counter, plazo: float = 0) -> Tareas:
+    almacen = AlmacenSQLite(base, registrar_cambios=True)
+    repositorio = RepositorioIndexado(almacen.repositorio('tareas', 'id_tarea'), compartido=True)
+    tareas = Tareas(repositorio, pausa=0, plazo=plazo)
+    bloqueo = threading.Lock()
+
+    def contar(numero):
+        with bloqueo:
+            corridas[numero] += 1
+        yield {'bloques': 1}
+    tareas.registrar('contar', contar)
+    return tareas
+
+
+def esperar_terminadas(tareas: Tareas, cuantas: int) -> None:
+    limite = time.monotonic() + 10
+    while time.monotonic() < limite:
+        tareas.repositorio.recargar(t['id_tarea'] for t in tareas.repositorio.base.listar())
+        if sum(t['estado'] == TERMINADA for t in tareas.repositorio.listar()) == cuantas:
+            return
+        time.sleep(0.05)
+    raise AssertionError('Las tareas no terminaron')
+
+
+def test_cada_tarea_corre_en_un_solo_worker(base):
+    corridas = collections.Counter()
+    primero = trabajador(base, corridas, plazo=60)
+    for numero in range(50):
+        primero.repositorio.insertar({'id_tarea': f'{numero:04d}', 'tipo': 'contar', 'parametros': {'numero': numero},
+                                      'estado': PENDIENTE, 'progreso': {}, 'creada': datetime.now(),
+                                      'actualizada': datetime.now(), 'error': None})
+    # Todos arrancan con las mismas 50 pendientes
+    trabajadores = [primero] + [trabajador(base, corridas, plazo=60) for _ in range(3)]
+    for tareas in trabajadores:
+        tareas.iniciar()
+    esperar_terminadas(primero, 50)
+    assert corridas == {numero: 1 for numero in range(50)}
+
+
+def test_retoma_la_tarea_de_un_worker_que_murio(base):
+    corridas = collections.Counter()
+    muerto = trabajador(base, corridas, plazo=0.2)
+    hace_rato = datetime.now() - timedelta(seconds=1)
+    # En curso en un worker que ya no avanza, y otra que un worker vivo acaba de tomar
+    for id_tarea, actualizada in (('muerta', hace_rato), ('viva', datetime.now() + timedelta(hours=1))):
+        muerto.repositorio.insertar({'id_tarea': id_tarea, 'tipo': 'contar', 'parametros': {'numero': id_tarea},
+                                     'estado': EN_CURSO, 'progreso': {}, 'creada': hace_rato,
+                                     'actualizada': actualizada, 'error': None})
+    vivo = trabajador(base, corridas, plazo=0.2)
+    vivo.iniciar()
+    esperar_terminadas(vivo, 1)
+    assert corridas == {'muerta': 1}
+    assert vivo.obtener('viva')['estado'] == EN_CURSO
@@ -0,0 +1,38 @@
+"""
+Timelines cuando un autor cruza el umbral de famoso
+"""
+from timeline import Timelines
+import pytest
+
+
+def seguimiento(seguidor: str, seguido: str = 'A') -> dict:
+    return {'seguidor': seguidor, 'seguido': seguido}
+
+
+def tweet(id_tweet: str, timestamp: str, autor: str = 'A') -> dict:
+    return {'id_tweet': id_tweet, 'timestamp_pub': timestamp, 'id_autor': autor}
+
+
+@pytest.fixture
+def timelines():
+    # Con más de 1 seguidor el autor es famoso: sus tweets se mezclan al leer
+    return Timelines(lambda t: (t['timestamp_pub'], t['id_tweet']), lambda t: t['id_autor'], umbral_famoso=1)
+
+
+def test_deja_de_ser_famoso(timelines):
+    timelines.al_cambiar_seguimiento(None, seguimiento('f1'))
+    timelines.al_cambiar_seguimiento(None, seguimiento('f2'))
+    assert timelines.timeline('f1', 10) == []
+    timelines.al_cambiar_tweet(None, tweet('t1', '1'))
+    timelines.al_cambiar_seguimiento(seguimiento('f2'), None)
+    assert timelines.timeline('f1', 10) == [('1', 't1')]
+
+
+def test_se_vuelve_famoso(timelines):
+    timelines.al_cambiar_seguimiento(None, seguimiento('f1'))
+    timelines.al_cambiar_tweet(None, tweet('t1', '1'))
+    assert timelines.timeline('f1', 10) == [('1', 't1')]
+    timelines.al_cambiar_seguimiento(None, seguimiento('f2'))
+    timelines.al_cambiar_tweet(None, tweet('t2', '2'))
+    assert timelines.timeline('f1', 10) == [('2', 't2'), ('1', 't1')]
+    assert timelines.timeline('f2', 10) == [('2', 't2'), ('1', 't1')]
@@ -0,0 +1,27 @@
+"""
+Order validation (validation.py)
+"""
+from fastapi.testclient import TestClient
+import validation
+import pytest
+
+ORDER = {'person': {'name': 'Customer', 'email': 'customer@example.com', 'phone': '+541112345678'},
+         'product': {'name': 'Laptop'},
+         'address': {'street': 'Main street', 'city': 'Buenos Aires', 'country': 'AR'},
+         'payment_method': {'card_number': '4242424242424242', 'expiration_month': 12, 'expiration_year': 2030}}
+
+
+@pytest.fixture
+def client():
+    return TestClient(validation.app)
+
+
+@pytest.mark.parametrize('year', [0, 10000])
+def test_batch_rejects_out_of_range_expiration_year(client, year):
+    invalid = dict(ORDER, payment_method=dict(ORDER['payment_method'], expiration_year=year))
+    response = client.post('/orders/batch', json=[ORDER, invalid])
+    assert response.status_code == 200
+    body = response.json()
+    assert [order['index'] for order in body['accepted']] == [0]
+    assert [order['index'] for order in body['rejected']] == [1]
+    assert body['rejected'][0]['errors'][0]['loc'] == ['payment_method', 'expiration_year']
@@ -0,0 +1,141 @@
+"""
+Timelines
+
+Grafo de seguidores y timelines materializados por usuario. Cuando se
+publica un tweet se copia su clave a los timelines de los seguidores
+(fan-out al escribir), salvo que el autor tenga demasiados seguidores:
+en ese caso sus tweets se mezclan al leer (fan-out al leer).
+
+Todo está acotado: cada timeline guarda a lo más `tamano` claves y solo
+se mantienen materializados los `max_materializados` usuarios más
+recientes; los demás se reconstruyen al leer.
+"""
+from collections import OrderedDict, defaultdict, deque
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+from almacenamiento import Registro
+import bisect, heapq, threading
+
+Clave = Tuple[str, str]  # (timestamp_pub, id_tweet)
+
+
+def agregar_acotado(claves: Deque[Clave], clave: Clave) -> None:
+    """Inserta en orden en un deque con maxlen, descartando la clave más antigua"""
+    if not claves or clave >= claves[-1]:
+        claves.append(clave)
+        return
+    if len(claves) == claves.maxlen:
+        if clave < claves[0]:
+            return
+        claves.popleft()
+    claves.insert(bisect.bisect_right(claves, clave), clave)
+
+
+class Timelines:
+    """Seguidores, tweets recientes por autor y timelines materializados"""
+
+    def __init__(self, clave: Callable[[Registro], Clave], autor: Callable[[Registro], str],
+                 tamano: int = 800, umbral_famoso: int = 10000, max_materializados: int = 100000) -> None:
+        self.clave = clave
+        self.autor = autor
+        self.tamano = tamano
+        self.umbral_famoso = umbral_famoso
+        self.max_materializados = max_materializados
+        self.seguidores: Dict[str, Set[str]] = defaultdict(set)
+        self.seguidos: Dict[str, Set[str]] = defaultdict(set)
+        self._recientes: Dict[str, Deque[Clave]] = defaultdict(self._nuevo_deque)
+        self._materializados: 'OrderedDict[str, Deque[Clave]]' = OrderedDict()
+        self._bloqueo = threading.RLock()
+
+    def _nuevo_deque(self) -> Deque[Clave]:
+        return deque(maxlen=self.tamano)
+
+    def seguimientos_de(self, id_usuario: str) -> List[Tuple[str, str]]:
+        """(seguidor, seguido) de todas las relaciones en las que participa un usuario"""
+        with self._bloqueo:
+            return ([(id_usuario, seguido) for seguido in self.seguidos.get(id_usuario, ())] +
+                    [(seguidor, id_usuario) for seguidor in self.seguidores.get(id_usuario, ())])
+
+    def es_famoso(self, id_usuario: str) -> bool:
+        return len(self.seguidores.get(id_usuario, ())) > self.umbral_famoso
+
+    def cargar(self, seguimientos: Iterable[Registro], tweets: Iterable[Registro]) -> None:
+        for seguimiento in seguimientos:
+            self.al_cambiar_seguimiento(None, seguimiento)
+        for tweet in tweets:
+            agregar_acotado(self._recientes[self.autor(tweet)], self.clave(tweet))
+
+    # Suscriptores de los repositorios
+
+    def al_cambiar_seguimiento(self, anterior: Optional[Registro], nuevo: Optional[Registro]) -> None:
+        with self._bloqueo:
+            seguidos = {r['seguido'] for r in (anterior, nuevo) if r is not None}
+            famosos = {seguido: self.es_famoso(seguido) for seguido in seguidos}
+            if anterior is not None:
+                self.seguidores[anterior['seguido']].discard(anterior['seguidor'])
+                self.seguidos[anterior['seguidor']].discard(anterior['seguido'])
+                self._materializados.pop(anterior['seguidor'], None)
+            if nuevo is not None:
+                self.seguidores[nuevo['seguido']].add(nuevo['seguidor'])
+                self.seguidos[nuevo['seguidor']].add(nuevo['seguido'])
+                self._materializados.pop(nuevo['seguidor'], None)
+            # Si el seguido cruza el umbral, sus tweets pasan de copiarse a los
+            # timelines a mezclarse al leer (o al revés): los ya armados no los tienen
+            for seguido, famoso in famosos.items():
+                if self.es_famoso(seguido) != famoso:
+                    for seguidor in self.seguidores.get(seguido, ()):
+                        self._materializados.pop(seguidor, None)
+
+    def al_cambiar_tweet(self, anterior: Optional[Registro], nuevo: Optional[Registro]) -> None:
+        with self._bloqueo:
+            if anterior is not None and (nuevo is None or self.clave(anterior) != self.clave(nuevo)):
+                recientes = self._recientes.get(self.autor(anterior))
+                if recientes is not None and self.clave(anterior) in recientes:
+                    recientes.remove(self.clave(anterior))
+            if nuevo is None or (anterior is not None and self.clave(anterior) == self.clave(nuevo)):
+                return
+
+            autor, clave = self.autor(nuevo), self.clave(nuevo)
+            agregar_acotado(self._recientes[autor], clave)
+            if self.es_famoso(autor):
+                return
+            for id_usuario in self.seguidores.get(autor, set()) | {autor}:
+                materializado = self._materializados.get(id_usuario)
+                if materializado is not None:
+                    agregar_acotado(materializado, clave)
+
+    # Lectura
+
+    def _materializar(self, id_usuario: str) -> Deque[Clave]:
+        materializado = self._materializados.get(id_usuario)
+        if materializado is None:
+            autores = [a for a in self.seguidos.get(id_usuario, set()) | {id_usuario}
+                       if not self.es_famoso(a) and a in self._recientes]
+            ultimas = heapq.nlargest(self.tamano, heapq.merge(*(self._recientes[a] for a in autores)))
+            materializado = self._nuevo_deque()
+            materializado.extend(reversed(ultimas))
+            self._materializados[id_usuario] = materializado
+            if len(self._materializados) > self.max_materializados:
+                self._materializados.popitem(last=False)
+        else:
+            self._materializados.move_to_end(id_usuario)
+        return materializado
+
+    def timeline(self, id_usuario: str, limite: int, antes: Optional[Clave] = None,
+                 existe: Callable[[str], bool] = lambda id_tweet: True) -> List[Clave]:
+        """Claves del timeline de un usuario, de la más nueva a la más antigua"""
+        with self._bloqueo:
+            fuentes = [list(self._materializar(id_usuario))]
+            fuentes.extend(list(self._recientes[a]) for a in self.seguidos.get(id_usuario, set()) | {id_usuario}
+                           if self.es_famoso(a) and a in self._recientes)
+
+        claves, vistos = [], set()
+        for clave in heapq.merge(*(reversed(f) for f in fuentes), reverse=True):
+            if antes is not None and clave >= antes:
+                continue
+            if clave[-1] in vistos or not existe(clave[-1]):
+                continue
+            vistos.add(clave[-1])
+            claves.append(clave)
+            if len(claves) == limite:
+                break
+        return claves
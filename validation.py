@@ -1,24 +1,35 @@
 import re
 from datetime import date
+from functools import lru_cache
 from typing import Dict
 from typing import Any
+from typing import List
+
+# Email validator
+import email_validator
 
 # Pydantic
 from pydantic import BaseModel
 from pydantic import Field
 from pydantic import EmailStr
 from pydantic import PaymentCardNumber
+from pydantic import ValidationError
+from pydantic import errors
 from pydantic.validators import str_validator
 from pydantic.types import PaymentCardBrand
 
 # Fast API
 from fastapi import FastAPI
 from fastapi import Body
+from fastapi import HTTPException
+from fastapi import status
+from fastapi.responses import JSONResponse
 
 
 app = FastAPI()
 
 PHONE_REGEXP = re.compile(r'^\+?[0-9]{1,3}?[0-9]{6,14}$')
+MAX_BATCH_SIZE = 10_000
 
 # Custom Types
 
@@ -55,6 +66,41 @@ class PhoneNumber(str):
         return f'PhoneNumber({super().__repr__()})'
 
 
+@lru_cache(maxsize=10_000)
+def valid_email_domain(domain: str) -> bool:
+    """Syntax and IDNA check of an email domain, cached; never touches DNS"""
+    try:
+        email_validator.validate_email_domain_part(domain)
+    except email_validator.EmailNotValidError:
+        return False
+    return True
+
+
+class CachedEmailStr(EmailStr):
+    """
+    Same result as EmailStr, but the domain check is cached, since most
+    orders share a handful of domains. Addresses with a display name
+    ('John <john@example.com>') go through the regular EmailStr path.
+    """
+
+    @classmethod
+    def validate(cls, value: str) -> str:
+        # EmailStr strips surrounding whitespace before splitting the address
+        local_part, at, domain = value.strip().rpartition('@')
+        if not at or '<' in value or len(value) > 254:
+            return EmailStr.validate(value)
+
+        if not valid_email_domain(domain):
+            raise errors.EmailError()
+        try:
+            email_validator.validate_email_local_part(local_part)
+        except email_validator.EmailNotValidError:
+            raise errors.EmailError()
+
+        # Like EmailStr: the local part is case-sensitive, the domain is not
+        return f'{local_part}@{domain.lower()}'
+
+
 # Models
 
 
@@ -66,7 +112,7 @@ class Person(BaseModel):
                       description='The name of the person that will receive the package.',
                       example='John Doe')
 
-    email: EmailStr = Field(...,
+    email: CachedEmailStr = Field(...,
                             title='Email',
                             description='The email of the person that will receive the package.')
 
@@ -103,7 +149,10 @@ class  PaymentMethod(BaseModel):
 
     expiration_year: int = Field(...,
                                  title='Expiration year',
-                                 description='The expiration year of the payment card.')
+                                 description='The expiration year of the payment card.',
+                                 ge=1,
+                                 le=9999,
+                                 example=2030)
 
     @property
     def brand(self) -> PaymentCardBrand:
@@ -114,13 +163,27 @@ class  PaymentMethod(BaseModel):
     def expired(self) -> bool:
         """Returns if the payment card is expired"""
 
-        today = date.today()
+        return self.expired_on(date.today())
+
+    def expired_on(self, today: date) -> bool:
+        """Returns if the payment card is expired at the given date"""
+
         expiration_date = date(year=self.expiration_year,
                                month=self.expiration_month,
                                day=1)
 
         return today > expiration_date
 
+    def summary(self, today: date) -> Dict[str, Any]:
+        """Returns the card data that is safe to send back"""
+
+        return {
+            'brand': self.brand,
+            'last4': self.card_number.last4,
+            'mask': self.card_number.masked,
+            'expired': self.expired_on(today),
+        }
+
 
 class Address(BaseModel):
     """Address model"""
@@ -143,6 +206,15 @@ class Address(BaseModel):
                          title='Country',
                          description='The country of the address.')
 
+
+class Order(BaseModel):
+    """Order model, the same fields that /order receives"""
+
+    person: Person
+    product: Product
+    address: Address
+    payment_method: PaymentMethod
+
 # Endpoints
 
 @app.post('/order')
@@ -158,10 +230,41 @@ def add_order(
         'person': person,
         'product': product,
         'address': address,
-        'payment_method': {
-            'brand': payment_method.brand,
-            'last4': payment_method.card_number.last4,
-            'mask': payment_method.card_number.masked,
-            'expired': payment_method.expired,
-        }
+        'payment_method': payment_method.summary(date.today()),
     }
+
+
+@app.post('/orders/batch')
+def add_orders(orders: List[Dict[str, Any]] = Body(...,)):
+    """
+    Registers many orders at once
+
+    Each element has the same fields as the /order body. Every order is
+    validated on its own; invalid ones are reported by index and do not
+    reject the rest of the batch.
+    """
+
+    if len(orders) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f'At most {MAX_BATCH_SIZE} orders per batch')
+
+    today = date.today()
+    accepted, rejected = [], []
+    for index, data in enumerate(orders):
+        try:
+            order = Order.parse_obj(data)
+        except ValidationError as error:
+            rejected.append({'index': index, 'errors': error.errors()})
+            continue
+
+        accepted.append({
+            'index': index,
+            'person': order.person.dict(),
+            'product': order.product.dict(),
+            'address': order.address.dict(),
+            'payment_method': dict(order.payment_method.summary(today),
+                                   brand=order.payment_method.brand.value),
+        })
+
+    # Everything is already plain JSON; skip FastAPI's jsonable_encoder pass
+    return JSONResponse({'accepted': accepted, 'rejected': rejected})